@@ -0,0 +1,309 @@
+import argparse
+import mmap
+import struct
+import sys
+from array import array
+
+import instrument
+from output_file import write_lines, write_output_lines
+from tac import Code, render
+from token_store import TokenStore, TYPE_NAMES
+
+# 编译结果的二进制格式，所有数都是小端序：
+#   文件头  MAGIC、版本号、各段的 (字节偏移, 个数)
+#   NAMES      单词类型名，UTF-8，以换行分隔（个数为字节数）
+#   SYMBOLS    符号表，每项 16 字节：类型、字符串长度、8 字节内容（整数、浮点数或字符串在 STRINGS 中的偏移）
+#   STRINGS    标识符等字符串，UTF-8（个数为字节数）
+#   TOKENS     每个单词 3 个 int32：类型编码、符号编号、源程序位置
+#   CODE       三地址代码，每条 5 个 int32：操作码、目的、源1、源2、标签，操作数编码见 tac 模块
+#   PROCESSED  处理过的代码，格式同 CODE
+#   STATEMENTS 每条顶层语句 2 个 int32：第一个单词的下标、CODE 中第一条指令的下标
+# 记录都是定长的，读取时用 mmap 映射整个文件，每段直接转换成 int32 的 memoryview，不复制
+MAGIC = b'TACART\r\n'
+VERSION = 1
+SECTIONS = ['names', 'symbols', 'strings', 'tokens', 'code', 'processed', 'statements']
+HEADER = struct.Struct('<8sII' + 'QQ' * len(SECTIONS))
+SYMBOL = struct.Struct('<BxxxI8s')
+# 每段的记录宽度（int32 个数）
+WIDTHS = {'tokens': 3, 'code': 5, 'processed': 5, 'statements': 2}
+# 各段从 8 字节边界开始
+ALIGNMENT = 8
+
+# 符号类型；超出 int64 的整数（常量折叠可能产生）按十进制字符串存放
+SYMBOL_STR, SYMBOL_INT, SYMBOL_FLOAT, SYMBOL_BIGINT = range(4)
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+class ArtifactError(ValueError):
+    pass
+
+
+def interleave(columns):
+    # 把若干列交错成一条条记录，整列赋值，不逐条打包
+    width = len(columns)
+    records = array('i', bytes(4 * width * len(columns[0])))
+    for index, column in enumerate(columns):
+        records[index::width] = column if column.typecode == 'i' else array('i', column)
+    if sys.byteorder == 'big':
+        records.byteswap()
+    return records
+
+
+def pack_symbols(symbol_values):
+    records = bytearray(SYMBOL.size * len(symbol_values))
+    strings = bytearray()
+    for index, value in enumerate(symbol_values):
+        if isinstance(value, float):
+            record = (SYMBOL_FLOAT, 0, struct.pack('<d', value))
+        elif isinstance(value, int) and INT64_MIN <= value <= INT64_MAX:
+            record = (SYMBOL_INT, 0, struct.pack('<q', value))
+        else:
+            kind = SYMBOL_STR if isinstance(value, str) else SYMBOL_BIGINT
+            data = str(value).encode('utf-8')
+            record = (kind, len(data), struct.pack('<Q', len(strings)))
+            strings += data
+        SYMBOL.pack_into(records, index * SYMBOL.size, *record)
+    return records, strings
+
+
+def code_records(code):
+    return interleave([code.ops, code.dst, code.src1, code.src2, code.labels])
+
+
+def write_artifact(path, tokens, code, processed_code):
+    # 处理过的代码的符号表包含单词和原始代码的符号表（优化时可能追加常数），编号一致
+    symbol_values = max(tokens.symbol_values, code.symbol_values, processed_code.symbol_values, key=len)
+    symbols, strings = pack_symbols(symbol_values)
+    sections = {
+        'names': '\n'.join(TYPE_NAMES).encode('utf-8'),
+        'symbols': symbols,
+        'strings': strings,
+        'tokens': interleave([tokens.kinds, tokens.symbols, tokens.positions]),
+        'code': code_records(code),
+        'processed': code_records(processed_code),
+        'statements': interleave([code.statement_tokens, code.statement_starts]),
+    }
+    counts = {'names': len(sections['names']), 'symbols': len(symbol_values), 'strings': len(strings),
+              'tokens': len(tokens), 'code': len(code), 'processed': len(processed_code),
+              'statements': len(code.statement_starts)}
+
+    layout = []
+    offset = HEADER.size
+    for name in SECTIONS:
+        offset += -offset % ALIGNMENT
+        layout += [offset, counts[name]]
+        offset += len(sections[name]) * (4 if isinstance(sections[name], array) else 1)
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(SECTIONS), *layout))
+        for index, name in enumerate(SECTIONS):
+            file.write(bytes(layout[2 * index] - file.tell()))
+            file.write(sections[name])
+    instrument.count('artifact_bytes', offset)
+
+
+# 只读地打开一个编译结果文件。tokens/code/processed/statements 是按记录访问的视图，
+# 数据留在映射的文件里，用到哪一页才读哪一页
+class Artifact:
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            try:
+                self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ArtifactError(f"{path}: empty file") from None
+        self.buffer = memoryview(self.mmap)
+        try:
+            self.read_header(path)
+        except Exception:
+            self.close()
+            raise
+
+    def read_header(self, path):
+        if len(self.buffer) < HEADER.size:
+            raise ArtifactError(f"{path}: truncated header")
+        magic, version, section_count, *layout = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC:
+            raise ArtifactError(f"{path}: not a compile artifact")
+        if version != VERSION or section_count != len(SECTIONS):
+            raise ArtifactError(f"{path}: unsupported artifact version {version}")
+        if sys.byteorder == 'big':
+            raise ArtifactError("reading artifacts in place requires a little-endian machine")
+
+        self.views = {}
+        self.counts = {}
+        for index, name in enumerate(SECTIONS):
+            offset, count = layout[2 * index], layout[2 * index + 1]
+            self.counts[name] = count
+            width = WIDTHS.get(name)
+            size = count * (4 * width if width else SYMBOL.size if name == 'symbols' else 1)
+            if offset + size > len(self.buffer):
+                raise ArtifactError(f"{path}: section {name} is truncated")
+            view = self.buffer[offset:offset + size]
+            self.views[name] = Records(view.cast('i'), width) if width else view
+        self.type_names = bytes(self.views['names']).decode('utf-8').split('\n')
+        self.symbol_values = self.read_symbols()
+        self.tokens = self.views['tokens']
+        self.code = self.views['code']
+        self.processed = self.views['processed']
+        self.statements = self.views['statements']
+
+    def read_symbols(self):
+        # 符号表通常远小于单词和代码，打开时一次解码
+        records = self.views['symbols']
+        strings = self.views['strings']
+        values = []
+        for kind, length, data in SYMBOL.iter_unpack(records):
+            if kind == SYMBOL_INT:
+                values.append(struct.unpack('<q', data)[0])
+            elif kind == SYMBOL_FLOAT:
+                values.append(struct.unpack('<d', data)[0])
+            else:
+                start = struct.unpack('<Q', data)[0]
+                text = str(strings[start:start + length], 'utf-8')
+                values.append(text if kind == SYMBOL_STR else int(text))
+        return values
+
+    def close(self):
+        # 视图都释放以后才能关闭映射
+        for view in getattr(self, 'views', {}).values():
+            view.release()
+        self.buffer.release()
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def token(self, index):
+        kind, symbol, _ = self.tokens[index]
+        return self.type_names[kind], self.symbol_values[symbol]
+
+    def iter_tokens(self, start=0, stop=None):
+        type_names = self.type_names
+        symbol_values = self.symbol_values
+        for kind, symbol, _ in self.tokens.iter(start, stop):
+            yield type_names[kind], symbol_values[symbol]
+
+    def statement(self, index):
+        # 第 index 条顶层语句的 (单词下标范围, CODE 中的指令下标范围)
+        first_token, first_instruction = self.statements[index]
+        if index + 1 < len(self.statements):
+            end_token, end_instruction = self.statements[index + 1]
+        else:
+            end_token, end_instruction = len(self.tokens), len(self.code)
+        return range(first_token, end_token), range(first_instruction, end_instruction)
+
+    def lines(self, records, indent='', start=0, stop=None):
+        symbol_values = self.symbol_values
+        for instruction in records.iter(start, stop):
+            yield render(instruction, symbol_values, indent)
+
+    def token_store(self):
+        # 复制成可修改的 TokenStore
+        tokens = TokenStore(list(self.symbol_values))
+        tokens.symbol_ids = {(type(value), value): symbol for symbol, value in enumerate(tokens.symbol_values)}
+        tokens.kinds = array('B', self.tokens.column(0))
+        tokens.symbols = array('i', self.tokens.column(1))
+        tokens.positions = array('i', self.tokens.column(2))
+        return tokens
+
+    def to_code(self, records):
+        # 复制成 Code，例如交给解释器执行 artifact.to_code(artifact.processed)
+        code = Code(list(self.symbol_values))
+        code.symbol_ids = {(type(value), value): symbol for symbol, value in enumerate(code.symbol_values)}
+        code.ops = array('B', records.column(0))
+        code.dst, code.src1, code.src2, code.labels = (array('i', records.column(i)) for i in range(1, 5))
+        if records is self.code:
+            code.statement_tokens = array('i', self.statements.column(0))
+            code.statement_starts = array('i', self.statements.column(1))
+        return code
+
+    def render(self, path='output.txt'):
+        # 按 output.txt 的原格式输出
+        write_output_lines(TokenLines(self), self.lines(self.code), self.lines(self.processed, '\t'), path)
+
+
+# 一段定长记录的视图：flat 是 int32 的 memoryview，每 width 个数一条记录
+class Records:
+    def __init__(self, flat, width):
+        self.flat = flat
+        self.width = width
+
+    def __len__(self):
+        return len(self.flat) // self.width
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        width = self.width
+        return tuple(self.flat[index * width:(index + 1) * width])
+
+    def iter(self, start=0, stop=None):
+        width = self.width
+        flat = self.flat if stop is None and not start else self.flat[start * width:
+                                                                        None if stop is None else stop * width]
+        return zip(*[iter(flat)] * width)
+
+    def __iter__(self):
+        return self.iter()
+
+    def column(self, index):
+        # 带步长的视图，不复制
+        return self.flat[index::self.width]
+
+    def release(self):
+        self.flat.release()
+
+
+# write_output_lines 只需要单词序列的长度和迭代
+class TokenLines:
+    def __init__(self, artifact):
+        self.artifact = artifact
+
+    def __len__(self):
+        return len(self.artifact.tokens)
+
+    def __iter__(self):
+        return self.artifact.iter_tokens()
+
+
+def write_statement(artifact, index, file):
+    token_range, code_range = artifact.statement(index)
+    file.write(f"Statement {index}: tokens {token_range.start}-{token_range.stop}, "
+               f"instructions {code_range.start}-{code_range.stop}\n")
+    write_lines(file, (f"{token}" for token in artifact.iter_tokens(token_range.start, token_range.stop)))
+    write_lines(file, artifact.lines(artifact.code, '', code_range.start, code_range.stop))
+
+
+def main_artifact():
+    arg_parser = argparse.ArgumentParser(description="Render a binary compile artifact written by main.py --artifact.")
+    arg_parser.add_argument('artifact')
+    arg_parser.add_argument('-o', '--output', default='output.txt', help="write the text output here")
+    arg_parser.add_argument('--statement', type=int, nargs='+', metavar='N',
+                            help="print the tokens and code of these top-level statements instead")
+    arg_parser.add_argument('--info', action='store_true', help="print the section sizes instead")
+    args = arg_parser.parse_args()
+
+    try:
+        artifact = Artifact(args.artifact)
+    except (OSError, ArtifactError) as error:
+        print(error, file=sys.stderr)
+        return 1
+    with artifact:
+        if args.info:
+            for name in SECTIONS:
+                print(f"{name}: {artifact.counts[name]}")
+        elif args.statement:
+            for index in args.statement:
+                if not 0 <= index < len(artifact.statements):
+                    print(f"no statement {index}; the artifact has {len(artifact.statements)}", file=sys.stderr)
+                    return 1
+                write_statement(artifact, index, sys.stdout)
+        else:
+            artifact.render(args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main_artifact())
@@ -0,0 +1,123 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import compile_cache
+import main
+import optimize
+import scanner
+
+OUTPUT_DIR = 'batch_output'
+SOURCE_SUFFIX = '.txt'
+OUTPUT_SUFFIX = '.out.txt'
+
+# 每个工作进程各自持有一个缓存对象
+_cache = None
+
+
+def init_worker(cache_dir, cache_size):
+    global _cache
+    if cache_dir is not None:
+        _cache = compile_cache.CompileCache(cache_dir, cache_size)
+
+
+def collect_sources(paths):
+    # 目录按文件名排序展开，只取源程序文件
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith(SOURCE_SUFFIX) and not name.endswith(OUTPUT_SUFFIX):
+                        sources.append(os.path.join(root, name))
+        else:
+            sources.append(path)
+    return sources
+
+
+def output_path_for(source_path, base_dir, output_dir):
+    relative = os.path.relpath(source_path, base_dir)
+    return os.path.join(output_dir, os.path.splitext(relative)[0] + OUTPUT_SUFFIX)
+
+
+def compile_file(source_path, output_path, opt_level=0):
+    # 在工作进程中编译一个文件；出错只记录在结果里，不影响其他文件
+    start = time.perf_counter()
+    result = {'source': source_path, 'output': output_path, 'ok': False, 'error': None,
+              'bytes': 0, 'tokens': 0, 'instructions': 0}
+    try:
+        with open(source_path, 'rb') as file:
+            source = file.read()
+        result['bytes'] = len(source)
+        tokens, code, processed_code = main.compile_source(source, _cache, opt_level=opt_level)
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        main.write_output(tokens, code, processed_code, output_path)
+        result['tokens'] = len(tokens)
+        result['instructions'] = len(code)
+        result['ok'] = True
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def run_batch(paths, output_dir=OUTPUT_DIR, workers=None, cache_dir=None, cache_size=compile_cache.MAX_BYTES,
+              opt_level=0):
+    sources = collect_sources(paths)
+    if not sources:
+        return [], 0.0
+    base_dir = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in sources])
+
+    # 共享库只在主进程里编译一次，避免工作进程同时调用 gcc
+    scanner.build_library()
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=init_worker,
+                             initargs=(cache_dir, cache_size)) as executor:
+        futures = [executor.submit(compile_file, path,
+                                   output_path_for(os.path.abspath(path), base_dir, output_dir), opt_level)
+                   for path in sources]
+        results = [future.result() for future in futures]
+    return results, time.perf_counter() - start
+
+
+def print_summary(results, elapsed):
+    succeeded = [r for r in results if r['ok']]
+    failed = [r for r in results if not r['ok']]
+    total_bytes = sum(r['bytes'] for r in results)
+    total_tokens = sum(r['tokens'] for r in succeeded)
+    total_instructions = sum(r['instructions'] for r in succeeded)
+
+    def rate(n):
+        return n / elapsed if elapsed > 0 else 0.0
+
+    print(f"Files: {len(results)}  succeeded: {len(succeeded)}  failed: {len(failed)}")
+    print(f"Elapsed: {elapsed:.3f}s  files/s: {rate(len(results)):.1f}  "
+          f"KB/s: {rate(total_bytes) / 1024:.1f}  tokens/s: {rate(total_tokens):.0f}  "
+          f"instructions/s: {rate(total_instructions):.0f}")
+    for r in failed:
+        print(f"FAILED {r['source']}: {r['error']}")
+
+
+def main_batch():
+    arg_parser = argparse.ArgumentParser(description="Compile many source files in parallel.")
+    arg_parser.add_argument('paths', nargs='+', help="source files or directories")
+    arg_parser.add_argument('-o', '--output-dir', default=OUTPUT_DIR)
+    arg_parser.add_argument('-j', '--jobs', type=int, default=None, help="worker processes (default: CPU count)")
+    arg_parser.add_argument('--no-cache', action='store_true', help="disable the on-disk compile cache")
+    arg_parser.add_argument('--cache-dir', default=compile_cache.CACHE_DIR)
+    arg_parser.add_argument('--cache-size', type=int, default=compile_cache.MAX_BYTES, help="cache size limit in bytes")
+    arg_parser.add_argument('-O', dest='opt_level', type=int, choices=sorted(optimize.LEVELS), default=0,
+                            help="optimization level")
+    args = arg_parser.parse_args()
+
+    cache_dir = None if args.no_cache else args.cache_dir
+    results, elapsed = run_batch(args.paths, args.output_dir, args.jobs, cache_dir, args.cache_size, args.opt_level)
+    print_summary(results, elapsed)
+    return 1 if any(not r['ok'] for r in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main_batch())
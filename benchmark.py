@@ -0,0 +1,298 @@
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import instrument
+import main
+import optimize
+
+RESULTS_FILE = 'benchmark_results.json'
+BASELINE_FILE = 'benchmark_baseline.json'
+DEFAULT_SIZES = ['1K', '10K', '100K', '1M', '10M']
+# 吞吐量低于基线的这个比例、或峰值内存高于基线的这个比例时算作退化
+DEFAULT_THRESHOLD = 0.25
+# 基线中短于这个时间的阶段计时误差太大，不比较吞吐量
+MIN_COMPARE_SECONDS = 0.01
+SIZE_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+# 输入是三地址代码的阶段；扫描、词法和语法分析阶段的每秒指令数没有意义
+INSTRUCTION_PHASES = {'optimize', 'process', 'recycle', 'stream'}
+
+# 不与关键字冲突的标识符
+NAMES = [chr(c) for c in range(ord('a'), ord('z') + 1)] + [f'v{i}' for i in range(20)]
+OPERATORS = '+-*/'
+COMPARISONS = '<>='
+
+
+def parse_size(text):
+    # 1024、64K、10M、1G
+    text = text.strip().upper()
+    unit = SIZE_UNITS.get(text[-1:], 1)
+    return int(float(text.rstrip('KMG')) * unit)
+
+
+def format_size(size):
+    for suffix, unit in sorted(SIZE_UNITS.items(), key=lambda item: -item[1]):
+        if size >= unit and size % unit == 0:
+            return f'{size // unit}{suffix}'
+    return str(size)
+
+
+# 按种子生成符合文法的程序：depth 是 if/while 的最大嵌套层数，expression_length 是表达式中最多的运算符个数，
+# if_ratio、while_ratio 是每条语句为 if、while 的概率（到达最大嵌套层数后只生成赋值）
+class ProgramGenerator:
+    def __init__(self, seed=0, depth=3, expression_length=4, if_ratio=0.2, while_ratio=0.2, else_ratio=0.5):
+        self.random = random.Random(seed)
+        self.depth = depth
+        self.expression_length = expression_length
+        self.if_ratio = if_ratio
+        self.while_ratio = while_ratio
+        self.else_ratio = else_ratio
+
+    def factor(self):
+        r = self.random
+        k = r.random()
+        if k < 0.55:
+            return r.choice(NAMES)
+        if k < 0.8:
+            return str(r.randrange(1000))
+        if k < 0.88:
+            return f'{r.randrange(1000)}.{r.randrange(1, 100)}'
+        if k < 0.94:
+            return hex(r.randrange(1, 4096))
+        return '0' + oct(r.randrange(1, 512))[2:]
+
+    def expression(self, length, nesting=2):
+        r = self.random
+        parts = [self.factor()]
+        for _ in range(r.randint(0, length)):
+            parts.append(r.choice(OPERATORS))
+            if nesting and r.random() < 0.1:
+                parts.append('(' + self.expression(length // 2, nesting - 1) + ')')
+            else:
+                parts.append(self.factor())
+        return ' '.join(parts)
+
+    def condition(self):
+        length = self.expression_length // 2
+        return f'{self.expression(length)} {self.random.choice(COMPARISONS)} {self.expression(length)}'
+
+    def statement(self, depth):
+        r = self.random
+        k = r.random()
+        if depth > 0 and k < self.while_ratio:
+            return f'while {self.condition()} do {self.statement(depth - 1)}'
+        if depth > 0 and k < self.while_ratio + self.if_ratio:
+            text = f'if {self.condition()} then {self.statement(depth - 1)}'
+            if r.random() < self.else_ratio:
+                text += f' else {self.statement(depth - 1)}'
+            return text
+        return f'{r.choice(NAMES)} = {self.expression(self.expression_length)}'
+
+    def chunks(self, size, chunk_bytes=1 << 16):
+        # 逐块产出源程序，每块由完整的语句组成；总长度刚超过 size 时停止
+        total = 0
+        while total < size:
+            lines = []
+            length = 0
+            while length < chunk_bytes and total + length < size:
+                line = self.statement(self.depth) + ';\n'
+                lines.append(line)
+                length += len(line)
+            chunk = ''.join(lines).encode('ascii')
+            total += len(chunk)
+            yield chunk
+
+    def generate(self, size):
+        return b''.join(self.chunks(size))
+
+
+def best_phases(runs, tokens, instructions):
+    # 每个阶段取多次运行中最快的一次；只有处理三地址代码的阶段才报告每秒指令数
+    phases = {}
+    for name in runs[0]['phases']:
+        seconds = min(run['phases'][name]['seconds'] for run in runs)
+        entry = {
+            'seconds': seconds,
+            'tokens_per_second': tokens / seconds if seconds > 0 else 0.0,
+        }
+        if name in INSTRUCTION_PHASES:
+            entry['instructions_per_second'] = instructions / seconds if seconds > 0 else 0.0
+        peaks = [run['phases'][name]['peak_bytes'] for run in runs if 'peak_bytes' in run['phases'][name]]
+        if peaks:
+            entry['peak_bytes'] = max(peaks)
+        phases[name] = entry
+    return phases
+
+
+def run_size(size, generator_options, repeat=3, parser_name='recursive', opt_level=0, stream=False,
+             trace_memory=False, jobs=1):
+    # 在单独的进程中执行，ru_maxrss 只反映这一个规模
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+    start = time.perf_counter()
+    source = ProgramGenerator(**generator_options).generate(size)
+    generate_seconds = time.perf_counter() - start
+
+    runs = []
+    tokens = instructions = 0
+    jobs_used = 1
+    for _ in range(repeat):
+        instrumentation = instrument.Instrumentation(memory=trace_memory)
+        previous = instrument.install(instrumentation)
+        try:
+            if stream:
+                with instrument.phase('stream'):
+                    main.write_output_streaming(main.iter_scan_tokens(source), os.devnull, opt_level)
+                instructions = instrumentation.counters.get('instructions', 0)
+            else:
+                token_store = main.scan_tokens(source)
+                parser_class = main.PARSERS[parser_name]
+                code = main.run_parser(token_store, parser_class, jobs=jobs)
+                main.run_processing(code, opt_level, compact=parser_class.compact)
+                tokens = len(token_store)
+                instructions = len(code)
+                # 单词太少或紧凑代码的语法分析器时 -j 退回单进程
+                jobs_used = instrumentation.counters.get('parse_jobs', 1)
+                # 释放后再开始下一次，峰值内存不叠加
+                del token_store, code
+        finally:
+            instrument.install(previous)
+        runs.append(instrumentation.report())
+
+    if stream:
+        # 流式时各阶段交织在一起，只计总时间；单词数另外数一遍
+        tokens = sum(1 for _ in main.iter_scan_tokens(source))
+    return {
+        'size': format_size(size),
+        'bytes': len(source),
+        'tokens': tokens,
+        'instructions': instructions,
+        'jobs': jobs_used,
+        'generate_seconds': generate_seconds,
+        'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        'phases': best_phases(runs, tokens, instructions),
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    # 按规模和阶段与基线比较，返回退化的说明
+    regressions = []
+    previous = {entry['size']: entry for entry in baseline.get('results', [])}
+    for entry in results['results']:
+        old = previous.get(entry['size'])
+        if old is None or old.get('jobs') != entry['jobs']:
+            # 实际使用的进程数不同（见 print_results 的输出），不比较这个规模
+            continue
+        for name, phase in entry['phases'].items():
+            old_phase = old['phases'].get(name)
+            if old_phase is None:
+                continue
+            rate, old_rate = phase['tokens_per_second'], old_phase['tokens_per_second']
+            if old_phase['seconds'] >= MIN_COMPARE_SECONDS and rate < old_rate * (1 - threshold):
+                regressions.append(f"{entry['size']} {name}: {rate:,.0f} tokens/s, baseline {old_rate:,.0f} "
+                                   f"({rate / old_rate - 1:+.0%})")
+            peak, old_peak = phase.get('peak_bytes'), old_phase.get('peak_bytes')
+            if peak and old_peak and peak > old_peak * (1 + threshold):
+                regressions.append(f"{entry['size']} {name}: peak {peak:,} bytes, baseline {old_peak:,} "
+                                   f"({peak / old_peak - 1:+.0%})")
+        rss, old_rss = entry.get('peak_rss_bytes'), old.get('peak_rss_bytes')
+        if rss and old_rss and rss > old_rss * (1 + threshold):
+            regressions.append(f"{entry['size']}: peak RSS {rss:,} bytes, baseline {old_rss:,} "
+                               f"({rss / old_rss - 1:+.0%})")
+    return regressions
+
+
+def print_results(results):
+    for entry in results['results']:
+        print(f"{entry['size']:>6}  {entry['bytes']:>12,} bytes  {entry['tokens']:>12,} tokens  "
+              f"{entry['instructions']:>12,} instructions  {entry['jobs']} jobs  "
+              f"peak RSS {entry['peak_rss_bytes'] / 1024 ** 2:,.1f} MB")
+        for name, phase in entry['phases'].items():
+            line = f"        {name:<10} {phase['seconds']:>10.4f}s  {phase['tokens_per_second']:>14,.0f} tokens/s"
+            if 'instructions_per_second' in phase:
+                line += f"  {phase['instructions_per_second']:>14,.0f} instructions/s"
+            if 'peak_bytes' in phase:
+                line += f"  peak {phase['peak_bytes'] / 1024 ** 2:,.1f} MB"
+            print(line)
+
+
+def main_benchmark():
+    arg_parser = argparse.ArgumentParser(description="Time each compiler phase on generated programs of growing size.")
+    arg_parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES,
+                            help="source sizes such as 1K 10M 1G (sizes of 100M and up need --stream or a lot of RAM)")
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--depth', type=int, default=3, help="maximum if/while nesting")
+    arg_parser.add_argument('--expression-length', type=int, default=4, help="maximum operators per expression")
+    arg_parser.add_argument('--if-ratio', type=float, default=0.2, help="probability that a statement is an if")
+    arg_parser.add_argument('--while-ratio', type=float, default=0.2, help="probability that a statement is a while")
+    arg_parser.add_argument('--repeat', type=int, default=3, help="runs per size; the fastest is kept")
+    arg_parser.add_argument('--parser', choices=sorted(main.PARSERS), default='recursive')
+    arg_parser.add_argument('-j', '--jobs', type=int, default=1, help="processes for parallel parsing")
+    arg_parser.add_argument('-O', dest='opt_level', type=int, choices=sorted(optimize.LEVELS), default=0,
+                            help="optimization level")
+    arg_parser.add_argument('--stream', action='store_true', help="time the bounded-memory streaming pipeline")
+    arg_parser.add_argument('--trace-memory', action='store_true',
+                            help="record per-phase peak memory with tracemalloc (much slower)")
+    arg_parser.add_argument('--generate', metavar='PATH', help="only write a program of the first size to PATH")
+    arg_parser.add_argument('-o', '--output', default=RESULTS_FILE)
+    arg_parser.add_argument('--baseline', default=BASELINE_FILE)
+    arg_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                            help="allowed relative slowdown or memory growth")
+    arg_parser.add_argument('--update-baseline', action='store_true', help="save these results as the new baseline")
+    args = arg_parser.parse_args()
+
+    generator_options = {'seed': args.seed, 'depth': args.depth, 'expression_length': args.expression_length,
+                         'if_ratio': args.if_ratio, 'while_ratio': args.while_ratio}
+    sizes = [parse_size(size) for size in args.sizes]
+    if args.generate:
+        with open(args.generate, 'wb') as file:
+            for chunk in ProgramGenerator(**generator_options).chunks(sizes[0]):
+                file.write(chunk)
+        return 0
+
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'generator': generator_options,
+        'parser': args.parser,
+        'jobs': args.jobs,
+        'opt_level': args.opt_level,
+        'stream': args.stream,
+        'results': [],
+    }
+    # 每个规模一个新进程，互不影响峰值内存
+    for size in sizes:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            entry = executor.submit(run_size, size, generator_options, args.repeat, args.parser, args.opt_level,
+                                    args.stream, args.trace_memory, args.jobs).result()
+        results['results'].append(entry)
+    print_results(results)
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=2)
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --update-baseline to record one")
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    for key in ('generator', 'parser', 'jobs', 'opt_level', 'stream'):
+        if baseline.get(key) != results[key]:
+            print(f"baseline was recorded with a different {key}; not comparing")
+            return 0
+    regressions = compare(results, baseline, args.threshold)
+    for message in regressions:
+        print(f"REGRESSION {message}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main_benchmark())
@@ -0,0 +1,163 @@
+from tac import GOTO, LABEL, JUMPS, NONE, NO_LABEL
+
+
+# 基本块：开头的若干标签和块内指令；跳转指令只会出现在块的末尾
+class BasicBlock:
+    __slots__ = ('labels', 'instructions')
+
+    def __init__(self, labels, instructions):
+        self.labels = labels
+        self.instructions = instructions
+
+    def terminator(self):
+        if self.instructions and self.instructions[-1][0] in JUMPS:
+            return self.instructions[-1]
+        return None
+
+    def falls_through(self):
+        return not self.instructions or self.instructions[-1][0] != GOTO
+
+
+# 标签的并查集：同一集合的标签指向同一个基本块，集合的根是最终跳转到的标签
+class LabelSets:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, label):
+        parent = self.parent
+        root = label
+        while root in parent:
+            root = parent[root]
+        # 路径压缩
+        while label != root:
+            parent[label], label = root, parent[label]
+        return root
+
+    def union(self, label, target):
+        # label 所在集合并入 target 所在集合；已在同一集合（跳转成环）时返回 False
+        label = self.find(label)
+        target = self.find(target)
+        if label == target:
+            return False
+        self.parent[label] = target
+        return True
+
+
+def build_blocks(instructions):
+    blocks = []
+    labels = []
+    body = []
+    for instruction in instructions:
+        op = instruction[0]
+        if op == LABEL:
+            if body:
+                blocks.append(BasicBlock(labels, body))
+                labels = []
+                body = []
+            labels.append(instruction[4])
+        else:
+            body.append(instruction)
+            if op in JUMPS:
+                blocks.append(BasicBlock(labels, body))
+                labels = []
+                body = []
+    if labels or body:
+        blocks.append(BasicBlock(labels, body))
+    return blocks
+
+
+class ControlFlowGraph:
+    def __init__(self, instructions):
+        self.blocks = build_blocks(instructions)
+        self.aliases = LabelSets()
+        # 标签 -> 基本块下标；同一块的标签并入块的第一个标签
+        self.label_blocks = {}
+        for index, block in enumerate(self.blocks):
+            for label in block.labels:
+                self.label_blocks[label] = index
+                if label != block.labels[0]:
+                    self.aliases.union(label, block.labels[0])
+
+    def target(self, label):
+        return self.label_blocks[self.aliases.find(label)]
+
+    def successors(self, index):
+        block = self.blocks[index]
+        result = []
+        jump = block.terminator()
+        if jump is not None:
+            result.append(self.target(jump[4]))
+        if block.falls_through() and index + 1 < len(self.blocks):
+            result.append(index + 1)
+        return result
+
+    def reachable(self, entry=0):
+        seen = bytearray(len(self.blocks))
+        if not self.blocks:
+            return seen
+        seen[entry] = 1
+        stack = [entry]
+        while stack:
+            for successor in self.successors(stack.pop()):
+                if not seen[successor]:
+                    seen[successor] = 1
+                    stack.append(successor)
+        return seen
+
+
+def thread_jumps(instructions, label_count=0, entry_label=NO_LABEL, hold_tail=False):
+    # 在控制流图上一遍完成：合并连续标签，跳到“只含 goto 的块”的跳转直接指向最终目标，
+    # 删除不可达的块，剩下的标签按程序顺序从 label_count + 1 开始编号。
+    # entry_label 是上一段末尾尚未输出的标签编号，属于本段的第一个块；
+    # hold_tail 时本段末尾的空块标签不输出，而是返回给下一段。
+    # 返回 (指令列表, 最后一个标签编号, 末尾未输出的标签编号)
+    cfg = ControlFlowGraph(instructions)
+    blocks = cfg.blocks
+    if not blocks:
+        if entry_label and not hold_tail:
+            return [(LABEL, NONE, NONE, NONE, entry_label)], label_count, NO_LABEL
+        return [], label_count, entry_label if hold_tail else NO_LABEL
+
+    for index, block in enumerate(blocks):
+        # 上一段已经用编号引用了第一个块，它不能再被穿透
+        if index == 0 and entry_label:
+            continue
+        if block.labels and len(block.instructions) == 1 and block.instructions[0][0] == GOTO:
+            cfg.aliases.union(block.labels[0], block.instructions[0][4])
+
+    reachable = cfg.reachable()
+    targeted = bytearray(len(blocks))
+    for index, block in enumerate(blocks):
+        if reachable[index]:
+            jump = block.terminator()
+            if jump is not None:
+                targeted[cfg.target(jump[4])] = 1
+
+    numbers = {}
+    if entry_label:
+        numbers[0] = entry_label
+    for index in range(len(blocks)):
+        if reachable[index] and targeted[index] and index not in numbers:
+            label_count += 1
+            numbers[index] = label_count
+
+    last = len(blocks) - 1
+    tail = NO_LABEL
+    if hold_tail and not blocks[last].instructions:
+        tail = numbers.get(last, NO_LABEL) if reachable[last] else NO_LABEL
+
+    output = []
+    append = output.append
+    target = cfg.target
+    for index, block in enumerate(blocks):
+        if not reachable[index]:
+            continue
+        number = numbers.get(index)
+        if number is not None and not (index == last and tail):
+            append((LABEL, NONE, NONE, NONE, number))
+        for instruction in block.instructions:
+            op = instruction[0]
+            if op in JUMPS:
+                instruction = (op, instruction[1], instruction[2], instruction[3], numbers[target(instruction[4])])
+            append(instruction)
+    return output, label_count, tail
@@ -0,0 +1,91 @@
+import argparse
+import json
+import socket
+import sys
+
+# 只导入输出格式，不加载编译器，启动开销尽量小
+from output_file import write_output_lines
+
+DEFAULT_SOCKET = '.compile_server.sock'
+
+
+def parse_address(text):
+    # HOST:PORT，HOST 省略时为 127.0.0.1
+    host, separator, port = text.rpartition(':')
+    if not separator or not port.isdigit():
+        raise argparse.ArgumentTypeError(f"expected HOST:PORT, got {text!r}")
+    return host or '127.0.0.1', int(port)
+
+
+def connect(address, timeout=None):
+    if isinstance(address, tuple):
+        return socket.create_connection(address, timeout)
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(timeout)
+    connection.connect(address)
+    return connection
+
+
+def request(address, message, timeout=None):
+    # 发送一个请求并等待回复，协议见 server.CompileServer
+    with connect(address, timeout) as connection:
+        connection.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        with connection.makefile('rb') as file:
+            line = file.readline()
+    if not line:
+        raise ConnectionError("the compile server closed the connection")
+    return json.loads(line)
+
+
+def main_client():
+    # 代替 python main.py：把源程序交给常驻的编译服务，按相同格式写出 output.txt
+    arg_parser = argparse.ArgumentParser(description="Compile a source file on a running compile server.")
+    arg_parser.add_argument('source', nargs='?')
+    arg_parser.add_argument('-o', '--output', default='output.txt')
+    address_group = arg_parser.add_mutually_exclusive_group()
+    address_group.add_argument('--socket', default=DEFAULT_SOCKET, help="Unix socket path of the server")
+    address_group.add_argument('--tcp', type=parse_address, metavar='HOST:PORT', help="connect over TCP instead")
+    # 取值由服务端检查
+    arg_parser.add_argument('-O', dest='opt_level', type=int, default=0, help="optimization level")
+    arg_parser.add_argument('--parser', default='recursive', help="recursive, stack, tree or backpatch")
+    arg_parser.add_argument('--ast', metavar='PATH', help="also write the syntax tree to PATH ('-' for stdout)")
+    arg_parser.add_argument('--timeout', type=float, default=60.0, help="seconds to wait for the server")
+    arg_parser.add_argument('--stats', action='store_true', help="print the server's counters instead of compiling")
+    args = arg_parser.parse_args()
+
+    if args.source is None and not args.stats:
+        arg_parser.error("a source file is required")
+    address = args.tcp or args.socket
+    if args.stats:
+        message = {'op': 'stats'}
+    else:
+        with open(args.source, 'rb') as file:
+            source = file.read().decode('utf-8')
+        message = {'op': 'compile', 'id': 1, 'source': source, 'opt_level': args.opt_level, 'parser': args.parser,
+                   'ast': args.ast is not None}
+    try:
+        response = request(address, message, args.timeout)
+    except (ConnectionError, FileNotFoundError, socket.timeout) as error:
+        print(f"cannot reach the compile server at {address}: {error}", file=sys.stderr)
+        return 2
+    if args.stats:
+        print(json.dumps(response, indent=2))
+        return 0
+    if not response['ok']:
+        print(f"{args.source}: {response['error']}", file=sys.stderr)
+        return 1
+
+    tokens = [tuple(token) for token in response['tokens']]
+    write_output_lines(tokens, response['code'], response['processed'], args.output)
+    if args.ast is not None:
+        text = ''.join(f"{line}\n" for line in response['ast'])
+        if args.ast == '-':
+            sys.stdout.write(text)
+        else:
+            with open(args.ast, 'w') as file:
+                file.write(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main_client())
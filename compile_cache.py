@@ -0,0 +1,142 @@
+import hashlib
+import os
+import pickle
+
+CACHE_DIR = '.compile_cache'
+MAX_BYTES = 64 * 1024 * 1024
+# 缓存条目格式变化时递增
+CACHE_VERSION = 4
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# 影响编译结果的源文件，任何一个变化都会使缓存失效
+SCANNER_FILES = ['lab1.c']
+FRONTEND_FILES = ['main.py', 'scanner.py', 'token_store.py', 'tac.py', 'cfg.py', 'optimize.py', 'frontend.py',
+                  'syntax_tree.py', 'parallel.py']
+
+STAGES = ['tokens', 'tac', 'processed']
+
+
+def digest(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        h.update(len(part).to_bytes(8, 'little'))
+        h.update(part)
+    return h.hexdigest()
+
+
+def files_digest(names):
+    return digest(*(open(os.path.join(BASE_DIR, name), 'rb').read() for name in names))
+
+
+class CompileCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = {stage: 0 for stage in STAGES}
+        self.misses = {stage: 0 for stage in STAGES}
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self.total_bytes = sum(size for _, size, _ in self._entries())
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+        self.scanner_digest = files_digest(SCANNER_FILES)
+        self.frontend_digest = files_digest(FRONTEND_FILES)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def stage_key(self, stage, input_digest):
+        return digest(str(CACHE_VERSION), stage, input_digest, self.scanner_digest, self.frontend_digest)
+
+    def get(self, stage, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                value = pickle.load(file)
+        except FileNotFoundError:
+            self.misses[stage] += 1
+            return None
+        except Exception:
+            # 写了一半、损坏或引用了已改名的类的条目（pickle 会抛出各种异常）当作没有命中，并删掉
+            self.misses[stage] += 1
+            self._remove(path)
+            return None
+        # 用修改时间记录最近使用，淘汰时按它排序
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self.hits[stage] += 1
+        return value
+
+    def put(self, key, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        path = self._path(key)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        # 覆盖已有的条目时减去旧文件的大小
+        try:
+            self.total_bytes -= os.stat(path).st_size
+        except FileNotFoundError:
+            pass
+        os.replace(temp_path, path)
+        self.total_bytes += len(data)
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def _remove(self, path):
+        try:
+            size = os.stat(path).st_size
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        self.total_bytes -= size
+
+    def evict(self):
+        # LRU 淘汰，直到总大小回到上限的 90% 以内
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self.total_bytes = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 9 // 10
+        for path, size, _ in entries:
+            if self.total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        for path, _, _ in self._entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.total_bytes = 0
+
+    def stats(self):
+        return {
+            'hits': dict(self.hits),
+            'misses': dict(self.misses),
+            'evictions': self.evictions,
+            'entries': len(self._entries()),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+        }
@@ -0,0 +1,236 @@
+import contextlib
+import gc
+from array import array
+
+import instrument
+import syntax_tree
+from tac import Code, BINARY_OPS, COMPARE_OPS, COPY, GOTO, LABEL, NONE
+from token_store import TYPE_NAMES, ID, NUMBER, OP, COMPARE, ASSIGN, END, WHILE, IF, THEN, ELSE, DO, LPAREN, RPAREN, \
+    SEMIC, HEX
+
+# 单词类型列末尾的哨兵，不等于任何单词类型
+END_OF_TOKENS = 255
+
+
+# 只生成代码时代替 syntax_tree.TreeBuilder，所有节点都是 None
+class NullBuilder:
+    def node(self, token_type, token_value, children=None):
+        return None
+
+    def leaf(self, token_type, token_value):
+        return None
+
+    def finish(self, root):
+        return root
+
+
+# 只做一次语法分析的前端：在构造语法树的同时按 main.Parser 的顺序生成三地址代码，不再遍历语法树。
+# 临时变量和标签的分配顺序与 main.Parser 相同，生成的代码完全一致。
+# keep_trees 保留每条顶层语句的语法树
+class TreeParser(syntax_tree.Parser):
+    compact = False
+
+    def __init__(self, tokens, code=None, builder=None, keep_trees=False):
+        # 不保留语法树时不构造节点，速度接近 main.Parser
+        super().__init__(tokens, builder if builder is not None or keep_trees else NullBuilder())
+        self.code = code if code is not None else Code.from_tokens(self.tokens)
+        self.keep_trees = keep_trees
+        self.trees = []
+        self.temp_count = 0
+        self.label_count = 0
+        self.statement_count = 0
+        # 与 main.Parser 的接口一致，增量编译会重置它；标签都是新分配的，不需要去重
+        self.generated_labels = set()
+        # E、T、F 返回语法树节点，它的值所在的操作数放在这里
+        self.place = NONE
+        self.padded_kinds = self.kinds + array('B', [END_OF_TOKENS])
+        self.node = self.builder.node
+        self.leaf = self.builder.leaf
+        # 标识符、常数和运算符一样是共享的叶子节点，按符号编号查找
+        self.op_leaves = {op: self.leaf('OP', op) for op in BINARY_OPS}
+        self.operand_leaves = {}
+
+    def parse(self):
+        with paused_gc():
+            while self.current_token_index < self.token_count:
+                if self.tracing:
+                    instrument.trace(f"Current Token: {self.current_token()}")
+                self.code.mark_statement(self.current_token_index)
+                self.S()
+        return self.code
+
+    def S(self):
+        node = self.statement()
+        if self.keep_trees:
+            self.trees.append(node)
+        return node
+
+    def new_temp(self):
+        self.temp_count += 1
+        return ~self.temp_count
+
+    def new_label(self):
+        self.label_count += 1
+        return self.label_count
+
+    def statement(self):
+        kind = self.current_kind()
+        token_type = TYPE_NAMES[kind] if kind is not None else None
+        token_value = self.current_value()
+        code = self.code
+        children = []
+        self.statement_count += 1
+        if self.tracing:
+            instrument.trace(f"Processing statement: {token_type}, {token_value}")
+        if kind == ID:
+            # 代码沿用单词的符号表，符号编号就是操作数
+            id_place = self.symbols[self.current_token_index]
+            self.next_token()
+            if self.current_kind() == ASSIGN:
+                children.append(self.leaf('ASSIGN', '='))
+                self.next_token()
+                children.append(self.E())
+                code.append(COPY, id_place, self.place)
+            elif self.current_kind() == SEMIC:
+                self.next_token()
+        elif kind == IF:
+            self.next_token()
+            children.append(self.leaf('IF', 'if'))
+            C_true = self.new_label()
+            C_false = self.new_label()
+            S_next = self.new_label()
+            children.append(self.C(C_true, C_false))
+            if self.current_kind() == THEN:
+                self.next_token()
+                code.append(LABEL, NONE, NONE, NONE, C_true)
+                children.append(self.node('THEN', 'then', [self.statement()]))
+                code.append(GOTO, label=S_next)
+                code.append(LABEL, NONE, NONE, NONE, C_false)
+                if self.current_kind() == ELSE:
+                    self.next_token()
+                    children.append(self.node('ELSE', 'else', [self.statement()]))
+                code.append(LABEL, NONE, NONE, NONE, S_next)
+            else:
+                raise SyntaxError("Missing then")
+        elif kind == WHILE:
+            self.next_token()
+            children.append(self.leaf('WHILE', 'while'))
+            S_begin = self.new_label()
+            C_true = self.new_label()
+            C_false = self.new_label()
+            code.append(LABEL, NONE, NONE, NONE, S_begin)
+            children.append(self.C(C_true, C_false))
+            if self.current_kind() == DO:
+                self.next_token()
+                code.append(LABEL, NONE, NONE, NONE, C_true)
+                children.append(self.node('DO', 'do', [self.statement()]))
+                code.append(GOTO, label=S_begin)
+                code.append(LABEL, NONE, NONE, NONE, C_false)
+            else:
+                raise SyntaxError("Missing do")
+        elif kind == LPAREN:
+            self.next_token()
+            children.append(self.E())
+            if self.current_kind() == RPAREN:
+                self.next_token()
+            else:
+                raise SyntaxError("Missing closing parenthesis")
+        elif kind == END:
+            self.next_token()
+        else:
+            raise SyntaxError(f"Invalid statement: {token_type} at index {self.current_token_index}")
+        return self.node(token_type, token_value, children)
+
+    def C(self, true_label, false_label):
+        left = self.E()
+        E1_place = self.place
+        if self.current_kind() == COMPARE or (self.current_kind() == ASSIGN and self.current_value() == '='):
+            op = self.current_value()
+            self.next_token()
+            right = self.E()
+            self.code.append(COMPARE_OPS[op], NONE, E1_place, self.place, true_label)
+            self.code.append(GOTO, label=false_label)
+            return self.node('CONDITION', 'condition', [left, self.leaf('OP', op), right])
+        else:
+            raise SyntaxError(f"Invalid comparison operator: {self.current_token()} at index {self.current_token_index}")
+
+    # E、T、F 占了大部分单词，直接读单词的列，末尾有哨兵，不用检查越界
+    def E(self):
+        node = self.T()
+        place = self.place
+        while self.padded_kinds[self.current_token_index] == OP:
+            op = self.symbol_values[self.symbols[self.current_token_index]]
+            if op != '+' and op != '-':
+                break
+            self.current_token_index += 1
+            right = self.T()
+            self.temp_count += 1
+            E_place = ~self.temp_count
+            self.code.append(BINARY_OPS[op], E_place, place, self.place)
+            place = E_place
+            node = self.node('EXPR', 'expr', [node, self.op_leaves[op], right])
+        self.place = place
+        return node
+
+    def T(self):
+        node = self.F()
+        place = self.place
+        while self.padded_kinds[self.current_token_index] == OP:
+            op = self.symbol_values[self.symbols[self.current_token_index]]
+            if op != '*' and op != '/':
+                break
+            self.current_token_index += 1
+            right = self.F()
+            self.temp_count += 1
+            T_place = ~self.temp_count
+            self.code.append(BINARY_OPS[op], T_place, place, self.place)
+            place = T_place
+            node = self.node('TERM', 'term', [node, self.op_leaves[op], right])
+        self.place = place
+        return node
+
+    def F(self):
+        index = self.current_token_index
+        kind = self.padded_kinds[index]
+        if kind == ID or kind == NUMBER or kind == HEX:
+            symbol = self.symbols[index]
+            self.place = symbol
+            self.current_token_index = index + 1
+            node = self.operand_leaves.get(symbol)
+            if node is None:
+                node = self.operand_leaves[symbol] = self.leaf(TYPE_NAMES[kind], self.symbol_values[symbol])
+            return node
+        if kind == LPAREN:
+            self.current_token_index = index + 1
+            expr_node = self.E()
+            if self.current_kind() == RPAREN:
+                self.next_token()
+                return self.node('LPAREN', '(', [expr_node])
+            else:
+                raise SyntaxError("Missing closing parenthesis")
+        raise SyntaxError(f"Invalid factor: {self.current_token()} at index {self.current_token_index}")
+
+
+@contextlib.contextmanager
+def paused_gc():
+    # 语法树没有循环引用，保留大量节点时暂停循环垃圾回收，否则它会反复扫描所有节点
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        # 新建的节点直接并入最老的一代：不再被年轻代的回收反复扫描，也不计入触发完整回收的新对象数
+        gc.freeze()
+        gc.unfreeze()
+        if collecting:
+            gc.enable()
+
+
+def parse_trees(tokens, builder=None):
+    # 只要语法树：返回每条顶层语句的语法树，不生成代码
+    parser = syntax_tree.Parser(tokens, builder)
+    trees = []
+    with paused_gc():
+        while parser.current_token_index < parser.token_count:
+            trees.append(parser.statement())
+    return trees
@@ -0,0 +1,304 @@
+import argparse
+import bisect
+import os
+import time
+
+import cfg
+import instrument
+import main
+import optimize
+import scanner
+from main import Parser
+from tac import Code, LABEL, NONE, NO_LABEL
+from token_store import TokenStore
+
+# 比较新旧源程序时每次比较的字节数
+COMPARE_CHUNK = 4096
+
+
+# 一条顶层语句：第一个单词的字节偏移、单词列（位置相对于 start）、
+# 以及临时变量和标签都从 1 开始编号的三地址代码。
+# plain / entered 是处理过的代码 (指令, 标签数, 末尾标签)，分别对应上一条语句末尾没有 / 有未输出的标签，
+# 后者第一个块的标签固定为 1，拼接时换成上一条语句的末尾标签，见 cfg.thread_jumps
+class Statement:
+    __slots__ = ('start', 'kinds', 'symbols', 'offsets', 'code', 'temp_count', 'label_count', 'plain', 'entered')
+
+
+def start_of(statement):
+    return statement.start
+
+
+def common_prefix(a, b):
+    # 先按块比较，再在不同的块里逐字节找
+    limit = min(len(a), len(b))
+    length = 0
+    while length < limit and a[length:length + COMPARE_CHUNK] == b[length:length + COMPARE_CHUNK]:
+        length += COMPARE_CHUNK
+    length = min(length, limit)
+    while length < limit and a[length] == b[length]:
+        length += 1
+    return length
+
+
+def common_suffix(a, b, limit):
+    # 与 common_prefix 相同，从末尾往前比较，最多 limit 个字节
+    length = 0
+    while length < limit and (a[len(a) - length - COMPARE_CHUNK:len(a) - length]
+                              == b[len(b) - length - COMPARE_CHUNK:len(b) - length]):
+        length += COMPARE_CHUNK
+    length = min(length, limit)
+    while length < limit and a[len(a) - length - 1] == b[len(b) - length - 1]:
+        length += 1
+    return length
+
+
+# 增量编译：保存每条顶层语句的单词和代码片段，源程序修改后只重新扫描、分析修改处附近的语句，
+# 其余语句原样保留，拼接时再按语句顺序平移临时变量和标签编号，结果与整体编译相同。
+# 扫描器没有跨单词的状态，修改处之后某条旧语句的第一个单词在新扫描中仍是单词开头时，之后的单词都不变；
+# 语法分析在顶层语句之间也没有状态，重新分析到某条旧语句的开头就停止
+class IncrementalCompiler:
+    def __init__(self, parser_class=Parser, opt_level=0):
+        self.parser_class = parser_class
+        self.opt_level = opt_level
+        self.source = b''
+        self.statements = []
+        # 所有版本共用的符号表，只增不减，旧语句的符号编号一直有效
+        self.symbol_values = []
+        self.symbol_ids = {}
+
+    def update(self, source):
+        # 与上一版源程序比较，把不同的部分当作一次修改
+        if isinstance(source, str):
+            source = source.encode('utf-8')
+        old = self.source
+        prefix = common_prefix(old, source)
+        suffix = common_suffix(old, source, min(len(old), len(source)) - prefix)
+        return self.edit(prefix, len(old) - suffix, source[prefix:len(source) - suffix])
+
+    def edit(self, start, end, text):
+        # 用 text 替换源程序中 [start, end) 的字节；返回 (第一条重新分析的语句下标, 删除的语句数, 新的语句数)
+        if isinstance(text, str):
+            text = text.encode('utf-8')
+        source = self.source[:start] + text + self.source[end:]
+        delta = len(text) - (end - start)
+        statements = self.statements
+
+        # 修改处所在的语句，以及它前一条：前一条语句在哪里结束取决于后面的第一个单词
+        first = max(bisect.bisect_right(statements, start, key=start_of) - 2, 0)
+        scan_start = statements[first].start if first else 0
+
+        with instrument.phase('scanner'):
+            resume, result, count = self.rescan(source, scan_start, end, delta)
+        with instrument.phase('lexer'):
+            tokens = TokenStore(self.symbol_values, self.symbol_ids)
+            tokens.extend_scan(result, scan_start, count)
+        with instrument.phase('parse'):
+            parsed, stop = self.reparse(tokens, resume, delta)
+        with instrument.phase('process'):
+            for statement in parsed:
+                self.process(statement)
+
+        for statement in statements[stop:]:
+            statement.start += delta
+        statements[first:stop] = parsed
+        self.source = source
+        instrument.count('rescanned_bytes', len(result.source))
+        instrument.count('reparsed_statements', len(parsed))
+        return first, stop - first, len(parsed)
+
+    def rescan(self, source, scan_start, end, delta):
+        # 从 scan_start 开始扫描到修改处之后的第一条旧语句（含这条语句）；
+        # 它的第一个单词在新扫描中也是单词开头时从这里恢复，否则往后多取几条语句再扫描。
+        # 返回 (恢复处的旧语句下标, 扫描结果, 恢复处之前的单词数)
+        statements = self.statements
+        resume = bisect.bisect_left(statements, end, key=start_of)
+        step = 1
+        while resume < len(statements):
+            boundary = statements[resume].start + delta
+            limit = statements[resume + 1].start + delta if resume + 1 < len(statements) else len(source)
+            result = scanner.scan(source[scan_start:limit])
+            count = bisect.bisect_left(result.offsets, boundary - scan_start)
+            if count < len(result) and result.offsets[count] == boundary - scan_start:
+                return resume, result, count
+            resume += step
+            step *= 2
+        result = scanner.scan(source[scan_start:])
+        return len(statements), result, len(result)
+
+    def reparse(self, tokens, resume, delta):
+        # tokens 是新扫描的单词，后面接上从 resume 开始的若干条旧语句的单词；
+        # 分析到某条旧语句的开头就停止。接上的旧语句不够用时加倍重来
+        statements = self.statements
+        extra = 2
+        while True:
+            limit = min(resume + extra, len(statements))
+            window = TokenStore(self.symbol_values, self.symbol_ids)
+            window.kinds.extend(tokens.kinds)
+            window.symbols.extend(tokens.symbols)
+            window.positions.extend(tokens.positions)
+            boundaries = {}
+            for index in range(resume, limit):
+                statement = statements[index]
+                boundaries[len(window)] = index
+                window.kinds.extend(statement.kinds)
+                window.symbols.extend(statement.symbols)
+                start = statement.start + delta
+                window.positions.extend([start + offset for offset in statement.offsets])
+            truncated = limit < len(statements)
+            try:
+                parsed, stop = self.parse_statements(window, boundaries)
+            except SyntaxError:
+                # 单词被截断也可能导致语法错误
+                if not truncated:
+                    raise
+                stop = None
+            if stop is not None or not truncated:
+                return parsed, len(statements) if stop is None else stop
+            extra *= 2
+
+    def parse_statements(self, tokens, boundaries):
+        # 逐条分析顶层语句，每条语句单独编号；遇到 boundaries 中的单词下标时返回对应的旧语句下标
+        parser = self.parser_class(tokens, Code(self.symbol_values, self.symbol_ids))
+        count = len(tokens)
+        positions = tokens.positions
+        parsed = []
+        while parser.current_token_index < count:
+            begin = parser.current_token_index
+            stop = boundaries.get(begin)
+            if stop is not None:
+                return parsed, stop
+            parser.code = parser.code.derive()
+            parser.temp_count = 0
+            parser.label_count = 0
+            parser.generated_labels.clear()
+            parser.S()
+            end = parser.current_token_index
+
+            statement = Statement()
+            statement.start = start = positions[begin]
+            statement.kinds = tokens.kinds[begin:end]
+            statement.symbols = tokens.symbols[begin:end]
+            statement.offsets = positions[begin:end]
+            for i in range(len(statement.offsets)):
+                statement.offsets[i] -= start
+            statement.code = parser.code
+            statement.temp_count = parser.temp_count
+            statement.label_count = parser.label_count
+            parsed.append(statement)
+        return parsed, None
+
+    def process(self, statement):
+        code, _ = main.run_optimizer(statement.code, self.opt_level)
+        statement.plain = cfg.thread_jumps(code, 0, NO_LABEL, hold_tail=True)
+        statement.entered = cfg.thread_jumps(code, 1, 1, hold_tail=True)
+
+    def tokens(self):
+        tokens = TokenStore(self.symbol_values, self.symbol_ids)
+        for statement in self.statements:
+            tokens.kinds.extend(statement.kinds)
+            tokens.symbols.extend(statement.symbols)
+            start = statement.start
+            tokens.positions.extend([start + offset for offset in statement.offsets])
+        return tokens
+
+    def code(self):
+        # 临时变量 ~k 平移后是 ~(k + temp_base)，即减去 temp_base
+        code = Code(self.symbol_values, self.symbol_ids)
+        temp_base = 0
+        label_base = 0
+        token_base = 0
+        for statement in self.statements:
+            fragment = statement.code
+            code.mark_statement(token_base)
+            token_base += len(statement.kinds)
+            code.ops.extend(fragment.ops)
+            for column, operands in ((code.dst, fragment.dst), (code.src1, fragment.src1),
+                                     (code.src2, fragment.src2)):
+                column.extend([operand - temp_base if operand < NONE else operand for operand in operands])
+            code.labels.extend([label + label_base if label else NO_LABEL for label in fragment.labels])
+            temp_base += statement.temp_count
+            label_base += statement.label_count
+        return code
+
+    def processed_code(self):
+        # 与 main.iter_process_three_address_code 相同：上一条语句末尾的标签属于下一条语句的第一个块
+        code = Code(self.symbol_values, self.symbol_ids)
+        append = code.append
+        temp_base = 0
+        label_count = 0
+        tail = NO_LABEL
+        for statement in self.statements:
+            if tail:
+                instructions, count, local_tail = statement.entered
+                entry, offset = tail, label_count - 1
+            else:
+                instructions, count, local_tail = statement.plain
+                entry, offset = NO_LABEL, label_count
+            for op, dst, src1, src2, label in instructions:
+                if label:
+                    label = entry if entry and label == 1 else label + offset
+                append(op,
+                       dst - temp_base if dst < NONE else dst,
+                       src1 - temp_base if src1 < NONE else src1,
+                       src2 - temp_base if src2 < NONE else src2,
+                       label)
+            label_count = count + offset
+            if local_tail:
+                tail = entry if entry and local_tail == 1 else local_tail + offset
+            else:
+                tail = NO_LABEL
+            temp_base += statement.temp_count
+        if tail:
+            append(LABEL, NONE, NONE, NONE, tail)
+        return code
+
+    def write_output(self, path='output.txt'):
+        main.write_output(self.tokens(), self.code(), self.processed_code(), path)
+
+
+def main_incremental():
+    arg_parser = argparse.ArgumentParser(description="Compile a source file incrementally, optionally on every change.")
+    arg_parser.add_argument('source', nargs='?', default=main.SOURCE_FILE)
+    arg_parser.add_argument('-o', '--output', default='output.txt')
+    arg_parser.add_argument('--watch', action='store_true', help="recompile whenever the source file changes")
+    arg_parser.add_argument('--interval', type=float, default=0.2, help="polling interval in seconds")
+    arg_parser.add_argument('-O', dest='opt_level', type=int, choices=sorted(optimize.LEVELS), default=0,
+                            help="optimization level, applied per top-level statement as with --stream")
+    arg_parser.add_argument('--parser', choices=sorted(main.PARSERS), default='recursive')
+    args = arg_parser.parse_args()
+
+    compiler = IncrementalCompiler(main.PARSERS[args.parser], args.opt_level)
+    stamp = None
+    while True:
+        try:
+            status = os.stat(args.source)
+            changed = (status.st_mtime_ns, status.st_size) != stamp
+        except FileNotFoundError:
+            changed = False
+        if changed:
+            stamp = (status.st_mtime_ns, status.st_size)
+            with open(args.source, 'rb') as file:
+                source = file.read()
+            start = time.perf_counter()
+            try:
+                first, removed, added = compiler.update(source)
+            except SyntaxError as error:
+                # 保留上一次的结果，等下一次修改
+                print(f"{args.source}: {error}")
+                if not args.watch:
+                    return 1
+            else:
+                seconds = time.perf_counter() - start
+                compiler.write_output(args.output)
+                print(f"{args.source}: reparsed {added} statement(s) at {first} (replacing {removed}), "
+                      f"{len(compiler.statements)} total, {seconds * 1000:.2f} ms")
+        if not args.watch:
+            return 0
+        try:
+            time.sleep(args.interval)
+        except KeyboardInterrupt:
+            return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main_incremental())
@@ -0,0 +1,118 @@
+import contextlib
+import json
+import time
+import tracemalloc
+
+
+# 各阶段计时、计数和可选的内存采样；默认使用 NullInstrumentation，不产生任何开销
+class Instrumentation:
+    enabled = True
+
+    def __init__(self, memory=False, tracing=False):
+        self.memory = memory
+        self.tracing = tracing
+        self.timings = {}
+        self.calls = {}
+        self.counters = {}
+        self.peak_memory = {}
+        # 正在进行的各层阶段到目前为止的内存峰值；内层阶段开始时重置 tracemalloc 的峰值，外层的峰值从这里补回
+        self._peaks = []
+        # 每个阶段结束时回调 listener(name, seconds)
+        self.listeners = []
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if self.memory:
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+            self._peaks.append(0)
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if self.memory:
+                peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+                self.peak_memory[name] = max(self.peak_memory.get(name, 0), peak)
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+            for listener in self.listeners:
+                listener(name, elapsed)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def trace(self, message):
+        if self.tracing:
+            print(message)
+
+    def report(self):
+        phases = {}
+        for name, seconds in self.timings.items():
+            phases[name] = {'seconds': seconds, 'calls': self.calls[name]}
+            if name in self.peak_memory:
+                phases[name]['peak_bytes'] = self.peak_memory[name]
+        return {'phases': phases, 'total_seconds': sum(self.timings.values()), 'counters': dict(self.counters)}
+
+    def dump(self, path='-'):
+        text = json.dumps(self.report(), indent=2)
+        if path == '-':
+            print(text)
+        else:
+            with open(path, 'w') as file:
+                file.write(text + '\n')
+
+
+class NullInstrumentation:
+    enabled = False
+    memory = False
+    tracing = False
+
+    def phase(self, name):
+        return contextlib.nullcontext()
+
+    def count(self, name, n=1):
+        pass
+
+    def trace(self, message):
+        pass
+
+
+_current = NullInstrumentation()
+
+
+def current():
+    return _current
+
+
+def install(instrumentation):
+    # 替换当前使用的插桩对象，返回原来的对象以便恢复
+    global _current
+    previous = _current
+    _current = instrumentation if instrumentation is not None else NullInstrumentation()
+    return previous
+
+
+def phase(name):
+    return _current.phase(name)
+
+
+def count(name, n=1):
+    _current.count(name, n)
+
+
+def trace(message):
+    _current.trace(message)
+
+
+def enabled():
+    return _current.enabled
+
+
+def tracing():
+    return _current.tracing
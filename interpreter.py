@@ -0,0 +1,177 @@
+import argparse
+import json
+import operator
+import time
+
+import compile_cache
+import instrument
+import main
+import optimize
+from tac import COPY, ADD, SUB, MUL, DIV, IF_LT, IF_GT, IF_EQ, IF_LE, IF_GE, IF_NE, GOTO, LABEL, NONE, divide
+
+# 默认最多执行的指令数，防止死循环
+DEFAULT_MAX_STEPS = 10_000_000
+
+# 指令按执行方式分成四类，同一类的操作码只是处理函数不同
+MOVE, ARITH, BRANCH, JUMP = range(4)
+HANDLERS = {
+    COPY: (MOVE, None),
+    ADD: (ARITH, operator.add),
+    SUB: (ARITH, operator.sub),
+    MUL: (ARITH, operator.mul),
+    DIV: (ARITH, divide),
+    IF_LT: (BRANCH, operator.lt),
+    IF_GT: (BRANCH, operator.gt),
+    IF_EQ: (BRANCH, operator.eq),
+    IF_LE: (BRANCH, operator.le),
+    IF_GE: (BRANCH, operator.ge),
+    IF_NE: (BRANCH, operator.ne),
+    GOTO: (JUMP, None),
+}
+
+
+class ExecutionResult:
+    def __init__(self, variables, steps, seconds, finished):
+        self.variables = variables
+        self.steps = steps
+        self.seconds = seconds
+        # 步数用完时为 False
+        self.finished = finished
+
+    def instructions_per_second(self):
+        return self.steps / self.seconds if self.seconds > 0 else 0.0
+
+    def report(self):
+        return {
+            'variables': self.variables,
+            'finished': self.finished,
+            'steps': self.steps,
+            'seconds': self.seconds,
+            'instructions_per_second': self.instructions_per_second(),
+        }
+
+
+# 预处理过的程序：标签换成指令下标，变量、常数和临时变量各占 slots 中的一格，
+# 每条指令是 (类别, 处理函数, 目的格, 源格1, 源格2, 跳转目标)
+class Executable:
+    def __init__(self, code):
+        slots = {}
+        self.initial = []
+        self.variables = {}
+        symbol_values = code.symbol_values
+
+        def slot(operand):
+            index = slots.get(operand)
+            if index is None:
+                index = slots[operand] = len(self.initial)
+                if operand < NONE:
+                    self.initial.append(0)
+                elif isinstance(symbol_values[operand], str):
+                    self.initial.append(0)
+                    self.variables[symbol_values[operand]] = index
+                else:
+                    # 常数的格子在执行中不会被写
+                    self.initial.append(symbol_values[operand])
+            return index
+
+        # 去掉标签，标签指向它后面第一条指令
+        targets = {}
+        body = []
+        for instruction in code:
+            if instruction[0] == LABEL:
+                targets[instruction[4]] = len(body)
+            else:
+                body.append(instruction)
+
+        self.instructions = []
+        for op, dst, src1, src2, label in body:
+            kind, handler = HANDLERS[op]
+            self.instructions.append((kind, handler,
+                                      slot(dst) if dst != NONE else NONE,
+                                      slot(src1) if src1 != NONE else NONE,
+                                      slot(src2) if src2 != NONE else NONE,
+                                      targets[label] if kind >= BRANCH else NONE))
+
+    def run(self, bindings=None, max_steps=DEFAULT_MAX_STEPS):
+        # bindings 给出变量初值，没有给出的变量从 0 开始；程序里没有的名字被忽略
+        slots = list(self.initial)
+        for name, value in (bindings or {}).items():
+            index = self.variables.get(name)
+            if index is not None:
+                slots[index] = value
+
+        instructions = self.instructions
+        count = len(instructions)
+        pc = 0
+        steps = 0
+        start = time.perf_counter()
+        with instrument.phase('execute'):
+            while pc < count and steps < max_steps:
+                kind, handler, dst, src1, src2, target = instructions[pc]
+                steps += 1
+                if kind == ARITH:
+                    slots[dst] = handler(slots[src1], slots[src2])
+                    pc += 1
+                elif kind == BRANCH:
+                    pc = target if handler(slots[src1], slots[src2]) else pc + 1
+                elif kind == MOVE:
+                    slots[dst] = slots[src1]
+                    pc += 1
+                else:
+                    pc = target
+        seconds = time.perf_counter() - start
+        instrument.count('executed_instructions', steps)
+        variables = {name: slots[index] for name, index in self.variables.items()}
+        return ExecutionResult(variables, steps, seconds, pc >= count)
+
+
+def execute(code, bindings=None, max_steps=DEFAULT_MAX_STEPS):
+    return Executable(code).run(bindings, max_steps)
+
+
+def parse_number(text):
+    # 按整数或浮点数解析，与 INT*/REAL* 单词的类型对应；都不是时抛出 ValueError
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def parse_binding(text):
+    # NAME=VALUE
+    name, separator, value = text.partition('=')
+    if not separator or not name:
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUE, got {text!r}")
+    try:
+        return name, parse_number(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid number in {text!r}") from None
+
+
+def main_run(executable_class=Executable):
+    # executable_class(code).run(bindings, max_steps) 执行程序，其他后端也用这个命令行入口
+    arg_parser = argparse.ArgumentParser(description="Compile a program and execute its three-address code.")
+    arg_parser.add_argument('source', nargs='?', default=main.SOURCE_FILE)
+    arg_parser.add_argument('-D', '--define', type=parse_binding, action='append', default=[], metavar='NAME=VALUE',
+                            help="initial value of a variable (default 0)")
+    arg_parser.add_argument('--max-steps', type=int, default=DEFAULT_MAX_STEPS, help="instruction budget")
+    arg_parser.add_argument('-O', dest='opt_level', type=int, choices=sorted(optimize.LEVELS), default=0,
+                            help="optimization level")
+    arg_parser.add_argument('--parser', choices=sorted(main.PARSERS), default='recursive')
+    arg_parser.add_argument('--recycle-temps', action='store_true', help="reuse temporaries to need fewer slots")
+    arg_parser.add_argument('--no-cache', action='store_true', help="disable the on-disk compile cache")
+    arg_parser.add_argument('--cache-dir', default=compile_cache.CACHE_DIR)
+    args = arg_parser.parse_args()
+
+    with open(args.source, 'rb') as file:
+        source = file.read()
+    cache = None if args.no_cache else compile_cache.CompileCache(args.cache_dir)
+    _, _, processed_code = main.compile_source(source, cache, main.PARSERS[args.parser], args.opt_level,
+                                               recycle_temps=args.recycle_temps)
+    result = executable_class(processed_code).run(dict(args.define), args.max_steps)
+    print(json.dumps(result.report(), indent=2))
+    return 0 if result.finished else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main_run())
@@ -517,6 +517,12 @@ int int10_analyze(char* text, int len);
 double real16_analyzer(char* text, int len);
 double real8_analyzer(char* text, int len);
 double real10_analyzer(char* text, int len);
+/* 每识别一个单词调用一次 emit_token；内存扫描模式下缓冲区写满时让 yylex 先返回 */
+int emit_token(int kind, double value);
+#define EMIT(kind, value) do { counter++; if (emit_token(kind, value)) return kind; } while (0)
+/* 内存扫描模式下不回显无法识别的字符 */
+static int *scan_kinds = NULL;
+#define ECHO do { if (!scan_kinds && fwrite( yytext, (size_t) yyleng, 1, yyout )) {} } while (0)
 #line 520 "lab1.c"
 /* 姝ｅ垯瀹氫箟寮?*/
 #line 522 "lab1.c"
@@ -804,112 +810,112 @@ YY_RULE_SETUP
 case 2:
 YY_RULE_SETUP
 #line 50 "lab1.l"
-{counter++; fprintf(yyout, "%d\tIF\t\t-\n", counter);}
+EMIT(IF, 0);
 	YY_BREAK
 case 3:
 YY_RULE_SETUP
 #line 51 "lab1.l"
-{counter++; fprintf(yyout, "%d\tTHEN\t\t-\n", counter);}
+EMIT(THEN, 0);
 	YY_BREAK
 case 4:
 YY_RULE_SETUP
 #line 52 "lab1.l"
-{counter++; fprintf(yyout, "%d\tELSE\t\t-\n", counter);}
+EMIT(ELSE, 0);
 	YY_BREAK
 case 5:
 YY_RULE_SETUP
 #line 53 "lab1.l"
-{counter++; fprintf(yyout, "%d\tWHILE\t\t-\n", counter);}
+EMIT(WHILE, 0);
 	YY_BREAK
 case 6:
 YY_RULE_SETUP
 #line 54 "lab1.l"
-{counter++; fprintf(yyout, "%d\tDO\t\t-\n", counter);}
+EMIT(DO, 0);
 	YY_BREAK
 case 7:
 YY_RULE_SETUP
 #line 55 "lab1.l"
-{counter++; fprintf(yyout, "%d\tLT\t\t-\n", counter);}
+EMIT(LT, 0);
 	YY_BREAK
 case 8:
 YY_RULE_SETUP
 #line 56 "lab1.l"
-{counter++; fprintf(yyout, "%d\tGT\t\t-\n", counter);}
+EMIT(GT, 0);
 	YY_BREAK
 case 9:
 YY_RULE_SETUP
 #line 57 "lab1.l"
-{counter++; fprintf(yyout, "%d\tEQ\t\t-\n", counter);}
+EMIT(EQ, 0);
 	YY_BREAK
 case 10:
 YY_RULE_SETUP
 #line 58 "lab1.l"
-{counter++; fprintf(yyout, "%d\tLR_BRAC\t\t-\n", counter);}
+EMIT(LR_BRAC, 0);
 	YY_BREAK
 case 11:
 YY_RULE_SETUP
 #line 59 "lab1.l"
-{counter++; fprintf(yyout, "%d\tRR_BRAC\t\t-\n", counter);}
+EMIT(RR_BRAC, 0);
 	YY_BREAK
 case 12:
 YY_RULE_SETUP
 #line 60 "lab1.l"
-{counter++; fprintf(yyout, "%d\tSEMIC\t\t-\n", counter);}
+EMIT(SEMIC, 0);
 	YY_BREAK
 case 13:
 YY_RULE_SETUP
 #line 61 "lab1.l"
-{counter++; fprintf(yyout, "%d\tPLUS\t\t-\n", counter);}
+EMIT(PLUS, 0);
 	YY_BREAK
 case 14:
 YY_RULE_SETUP
 #line 62 "lab1.l"
-{counter++; fprintf(yyout, "%d\tMINUS\t\t-\n", counter);}
+EMIT(MINUS, 0);
 	YY_BREAK
 case 15:
 YY_RULE_SETUP
 #line 63 "lab1.l"
-{counter++; fprintf(yyout, "%d\tMULTI\t\t-\n", counter);}
+EMIT(MULTI, 0);
 	YY_BREAK
 case 16:
 YY_RULE_SETUP
 #line 64 "lab1.l"
-{counter++; fprintf(yyout, "%d\tRDIV\t\t-\n", counter);}
+EMIT(RDIV, 0);
 	YY_BREAK
 case 17:
 YY_RULE_SETUP
 #line 65 "lab1.l"
-{counter++; fprintf(yyout, "%d\tIDN\t\t%s\n", counter, yytext);}
+EMIT(IDN, 0);
 	YY_BREAK
 case 18:
 YY_RULE_SETUP
 #line 66 "lab1.l"
-{counter++; fprintf(yyout, "%d\tINT10\t\t%d\n", counter, int10_analyze(yytext, yyleng));}
+EMIT(INT10, int10_analyze(yytext, yyleng));
 	YY_BREAK
 case 19:
 YY_RULE_SETUP
 #line 67 "lab1.l"
-{counter++; fprintf(yyout, "%d\tINT8\t\t%d\n", counter, int8_analyze(yytext, yyleng));}
+EMIT(INT8, int8_analyze(yytext, yyleng));
 	YY_BREAK
 case 20:
 YY_RULE_SETUP
 #line 68 "lab1.l"
-{counter++; fprintf(yyout, "%d\tINT16\t\t%d\n", counter, int16_analyze(yytext, yyleng));}
+EMIT(INT16, int16_analyze(yytext, yyleng));
 	YY_BREAK
 case 21:
 YY_RULE_SETUP
 #line 69 "lab1.l"
-{counter++; fprintf(yyout, "%d\tREAL10\t\t%lf\n", counter, real10_analyzer(yytext, yyleng));}
+EMIT(REAL10, real10_analyzer(yytext, yyleng));
 	YY_BREAK
 case 22:
 YY_RULE_SETUP
 #line 70 "lab1.l"
-{counter++; fprintf(yyout, "%d\tREAL16\t\t%lf\n", counter, real16_analyzer(yytext, yyleng));}
+EMIT(REAL16, real16_analyzer(yytext, yyleng));
 	YY_BREAK
 case 23:
 YY_RULE_SETUP
 #line 71 "lab1.l"
-{counter++; fprintf(yyout, "%d\tREAL8\t\t%lf\n", counter, real8_analyzer(yytext, yyleng));}
+EMIT(REAL8, real8_analyzer(yytext, yyleng));
 	YY_BREAK
 case 24:
 YY_RULE_SETUP
@@ -2024,6 +2030,108 @@ double real10_analyzer(char* text, int len){
     return num;
 }
 
+/* 内存扫描接口：直接在调用方的缓冲区上运行 yylex，不经过临时文件 */
+static char *scan_base = NULL;
+static double *scan_values = NULL;
+static int *scan_offsets = NULL;
+static int *scan_lengths = NULL;
+static int scan_count = 0;
+static int scan_capacity = 0;
+static int scan_done = 1;
+static YY_BUFFER_STATE scan_buffer = NULL;
+
+const char* token_name(int kind){
+    switch(kind){
+        case IDN: return "IDN";
+        case INT10: return "INT10";
+        case INT8: return "INT8";
+        case INT16: return "INT16";
+        case REAL10: return "REAL10";
+        case REAL8: return "REAL8";
+        case REAL16: return "REAL16";
+        case PLUS: return "PLUS";
+        case MINUS: return "MINUS";
+        case MULTI: return "MULTI";
+        case RDIV: return "RDIV";
+        case GT: return "GT";
+        case LT: return "LT";
+        case EQ: return "EQ";
+        case LR_BRAC: return "LR_BRAC";
+        case RR_BRAC: return "RR_BRAC";
+        case SEMIC: return "SEMIC";
+        case IF: return "IF";
+        case THEN: return "THEN";
+        case ELSE: return "ELSE";
+        case WHILE: return "WHILE";
+        case DO: return "DO";
+    }
+    return "UNKNOWN";
+}
+
+int emit_token(int kind, double value){
+    if(scan_kinds == NULL){
+        /* 文本模式：保持 lab1_output.txt 原有格式 */
+        switch(kind){
+            case IDN:
+                fprintf(yyout, "%d\t%s\t\t%s\n", counter, token_name(kind), yytext);
+                break;
+            case INT10: case INT8: case INT16:
+                fprintf(yyout, "%d\t%s\t\t%d\n", counter, token_name(kind), (int)value);
+                break;
+            case REAL10: case REAL8: case REAL16:
+                fprintf(yyout, "%d\t%s\t\t%lf\n", counter, token_name(kind), value);
+                break;
+            default:
+                fprintf(yyout, "%d\t%s\t\t-\n", counter, token_name(kind));
+        }
+        return 0;
+    }
+    scan_kinds[scan_count] = kind;
+    scan_values[scan_count] = value;
+    scan_offsets[scan_count] = (int)(yytext - scan_base);
+    scan_lengths[scan_count] = yyleng;
+    scan_count++;
+    return scan_count >= scan_capacity;
+}
+
+void lab1_scan_end(){
+    if(scan_buffer != NULL){
+        yy_delete_buffer(scan_buffer);
+        scan_buffer = NULL;
+    }
+    scan_base = NULL;
+    scan_done = 1;
+}
+
+/* buf 末尾必须带两个 '\0'，size 包含这两个字节 */
+int lab1_scan_begin(char* buf, int size){
+    lab1_scan_end();
+    scan_buffer = yy_scan_buffer(buf, (yy_size_t)size);
+    if(scan_buffer == NULL)
+        return -1;
+    scan_base = buf;
+    scan_done = 0;
+    counter = 0;
+    return 0;
+}
+
+/* 填充最多 capacity 个单词（种别码、数值、字节偏移、长度），返回实际个数，0 表示扫描结束 */
+int lab1_scan_next(int* kinds, double* values, int* offsets, int* lengths, int capacity){
+    if(scan_done || capacity <= 0)
+        return 0;
+    scan_kinds = kinds;
+    scan_values = values;
+    scan_offsets = offsets;
+    scan_lengths = lengths;
+    scan_count = 0;
+    scan_capacity = capacity;
+    if(yylex() == 0)
+        scan_done = 1;
+    scan_kinds = NULL;
+    return scan_count;
+}
+
+#ifndef LAB1_LIBRARY
 int main(){
     yyin=fopen("lab1_testset_wrong.txt","r");
     yyout=fopen("lab1_output.txt","w");
@@ -2034,4 +2142,4 @@ int main(){
     //getchar();
     return 0;
 }
-
+#endif
@@ -1,373 +1,952 @@
-import subprocess
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+
+import artifact
+import cfg
+import compile_cache
+import frontend
+import instrument
+import optimize
+import parallel
+import scanner
+from output_file import write_output_lines
+from tac import Code, BINARY_OPS, COMPARE_OPS, INVERTED, COPY, ADD, SUB, MUL, DIV, GOTO, LABEL, NONE, NO_LABEL, render
+from token_store import (TokenStore, convert_token, scan_text, type_code, SCAN_FORMATS, TYPE_NAMES, ID, NUMBER,
+                         OP, COMPARE, ASSIGN, END, WHILE, IF, THEN, ELSE, DO, LPAREN, RPAREN, SEMIC)
+
+SOURCE_FILE = 'lab1_testset_wrong.txt'
+
+
+def iter_lexer(lines):
+    # 逐行转换 lab1_output.txt 格式的单词，可以直接传入文件对象
+    for line in lines:
+        parts = line.strip().split()
+        if len(parts) == 3:
+            yield convert_token(parts[1], parts[2])
 
 
-def run_lexer():
-    try:
-        # 编译lab1.c
-        compile_result = subprocess.run(['gcc', 'lab1.c', '-o', 'lab1'], check=True, timeout=30)
-        print("Compilation succeeded.")
+def lexer(input_code):
+    with instrument.phase('lexer'):
+        tokens = TokenStore.from_lines(input_code.strip().split('\n'))
+    instrument.count('tokens', len(tokens))
+    return tokens
 
-        # 运行编译生成的可执行文件
-        run_result = subprocess.run(['./lab1'], check=True, timeout=30)
-        print("Execution succeeded.")
-    except subprocess.CalledProcessError as e:
-        print(f"An error occurred during compilation or execution: {e}")
-    except subprocess.TimeoutExpired:
-        print("Compilation or execution timed out.")
 
-def read_lab1_output():
-    # 读取lab1_output.txt文件的内容
-    with open('lab1_output.txt', 'r') as file:
-        return file.read()
+def scan_tokens(source):
+    # 在进程内调用 lab1 扫描器，不再经过 gcc、子进程和 lab1_output.txt
+    with instrument.phase('scanner'):
+        result = scanner.scan(source)
+    with instrument.phase('lexer'):
+        tokens = TokenStore.from_scan(result)
+    instrument.count('tokens', len(tokens))
+    return tokens
 
 
-def lexer(input_code):
-    tokens = []
-    for line in input_code.strip().split('\n'):
-        parts = line.strip().split()
-        if len(parts) == 3:
-            token_type = parts[1]
-            token_value = parts[2]
-            if token_type.startswith('INT'):
-                token_value = int(token_value)
-                token_type = 'NUMBER'
-            elif token_type == 'REAL10' or token_type == 'REAL16':
-                token_value = float(token_value)
-                token_type = 'NUMBER'
-            elif token_type == 'IDN':
-                token_type = 'ID'
-            elif token_type == 'PLUS':
-                token_value = '+'
-                token_type = 'OP'
-            elif token_type == 'MINUS':
-                token_value = '-'
-                token_type = 'OP'
-            elif token_type == 'MULTI':
-                token_value = '*'
-                token_type = 'OP'
-            elif token_type == 'RDIV':
-                token_value = '/'
-                token_type = 'OP'
-            elif token_type == 'GT':
-                token_value = '>'
-                token_type = 'COMPARE'
-            elif token_type == 'LT':
-                token_value = '<'
-                token_type = 'COMPARE'
-            elif token_type == 'EQ':
-                token_value = '='
-                token_type = 'ASSIGN'
-            elif token_type == 'SEMIC':
-                token_value = ';'
-                token_type = 'END'
-            elif token_type == 'WHILE':
-                token_value = 'while'
-                token_type = 'WHILE'
-            elif token_type == 'IF':
-                token_value = 'if'
-                token_type = 'IF'
-            elif token_type == 'THEN':
-                token_value = 'then'
-                token_type = 'THEN'
-            elif token_type == 'ELSE':
-                token_value = 'else'
-                token_type = 'ELSE'
-            elif token_type == 'DO':
-                token_value = 'do'
-                token_type = 'DO'
-            elif token_type == 'LR_BRAC':
-                token_value = '('
-                token_type = 'LPAREN'
-            elif token_type == 'RR_BRAC':
-                token_value = ')'
-                token_type = 'RPAREN'
-
-            tokens.append((token_type, token_value))
-    return tokens
+def iter_scan_tokens(source):
+    if isinstance(source, str):
+        source = source.encode('utf-8')
+    for kind, value, offset, length in scanner.iter_scan(source):
+        if kind == scanner.IDN:
+            value = source[offset:offset + length].decode('utf-8')
+        elif kind in SCAN_FORMATS:
+            value = scan_text(kind, value)
+        yield convert_token(scanner.TOKEN_NAMES[kind], value)
 
 
 class Parser:
-    def __init__(self, tokens):
+    # 是否一遍生成紧凑的代码：为 True 时不再做 process_three_address_code，
+    # 标签按需分配，编号不能由单词数出来（parallel 分组分析依赖这一点）
+    compact = False
+
+    def __init__(self, tokens, code=None):
+        # code 是输出的代码序列，默认新建一个，沿用单词的符号表
+        if tokens is not None and not isinstance(tokens, TokenStore):
+            tokens = TokenStore.from_tokens(tokens)
         self.tokens = tokens
+        if tokens is not None:
+            self.kinds = tokens.kinds
+            self.symbols = tokens.symbols
+            self.symbol_values = tokens.symbol_values
+            self.token_count = len(tokens)
+        if code is not None:
+            self.code = code
+        elif tokens is not None:
+            self.code = Code.from_tokens(tokens)
+        else:
+            self.code = Code()
         self.current_token_index = 0
         self.temp_count = 0
         self.label_count = 0
-        self.code = []
+        self.statement_count = 0
         self.generated_labels = set()
+        # 调试输出默认关闭，由 instrument 的 tracing 开关控制
+        self.tracing = instrument.tracing()
 
+    # 临时变量和标签都用整数编号，见 tac 模块中的操作数编码
     def new_temp(self):
         self.temp_count += 1
-        return f't{self.temp_count}'
+        return ~self.temp_count
 
     def new_label(self):
         self.label_count += 1
-        return f'L{self.label_count}'
+        return self.label_count
 
-    def gen(self, code):
-        self.code.append(code)
+    def gen(self, op, dst=NONE, src1=NONE, src2=NONE, label=0):
+        self.code.append(op, dst, src1, src2, label)
 
-    def gen_unique(self, code):
-        label = code.split(':')[0]
+    def emit_label(self, label):
         if label not in self.generated_labels:
-            self.code.append(code)
+            self.code.append(LABEL, NONE, NONE, NONE, label)
             self.generated_labels.add(label)
 
     def current_token(self):
-        if self.current_token_index < len(self.tokens):
+        if self.current_token_index < self.token_count:
             return self.tokens[self.current_token_index]
         else:
             return None, None
 
+    # 直接读取列，不为每个单词构造元组
+    def current_kind(self):
+        if self.current_token_index < self.token_count:
+            return self.kinds[self.current_token_index]
+        return None
+
+    def current_value(self):
+        if self.current_token_index < self.token_count:
+            return self.symbol_values[self.symbols[self.current_token_index]]
+        return None
+
+    def current_operand(self):
+        # 代码沿用单词的符号表，符号编号就是操作数
+        return self.symbols[self.current_token_index]
+
     def next_token(self):
         self.current_token_index += 1
 
     def parse(self):
-        while self.current_token_index < len(self.tokens):
-            print(f"Current Token: {self.current_token()}")
+        while self.current_token_index < self.token_count:
+            if self.tracing:
+                instrument.trace(f"Current Token: {self.current_token()}")
+            self.code.mark_statement(self.current_token_index)
             self.S()
         return self.code
 
     def S(self):
-        token_type, token_value = self.current_token()
-        print(f"Processing statement: {token_type}, {token_value}")
-        if token_type == 'ID':
-            id_place = token_value
+        kind = self.current_kind()
+        token_value = self.current_value()
+        self.statement_count += 1
+        if self.tracing:
+            instrument.trace(f"Processing statement: {self.current_token()[0]}, {token_value}")
+        if kind == ID:
+            id_place = self.current_operand()
             self.next_token()
-            if self.current_token()[0] == 'ASSIGN':
+            if self.current_kind() == ASSIGN:
                 self.next_token()
                 E_place = self.E()
-                self.gen(f'{id_place} := {E_place}')
-            elif self.current_token()[0] == 'SEMIC':
+                self.gen(COPY, id_place, E_place)
+            elif self.current_kind() == SEMIC:
                 self.next_token()
-        elif token_type == 'IF':
+        elif kind == IF:
             self.next_token()
             C_true = self.new_label()
             C_false = self.new_label()
             S_next = self.new_label()
             self.C(C_true, C_false)
-            if self.current_token()[0] == 'THEN':
+            if self.current_kind() == THEN:
                 self.next_token()
-                self.gen_unique(f'{C_true}:')
+                self.emit_label(C_true)
                 self.S()
-                self.gen(f'goto {S_next}')
-                if self.current_token()[0] == 'ELSE':
+                self.gen(GOTO, label=S_next)
+                if self.current_kind() == ELSE:
                     self.next_token()
-                    self.gen_unique(f'{C_false}:')
+                    self.emit_label(C_false)
                     self.S()
-                    self.gen_unique(f'{S_next}:')
+                    self.emit_label(S_next)
                 else:
-                    self.gen_unique(f'{C_false}:')
-                    self.gen_unique(f'{S_next}:')
+                    self.emit_label(C_false)
+                    self.emit_label(S_next)
             else:
                 raise SyntaxError("Missing then")
-        elif token_type == 'WHILE':
+        elif kind == WHILE:
             self.next_token()
             S_begin = self.new_label()
             C_true = self.new_label()
             C_false = self.new_label()
-            self.gen_unique(f'{S_begin}:')
+            self.emit_label(S_begin)
             self.C(C_true, C_false)
-            if self.current_token()[0] == 'DO':
+            if self.current_kind() == DO:
                 self.next_token()
-                self.gen_unique(f'{C_true}:')
+                self.emit_label(C_true)
                 self.S()
-                self.gen(f'goto {S_begin}')
-                self.gen_unique(f'{C_false}:')
+                self.gen(GOTO, label=S_begin)
+                self.emit_label(C_false)
             else:
                 raise SyntaxError("Missing do")
-        elif token_type == 'LPAREN':
+        elif kind == LPAREN:
             self.next_token()
             self.E()
-            if self.current_token()[0] == 'RPAREN':
+            if self.current_kind() == RPAREN:
                 self.next_token()
             else:
                 raise SyntaxError("Missing closing parenthesis")
-        elif token_type == 'END':
+        elif kind == END:
             self.next_token()
         else:
-            raise SyntaxError(f"Invalid statement: {token_type} at index {self.current_token_index}")
+            raise SyntaxError(f"Invalid statement: {self.current_token()[0]} at index {self.current_token_index}")
 
     def C(self, true_label, false_label):
         E1_place = self.E()
-        if self.current_token()[0] in ['COMPARE', 'ASSIGN']:
-            op = self.current_token()[1]
+        if self.current_kind() in (COMPARE, ASSIGN):
+            op = self.current_value()
             self.next_token()
             E2_place = self.E()
-            self.gen(f'if {E1_place} {op} {E2_place} goto {true_label}')
-            self.gen(f'goto {false_label}')
+            self.gen(COMPARE_OPS[op], NONE, E1_place, E2_place, true_label)
+            self.gen(GOTO, label=false_label)
         else:
             raise SyntaxError(
                 f"Invalid comparison operator: {self.current_token()} at index {self.current_token_index}")
 
     def E(self):
         T_place = self.T()
-        while self.current_token()[0] == 'OP' and self.current_token()[1] in ['+', '-']:
-            op = self.current_token()[1]
+        while self.current_kind() == OP and self.current_value() in ('+', '-'):
+            op = self.current_value()
             self.next_token()
             T1_place = self.T()
             E_place = self.new_temp()
-            self.gen(f'{E_place} := {T_place} {op} {T1_place}')
+            self.gen(BINARY_OPS[op], E_place, T_place, T1_place)
             T_place = E_place
         return T_place
 
     def T(self):
         F_place = self.F()
-        while self.current_token()[0] == 'OP' and self.current_token()[1] in ['*', '/']:
-            op = self.current_token()[1]
+        while self.current_kind() == OP and self.current_value() in ('*', '/'):
+            op = self.current_value()
             self.next_token()
             F1_place = self.F()
             T_place = self.new_temp()
-            self.gen(f'{T_place} := {F_place} {op} {F1_place}')
+            self.gen(BINARY_OPS[op], T_place, F_place, F1_place)
             F_place = T_place
         return F_place
 
     def F(self):
-        token_type, token_value = self.current_token()
-        if token_type == 'LPAREN':
+        kind = self.current_kind()
+        if kind == LPAREN:
             self.next_token()
             E_place = self.E()
-            if self.current_token()[0] == 'RPAREN':
+            if self.current_kind() == RPAREN:
                 self.next_token()
                 return E_place
             else:
                 raise SyntaxError("Missing closing parenthesis")
-        elif token_type in ['ID', 'NUMBER']:
+        elif kind == ID or kind == NUMBER:
+            operand = self.current_operand()
             self.next_token()
-            return token_value
+            return operand
         else:
             raise SyntaxError(f"Invalid factor: {self.current_token()} at index {self.current_token_index}")
-def process_three_address_code(tac):
-    # 如果 tac 是列表，将其转换为字符串
-    if isinstance(tac, list):
-        tac = '\n'.join(tac)
 
-    # 继续处理代码
-    lines = tac.strip().split('\n')
+class BackpatchParser(Parser):
+    # 回填式代码生成，文法与 Parser 相同，一遍生成紧凑的代码：
+    # 条件只生成一条条件取反的跳转（如 if a >= b goto L），条件成立时顺序执行；
+    # 目标未知的跳转先留空，记入 falselist/nextlist，目标确定后回填标签。
+    # 标签只在有跳转指向的位置生成，同一位置只有一个；跳到下一条指令的跳转和 goto 之后不可达的 goto 不生成，
+    # 所以不需要 process_three_address_code 再处理
+    compact = True
+
+    def __init__(self, tokens, code=None):
+        super().__init__(tokens, code)
+        # 目标是下一条生成的指令的跳转（指令下标），生成指令前才回填
+        self.pending = []
+
+    def gen(self, op, dst=NONE, src1=NONE, src2=NONE, label=NO_LABEL):
+        if self.pending:
+            self.resolve()
+        self.code.append(op, dst, src1, src2, label)
+
+    def jump(self, op, src1=NONE, src2=NONE):
+        # 生成目标留空的跳转，返回只含它的列表；紧跟在 goto 之后的 goto 不可达，不生成
+        code = self.code
+        if op == GOTO and not self.pending and code.ops and code.ops[-1] == GOTO:
+            return []
+        self.gen(op, NONE, src1, src2, NO_LABEL)
+        return [len(code) - 1]
+
+    def backpatch(self, jumps, label):
+        labels = self.code.labels
+        for index in jumps:
+            labels[index] = label
+
+    def here(self):
+        # 当前位置的标签：紧接在标签之后就沿用它，否则生成新标签
+        code = self.code
+        if code.ops and code.ops[-1] == LABEL:
+            return code.labels[-1]
+        label = self.new_label()
+        code.append(LABEL, NONE, NONE, NONE, label)
+        return label
 
-    # 存储原始标签到新标签的映射
-    label_map = {}
-    new_lines = []
-    previous_label = None
+    def resolve(self):
+        # 等待的跳转指向当前位置。末尾的跳转本来就跳到下一条指令，直接删掉
+        code = self.code
+        pending = self.pending
+        while pending and len(code) - 1 in pending:
+            pending.remove(len(code) - 1)
+            code.pop()
+        if pending:
+            self.backpatch(pending, self.here())
+        self.pending = []
 
-    # 第一次遍历，移除冗余标签
-    for line in lines:
-        stripped = line.strip()
-
-        if stripped.endswith(':'):
-            label = stripped[:-1]
-            if previous_label is not None:
-                # 发现连续的两个标签，将当前标签映射到之前的标签
-                label_map[label] = previous_label
-                #print(f"Removing redundant label: {label}")
+    def S(self):
+        # 顶层语句之后的跳转在语句末尾回填，每条顶层语句的代码是完整的（增量编译逐条分析）
+        self.pending = self.statement()
+        self.resolve()
+
+    def statement(self):
+        # 返回跳到语句之后的跳转列表。进入时等待的跳转指向语句开头，语句没有生成指令时并入返回的列表
+        kind = self.current_kind()
+        token_value = self.current_value()
+        self.statement_count += 1
+        if self.tracing:
+            instrument.trace(f"Processing statement: {self.current_token()[0]}, {token_value}")
+        nextlist = []
+        if kind == ID:
+            id_place = self.current_operand()
+            self.next_token()
+            if self.current_kind() == ASSIGN:
+                self.next_token()
+                E_place = self.E()
+                self.gen(COPY, id_place, E_place)
+            elif self.current_kind() == SEMIC:
+                self.next_token()
+        elif kind == IF:
+            self.next_token()
+            falselist = self.C()
+            if self.current_kind() != THEN:
+                raise SyntaxError("Missing then")
+            self.next_token()
+            nextlist = self.statement()
+            if self.current_kind() == ELSE:
+                self.next_token()
+                nextlist += self.jump(GOTO)
+                self.pending = falselist
+                nextlist += self.statement()
             else:
-                new_lines.append(line)
-                previous_label = label  # 更新之前的标签
-        else:
-            # 遇到非标签行，重置之前的标签
-            previous_label = None
-            new_lines.append(line)
-
-    # 第二次遍历，处理标签后面跟随的`goto`语句
-    i = 0
-    while i < len(new_lines) - 1:
-        current_line = new_lines[i].strip()
-        next_line = new_lines[i + 1].strip()
-
-        if current_line.endswith(':') and next_line.startswith('goto'):
-            label = current_line[:-1]
-            target_label = next_line.split()[-1]
-
-            # 添加映射
-            label_map[label] = target_label
-            #print(f"Replacing goto {label} with goto {target_label} and removing {label}: and {next_line}")
-
-            # 移除当前标签和接下来的`goto`语句
-            new_lines.pop(i)
-            new_lines.pop(i)
+                nextlist += falselist
+        elif kind == WHILE:
+            self.next_token()
+            if self.pending:
+                self.resolve()
+            S_begin = self.here()
+            falselist = self.C()
+            if self.current_kind() != DO:
+                raise SyntaxError("Missing do")
+            self.next_token()
+            self.backpatch(self.statement(), S_begin)
+            self.backpatch(self.jump(GOTO), S_begin)
+            nextlist = falselist
+        elif kind == LPAREN:
+            self.next_token()
+            self.E()
+            if self.current_kind() == RPAREN:
+                self.next_token()
+            else:
+                raise SyntaxError("Missing closing parenthesis")
+        elif kind == END:
+            self.next_token()
         else:
-            i += 1
-
-    # 解析标签映射的函数
-    def resolve_label(label):
-        seen_labels = set()
-        while label in label_map and label not in seen_labels:
-            seen_labels.add(label)
-            label = label_map[label]
-        return label
+            raise SyntaxError(f"Invalid statement: {self.current_token()[0]} at index {self.current_token_index}")
+        nextlist += self.pending
+        self.pending = []
+        return nextlist
 
-    # 最后一次遍历，根据标签映射调整`goto`语句
-    final_lines = []
-    for line in new_lines:
-        if 'goto' in line:
-            parts = line.split()
-            label = resolve_label(parts[-1])
-            final_lines.append(' '.join(parts[:-1]) + ' ' + label)
-        else:
-            final_lines.append(line)
-
-    # 在最终的行中识别所有剩余的标签
-    labels = set()
-    for line in final_lines:
-        stripped = line.strip()
-        if stripped.endswith(':'):
-            labels.add(stripped[:-1])
-
-    # 创建唯一的标签的排序列表
-    sorted_labels = sorted(labels)
-    new_label_mapping = {label: f"L{i+1}" for i, label in enumerate(sorted_labels)}
-
-    # 最后一遍遍历，用连续的标签替换原有标签
-    final_lines_sequential = []
-    for line in final_lines:
-        if line.strip().endswith(':'):
-            label = line.strip()[:-1]
-            final_lines_sequential.append(new_label_mapping[label] + ':')
-        elif 'goto' in line:
-            parts = line.split()
-            label = parts[-1]
-            final_lines_sequential.append('\t' + ' '.join(parts[:-1]) + ' ' + new_label_mapping[label])
-        else:
-            final_lines_sequential.append('\t' + line)  # 非标签行前面加一个tab
+    def C(self):
+        # 条件不成立时跳转，返回 falselist
+        E1_place = self.E()
+        if self.current_kind() in (COMPARE, ASSIGN):
+            op = self.current_value()
+            self.next_token()
+            E2_place = self.E()
+            return self.jump(INVERTED[COMPARE_OPS[op]], E1_place, E2_place)
+        raise SyntaxError(
+            f"Invalid comparison operator: {self.current_token()} at index {self.current_token_index}")
+
+
+class StreamingParser(Parser):
+    # 流式语法分析：单词来自生成器，只缓存一个向前看单词；
+    # 每处理完一条顶层语句就产出它的三地址代码，并丢弃已产出的部分
+    END_TOKEN = (None, None)
+
+    def __init__(self, tokens):
+        super().__init__(None)
+        self.tokens = iter(tokens)
+        self.read_lookahead()
+
+    def read_lookahead(self):
+        self.lookahead = next(self.tokens, self.END_TOKEN)
+        self.lookahead_kind = None if self.lookahead is self.END_TOKEN else type_code(self.lookahead[0])
+
+    def current_token(self):
+        return self.lookahead
+
+    def current_kind(self):
+        return self.lookahead_kind
+
+    def current_value(self):
+        return self.lookahead[1]
 
-    return '\n'.join(final_lines_sequential)
+    def current_operand(self):
+        return self.code.intern(self.lookahead[1])
 
-def analyze_and_generate_code(tokens):
+    def next_token(self):
+        self.current_token_index += 1
+        self.read_lookahead()
+
+    def statements(self):
+        while self.lookahead is not self.END_TOKEN:
+            if self.tracing:
+                instrument.trace(f"Current Token: {self.current_token()}")
+            self.S()
+            yield self.code
+            # 标签都是新分配的，不会跨顶层语句重复；各段共用一个符号表
+            self.code = self.code.derive()
+            self.generated_labels.clear()
+
+    def parse(self):
+        for fragment in self.statements():
+            yield from fragment
+
+
+# 运算符优先级，数值大的先归约
+PRECEDENCE = {ADD: 1, SUB: 1, MUL: 2, DIV: 2}
+
+# StackParser 工作栈中的任务
+TASK_S, TASK_IF_THEN_DONE, TASK_WHILE_DONE, TASK_LABEL = range(4)
+
+
+class StackParser(Parser):
+    # 与 Parser 文法和输出完全相同，但不使用 Python 调用栈：
+    # 语句用显式工作栈记录“子语句分析完之后还要做的事”，表达式用运算符栈做优先级归约，
+    # 因此嵌套深度不受递归深度限制。热路径直接读取单词列，减少方法调用
+
+    def parse(self):
+        while self.current_token_index < self.token_count:
+            if self.tracing:
+                instrument.trace(f"Current Token: {self.current_token()}")
+            self.code.mark_statement(self.current_token_index)
+            self.S()
+        return self.code
+
+    def kind_at(self, index):
+        return self.kinds[index] if index < self.token_count else None
+
+    def S(self):
+        kinds = self.kinds
+        symbols = self.symbols
+        count = self.token_count
+        gen = self.code.append
+        emit_label = self.emit_label
+        work = [(TASK_S,)]
+        while work:
+            task = work.pop()
+            action = task[0]
+            index = self.current_token_index
+            kind = kinds[index] if index < count else None
+
+            if action == TASK_IF_THEN_DONE:
+                _, C_false, S_next = task
+                gen(GOTO, NONE, NONE, NONE, S_next)
+                if kind == ELSE:
+                    self.current_token_index = index + 1
+                    emit_label(C_false)
+                    work.append((TASK_LABEL, S_next))
+                    work.append((TASK_S,))
+                else:
+                    emit_label(C_false)
+                    emit_label(S_next)
+                continue
+            if action == TASK_WHILE_DONE:
+                _, S_begin, C_false = task
+                gen(GOTO, NONE, NONE, NONE, S_begin)
+                emit_label(C_false)
+                continue
+            if action == TASK_LABEL:
+                emit_label(task[1])
+                continue
+
+            # TASK_S：分析一条语句的开头，遇到子语句时把后续任务压栈
+            self.statement_count += 1
+            if self.tracing:
+                instrument.trace(f"Processing statement: {self.current_token()[0]}, {self.current_value()}")
+            if kind == ID:
+                id_place = symbols[index]
+                index += 1
+                self.current_token_index = index
+                next_kind = kinds[index] if index < count else None
+                if next_kind == ASSIGN:
+                    self.current_token_index = index + 1
+                    E_place = self.E()
+                    gen(COPY, id_place, E_place, NONE, 0)
+                elif next_kind == SEMIC:
+                    self.current_token_index = index + 1
+            elif kind == IF:
+                self.current_token_index = index + 1
+                C_true = self.new_label()
+                C_false = self.new_label()
+                S_next = self.new_label()
+                self.C(C_true, C_false)
+                if self.kind_at(self.current_token_index) == THEN:
+                    self.current_token_index += 1
+                    emit_label(C_true)
+                    work.append((TASK_IF_THEN_DONE, C_false, S_next))
+                    work.append((TASK_S,))
+                else:
+                    raise SyntaxError("Missing then")
+            elif kind == WHILE:
+                self.current_token_index = index + 1
+                S_begin = self.new_label()
+                C_true = self.new_label()
+                C_false = self.new_label()
+                emit_label(S_begin)
+                self.C(C_true, C_false)
+                if self.kind_at(self.current_token_index) == DO:
+                    self.current_token_index += 1
+                    emit_label(C_true)
+                    work.append((TASK_WHILE_DONE, S_begin, C_false))
+                    work.append((TASK_S,))
+                else:
+                    raise SyntaxError("Missing do")
+            elif kind == LPAREN:
+                self.current_token_index = index + 1
+                self.E()
+                if self.kind_at(self.current_token_index) == RPAREN:
+                    self.current_token_index += 1
+                else:
+                    raise SyntaxError("Missing closing parenthesis")
+            elif kind == END:
+                self.current_token_index = index + 1
+            else:
+                raise SyntaxError(f"Invalid statement: {self.current_token()[0]} at index {index}")
+
+    def C(self, true_label, false_label):
+        E1_place = self.E()
+        index = self.current_token_index
+        if self.kind_at(index) in (COMPARE, ASSIGN):
+            op = self.symbol_values[self.symbols[index]]
+            self.current_token_index = index + 1
+            E2_place = self.E()
+            self.code.append(COMPARE_OPS[op], NONE, E1_place, E2_place, true_label)
+            self.code.append(GOTO, NONE, NONE, NONE, false_label)
+        else:
+            raise SyntaxError(
+                f"Invalid comparison operator: {self.current_token()} at index {self.current_token_index}")
+
+    def E(self):
+        kinds = self.kinds
+        symbols = self.symbols
+        values = self.symbol_values
+        count = self.token_count
+        index = self.current_token_index
+
+        # 最常见的情况：单个标识符或常数
+        kind = kinds[index] if index < count else None
+        if kind == ID or kind == NUMBER:
+            if index + 1 >= count or kinds[index + 1] != OP:
+                self.current_token_index = index + 1
+                return symbols[index]
+
+        # 运算符栈中的 None 表示左括号；同级运算符左结合，归约顺序与递归下降的 E/T/F 一致。
+        # 归约直接写在循环里，临时变量计数先放在局部变量中
+        gen = self.code.append
+        temp_count = self.temp_count
+        operands = []
+        operators = []
+        depth = 0
+        while True:
+            # 期待一个因子
+            kind = kinds[index] if index < count else None
+            if kind == LPAREN:
+                operators.append(None)
+                depth += 1
+                index += 1
+                continue
+            if kind == ID or kind == NUMBER:
+                operands.append(symbols[index])
+                index += 1
+            else:
+                self.temp_count = temp_count
+                self.current_token_index = index
+                raise SyntaxError(f"Invalid factor: {self.current_token()} at index {index}")
+
+            # 因子之后：运算符、右括号或表达式结束
+            while True:
+                kind = kinds[index] if index < count else None
+                op = BINARY_OPS.get(values[symbols[index]]) if kind == OP else None
+                precedence = PRECEDENCE.get(op)
+                if precedence is not None:
+                    while operators and operators[-1] is not None and PRECEDENCE[operators[-1]] >= precedence:
+                        right = operands.pop()
+                        temp_count += 1
+                        place = ~temp_count
+                        gen(operators.pop(), place, operands[-1], right, 0)
+                        operands[-1] = place
+                    operators.append(op)
+                    index += 1
+                    break
+
+                closing = kind == RPAREN and depth > 0
+                if not closing and depth == 0:
+                    # 表达式结束
+                    while operators:
+                        right = operands.pop()
+                        temp_count += 1
+                        place = ~temp_count
+                        gen(operators.pop(), place, operands[-1], right, 0)
+                        operands[-1] = place
+                    self.temp_count = temp_count
+                    self.current_token_index = index
+                    return operands[0]
+
+                # 归约到最内层左括号
+                while operators[-1] is not None:
+                    right = operands.pop()
+                    temp_count += 1
+                    place = ~temp_count
+                    gen(operators.pop(), place, operands[-1], right, 0)
+                    operands[-1] = place
+                if not closing:
+                    # 与递归下降一样，先归约完最内层括号中的表达式再报错
+                    self.temp_count = temp_count
+                    self.current_token_index = index
+                    raise SyntaxError("Missing closing parenthesis")
+                operators.pop()
+                depth -= 1
+                index += 1
+
+
+PARSERS = {'recursive': Parser, 'stack': StackParser, 'tree': frontend.TreeParser, 'backpatch': BackpatchParser}
+
+
+def process_three_address_code(code):
+    # 在控制流图上做跳转穿透，整个过程与指令数成线性关系，见 cfg.thread_jumps
+    processed_code = code.derive()
+    instructions, _, _ = cfg.thread_jumps(code)
+    processed_code.extend(instructions)
+    return processed_code
+
+
+def iter_process_three_address_code(fragments):
+    # process_three_address_code 的流式版本，输入按顶层语句分段，产出四元式。
+    # 跳转不会跨越顶层语句，只有上一段末尾的标签与下一段开头属于同一个块，
+    # 所以每段单独处理，末尾标签留给下一段输出
+    label_count = 0
+    tail = NO_LABEL
+    for fragment in fragments:
+        instructions, label_count, tail = cfg.thread_jumps(fragment, label_count, tail, hold_tail=True)
+        yield from instructions
+    if tail:
+        yield LABEL, NONE, NONE, NONE, tail
+
+
+def count_labels(code):
+    return code.ops.count(LABEL)
+
+
+def run_parser(tokens, parser_class=Parser, trees=None, jobs=1):
+    # trees 是列表时改用 frontend.TreeParser，语法树和代码由同一次分析得到（compact 的语法分析器除外）；
+    # jobs 大于 1 时按顶层语句分组，在多个进程中分析（不收集语法树）
+    with instrument.phase('parse'):
+        if trees is not None and not parser_class.compact:
+            parser = frontend.TreeParser(tokens, keep_trees=True)
+        elif jobs > 1:
+            parser = parallel.ParallelParser(tokens, parser_class, jobs)
+        else:
+            parser = parser_class(tokens)
+        code = parser.parse()
+    instrument.count('parse_jobs', parser.jobs_used if isinstance(parser, parallel.ParallelParser) else 1)
+    if trees is not None and parser_class.compact:
+        # 代码由紧凑代码的语法分析器生成，语法树另外构造
+        with instrument.phase('parse'):
+            trees.extend(frontend.parse_trees(tokens))
+    elif trees is not None:
+        trees.extend(parser.trees)
+    instrument.count('statements', parser.statement_count)
+    instrument.count('temps', parser.temp_count)
+    instrument.count('labels', parser.label_count)
+    instrument.count('instructions', len(code))
+    return code
+
+
+def record_removed(removed):
+    for name, count in removed.items():
+        instrument.count(f'removed_by_{name}', count)
+
+
+def run_optimizer(code, opt_level=0):
+    # 返回优化后的代码和每个优化遍删除的指令数
+    if not opt_level:
+        return code, {}
+    with instrument.phase('optimize'):
+        optimized_code, removed = optimize.optimize(code, opt_level)
+    record_removed(removed)
+    return optimized_code, removed
+
+
+def run_processing(code, opt_level=0, recycle_temps=False, compact=False):
+    # compact 时代码由 BackpatchParser 一遍生成，没有优化过就直接作为处理过的代码
+    optimized_code, removed = run_optimizer(code, opt_level)
+    if compact and not opt_level:
+        processed_code = optimized_code
+    else:
+        with instrument.phase('process'):
+            processed_code = process_three_address_code(optimized_code)
+    if instrument.enabled():
+        instrument.count('removed_labels', count_labels(optimized_code) - count_labels(processed_code))
+    if recycle_temps:
+        with instrument.phase('recycle'):
+            processed_code, before, after = optimize.recycle_temps(processed_code)
+        removed['recycle_temps'] = before - after
+        record_removed({'recycle_temps': before - after})
+        record_recycling(processed_code, removed)
+    return processed_code, removed
+
+
+def record_recycling(processed_code, removed):
+    # 重用后的临时变量个数从代码中数出来，原来的个数是它加上减少的个数，命中缓存时也能报告
+    if 'recycle_temps' in removed and instrument.enabled():
+        after = len({operand for column in (processed_code.dst, processed_code.src1, processed_code.src2)
+                     for operand in column if operand < NONE})
+        instrument.count('temps_before_recycling', after + removed['recycle_temps'])
+        instrument.count('temps_after_recycling', after)
+
+
+def compile_source(source, cache=None, parser_class=Parser, opt_level=0, trees=None, jobs=1, recycle_temps=False):
+    # 词法分析 -> 语法分析 -> 优化和三地址代码处理；有缓存时每个阶段按其输入内容的哈希复用结果。
+    # trees 是列表时还把每条顶层语句的语法树追加到其中（语法树不缓存）。语法树在之后的各阶段一直存活，
+    # 这时整个编译期间暂停循环垃圾回收，否则处理代码时触发的回收会反复扫描全部节点
+    if trees is None:
+        return compile_stages(source, cache, parser_class, opt_level, trees, jobs, recycle_temps)
+    with frontend.paused_gc():
+        return compile_stages(source, cache, parser_class, opt_level, trees, jobs, recycle_temps)
+
+
+def compile_stages(source, cache, parser_class, opt_level, trees, jobs, recycle_temps):
+    if isinstance(source, str):
+        source = source.encode('utf-8')
+    if cache is None:
+        tokens = scan_tokens(source)
+        if not tokens:
+            return tokens, Code(), Code()
+        code = run_parser(tokens, parser_class, trees, jobs)
+        return tokens, code, run_processing(code, opt_level, recycle_temps, parser_class.compact)[0]
+
+    key = cache.stage_key('tokens', compile_cache.digest(source))
+    with instrument.phase('cache'):
+        entry = cache.get('tokens', key)
+    if entry is None:
+        tokens = scan_tokens(source)
+        entry = (tokens, compile_cache.digest(*tokens.digest_parts()))
+        with instrument.phase('cache'):
+            cache.put(key, entry)
+    tokens, tokens_digest = entry
     if not tokens:
-        with open('output.txt', 'w') as file:
-            file.write("No tokens found. Please check the input file.\n")
+        return tokens, Code(), Code()
+
+    # 紧凑代码与其他语法分析器生成的代码不同，分开缓存
+    parse_input = compile_cache.digest(tokens_digest, 'compact') if parser_class.compact else tokens_digest
+    key = cache.stage_key('tac', parse_input)
+    with instrument.phase('cache'):
+        entry = cache.get('tac', key)
+    if entry is None:
+        code = run_parser(tokens, parser_class, trees, jobs)
+        entry = (code, compile_cache.digest(*code.digest_parts()))
+        with instrument.phase('cache'):
+            cache.put(key, entry)
+    elif trees is not None:
+        # 代码来自缓存，只构造语法树
+        with instrument.phase('parse'):
+            trees.extend(frontend.parse_trees(tokens))
+    code, code_digest = entry
+
+    options = [str(opt_level)]
+    if recycle_temps:
+        options.append('recycle_temps')
+    if parser_class.compact:
+        options.append('compact')
+    key = cache.stage_key('processed', compile_cache.digest(code_digest, *options))
+    with instrument.phase('cache'):
+        entry = cache.get('processed', key)
+    if entry is None:
+        entry = run_processing(code, opt_level, recycle_temps, parser_class.compact)
+        with instrument.phase('cache'):
+            cache.put(key, entry)
+    else:
+        # 命中缓存时也报告各优化遍删除的指令数
+        record_removed(entry[1])
+        record_recycling(*entry)
+    processed_code, _ = entry
+    return tokens, code, processed_code
+
+
+def write_output(tokens, code, processed_code, path='output.txt'):
+    with instrument.phase('output'):
+        write_output_file(tokens, code, processed_code, path)
+
+
+def write_output_file(tokens, code, processed_code, path):
+    # 四元式只在这里转换成文本
+    write_output_lines(tokens, code.lines(), processed_code.lines('\t'), path)
+
+
+def write_syntax_trees(trees, path):
+    if path == '-':
+        for tree in trees:
+            tree.write(sys.stdout)
+        return
+    with open(path, 'w') as file:
+        for tree in trees:
+            tree.write(file)
+
+
+def write_output_streaming(tokens, path='output.txt', opt_level=0):
+    # 单词、三地址代码边产生边写出；后两部分先写入临时文件，最后按原格式拼接。
+    # 优化逐条顶层语句进行，只用到语句内部的信息
+    tokens = iter(tokens)
+    first_token = next(tokens, None)
+    if first_token is None:
+        write_output([], Code(), Code(), path)
         return
 
-    # 输出词法分析结果
-    with open('output.txt', 'w') as file:
-        file.write("Tokens:\n")
+    def echo_tokens():
+        yield first_token
         for token in tokens:
             file.write(f"{token}\n")
+            yield token
 
-    # 语法分析和三地址代码生成
-    parser = Parser(tokens)
-    code = parser.parse()
+    def echo_fragments(parser):
+        for fragment in parser.statements():
+            instrument.count('instructions', len(fragment))
+            for line in fragment.lines():
+                raw_file.write(f"{line}\n")
+            yield run_optimizer(fragment, opt_level)[0]
+
+    with open(path, 'w') as file, tempfile.TemporaryFile('w+') as raw_file, \
+            tempfile.TemporaryFile('w+') as processed_file:
+        file.write("Tokens:\n")
+        file.write(f"{first_token}\n")
+        parser = StreamingParser(echo_tokens())
+        # 各段共用一个符号表
+        symbol_values = parser.code.symbol_values
+        for instruction in iter_process_three_address_code(echo_fragments(parser)):
+            processed_file.write(render(instruction, symbol_values, '\t') + '\n')
 
-    # 输出三地址代码
-    with open('output.txt', 'a') as file:
         file.write("Three Address Code:\n")
-        for line in code:
-            file.write(f"{line}\n")
+        raw_file.seek(0)
+        shutil.copyfileobj(raw_file, file)
 
         file.write("\n\n\nProcessed Code:\n")
-        processed_code = process_three_address_code(code)
-        file.write(f"{processed_code}\n")
+        processed_file.seek(0)
+        shutil.copyfileobj(processed_file, file)
 
-def main():
-    # 运行lab1.exe
-    run_lexer()
 
-    # 读取lab1_output.txt文件的内容
-    input_code = read_lab1_output()
+def analyze_and_generate_code(tokens, stream=False, parser_class=Parser, opt_level=0):
+    if stream:
+        with instrument.phase('stream'):
+            write_output_streaming(tokens, opt_level=opt_level)
+        return
+
+    if not tokens:
+        write_output(tokens, Code(), Code())
+        return
+
+    # 语法分析和三地址代码生成
+    code = run_parser(tokens, parser_class)
+    processed_code, _ = run_processing(code, opt_level, compact=parser_class.compact)
+
+    write_output(tokens, code, processed_code)
+
 
-    # 词法分析
-    tokens = lexer(input_code)
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--no-cache', action='store_true', help="disable the on-disk compile cache")
+    arg_parser.add_argument('--cache-dir', default=compile_cache.CACHE_DIR)
+    arg_parser.add_argument('--cache-size', type=int, default=compile_cache.MAX_BYTES, help="cache size limit in bytes")
+    arg_parser.add_argument('--cache-stats', action='store_true', help="print cache hit/miss counters")
+    arg_parser.add_argument('--parser', choices=sorted(PARSERS), default='recursive',
+                            help="recursive descent, an explicit-stack parser with no nesting limit, "
+                                 "code generated from the syntax tree, or compact code from one backpatching pass "
+                                 "that needs no processing")
+    arg_parser.add_argument('-j', '--jobs', type=int, default=1,
+                            help="parse groups of top-level statements in this many processes")
+    arg_parser.add_argument('--stream', action='store_true',
+                            help="stream tokens and code through the pipeline with bounded memory (bypasses the cache)")
+    arg_parser.add_argument('--profile', nargs='?', const='-', metavar='PATH',
+                            help="write a per-phase JSON report to PATH (default: stdout)")
+    arg_parser.add_argument('--profile-memory', action='store_true', help="sample peak memory per phase")
+    arg_parser.add_argument('--trace', action='store_true', help="print parser debug messages")
+    arg_parser.add_argument('-O', dest='opt_level', type=int, choices=sorted(optimize.LEVELS), default=0,
+                            help="optimization level: -O0 none, -O1 local passes, -O2 adds global constant propagation")
+    arg_parser.add_argument('--ast', metavar='PATH',
+                            help="also write the syntax tree to PATH ('-' for stdout), from the same parse as the code")
+    arg_parser.add_argument('--artifact', metavar='PATH',
+                            help="also write a binary, memory-mappable artifact to PATH and render output.txt from it")
+    arg_parser.add_argument('--recycle-temps', action='store_true',
+                            help="reuse temporary names whose live ranges do not overlap in the processed code")
+    arg_parser.add_argument('--opt-stats', action='store_true',
+                            help="print how many instructions each pass removed (for licm: hoisted, also per loop "
+                                 "as licm_L<back-edge label>), and temp counts with --recycle-temps")
+    args = arg_parser.parse_args()
+    if args.stream and args.ast:
+        arg_parser.error("--ast needs the whole program and cannot be combined with --stream")
+    if args.stream and args.recycle_temps:
+        arg_parser.error("--recycle-temps needs the whole program and cannot be combined with --stream")
+
+    instrumentation = None
+    if args.profile or args.profile_memory or args.trace or args.opt_stats:
+        instrumentation = instrument.Instrumentation(memory=args.profile_memory, tracing=args.trace)
+        instrument.install(instrumentation)
+    try:
+        run(args)
+    finally:
+        if instrumentation is not None and (args.profile or args.profile_memory):
+            instrumentation.dump(args.profile or '-')
+    if args.opt_stats:
+        removed = {name[len('removed_by_'):]: count for name, count in instrumentation.counters.items()
+                   if name.startswith('removed_by_')}
+        for name in ('temps_before_recycling', 'temps_after_recycling'):
+            if name in instrumentation.counters:
+                removed[name] = instrumentation.counters[name]
+        print(json.dumps(removed, indent=2))
+
+
+def run(args):
+    # 读取源程序
+    with open(SOURCE_FILE, 'rb') as file:
+        source = file.read()
+
+    if args.stream:
+        analyze_and_generate_code(iter_scan_tokens(source), stream=True, opt_level=args.opt_level)
+        return
 
-    analyze_and_generate_code(tokens)
+    cache = None if args.no_cache else compile_cache.CompileCache(args.cache_dir, args.cache_size)
+    trees = [] if args.ast else None
+    tokens, code, processed_code = compile_source(source, cache, PARSERS[args.parser], args.opt_level, trees,
+                                                  args.jobs, args.recycle_temps)
+    if trees is not None:
+        with instrument.phase('output'):
+            write_syntax_trees(trees, args.ast)
+    if args.artifact:
+        with instrument.phase('output'):
+            artifact.write_artifact(args.artifact, tokens, code, processed_code)
+            with artifact.Artifact(args.artifact) as compiled:
+                compiled.render()
+    else:
+        write_output(tokens, code, processed_code)
+
+    if cache is not None and args.cache_stats:
+        print(json.dumps(cache.stats(), indent=2))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,351 @@
+import ctypes
+import math
+import os
+import subprocess
+import time
+
+import cfg
+import compile_cache
+import instrument
+import interpreter
+import python_backend
+from tac import COPY, ADD, SUB, MUL, DIV, GOTO, JUMPS, NONE, OP_SYMBOLS
+from interpreter import DEFAULT_MAX_STEPS, ExecutionResult
+
+# 三地址代码 -> C 函数，gcc -O2 编译成共享库后用 ctypes 调用。
+# 标签就是 C 标签，跳转就是 goto；变量和临时变量是有类型的局部变量：
+# 常数的类型来自 INT*/REAL* 单词（Python 的 int/float），运算结果按操作数推出，整个程序中每个变量只有一种类型。
+# 整数运算溢出、变量在不同位置类型不同（如先是整数后是浮点数）时与 Python 的语义不一致，改用 python_backend 执行
+
+NATIVE_DIR = os.path.join(compile_cache.CACHE_DIR, 'native')
+GCC_FLAGS = ['-O2', '-shared', '-fPIC']
+ENTRY_POINT = 'tac_program'
+# 内存中缓存的已加载程序个数上限
+MAX_CACHED = 128
+
+# 变量的类型；MIXED 表示程序中它既可能是整数又可能是浮点数
+INT, REAL, MIXED = 1, 2, 3
+C_TYPES = {INT: 'long long', REAL: 'double'}
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+# 生成的函数的返回值
+FINISHED, OUT_OF_STEPS, DIVIDE_BY_ZERO, OVERFLOW = range(4)
+OVERFLOW_BUILTINS = {ADD: '__builtin_add_overflow', SUB: '__builtin_sub_overflow', MUL: '__builtin_mul_overflow'}
+COMPARISONS = python_backend.COMPARISONS
+
+_programs = {}
+
+
+class Unsupported(Exception):
+    pass
+
+
+def join(a, b):
+    return b if a is None or a == b else MIXED
+
+
+def live_at_entry(blocks, successors, predecessors):
+    # 从程序入口出发、可能在赋值之前就被读的变量和临时变量
+    used = []
+    defined = []
+    for block in blocks:
+        block_used = set()
+        block_defined = set()
+        for _, dst, src1, src2, _ in reversed(block.instructions):
+            if dst != NONE:
+                block_defined.add(dst)
+                block_used.discard(dst)
+            for src in (src1, src2):
+                if src != NONE:
+                    block_used.add(src)
+        used.append(block_used)
+        defined.append(block_defined)
+    live_in = [set() for _ in blocks]
+    worklist = list(range(len(blocks)))
+    pending = bytearray([1]) * len(blocks)
+    while worklist:
+        index = worklist.pop()
+        pending[index] = 0
+        out = set()
+        for successor in successors[index]:
+            out |= live_in[successor]
+        new_in = used[index] | (out - defined[index])
+        if new_in != live_in[index]:
+            live_in[index] = new_in
+            for predecessor in predecessors[index]:
+                if not pending[predecessor]:
+                    pending[predecessor] = 1
+                    worklist.append(predecessor)
+    return live_in[0] if blocks else set()
+
+
+def infer_types(code, graph, real_inputs):
+    # 返回 操作数 -> INT/REAL。入口处的类型：real_inputs 中的变量是浮点数，其余变量和临时变量是整数 0；
+    # 只有入口处就活跃的才把入口类型算进去。有 MIXED 时抛出 Unsupported
+    symbol_values = code.symbol_values
+    blocks = graph.blocks
+    count = len(blocks)
+    successors = [graph.successors(index) for index in range(count)]
+    predecessors = [[] for _ in blocks]
+    for index in range(count):
+        for successor in successors[index]:
+            predecessors[successor].append(index)
+
+    def entry_type(operand):
+        return REAL if operand >= 0 and symbol_values[operand] in real_inputs else INT
+
+    types = {}
+    operands = {operand for instruction in code for operand in instruction[1:4] if operand != NONE}
+    for operand in operands:
+        value = symbol_values[operand] if operand >= 0 else None
+        if isinstance(value, float):
+            types[operand] = REAL
+        elif isinstance(value, int):
+            if not INT64_MIN <= value <= INT64_MAX:
+                raise Unsupported(f"constant {value} does not fit in 64 bits")
+            types[operand] = INT
+    for operand in live_at_entry(blocks, successors, predecessors):
+        types.setdefault(operand, entry_type(operand))
+
+    instructions = [instruction for block in blocks for instruction in block.instructions
+                    if instruction[1] != NONE]
+    changed = True
+    while changed:
+        changed = False
+        for op, dst, src1, src2, _ in instructions:
+            left = types.get(src1)
+            right = left if op == COPY else types.get(src2)
+            if left is None or right is None:
+                continue
+            result = MIXED if MIXED in (left, right) else REAL if REAL in (left, right) else INT
+            new = join(types.get(dst), result)
+            if new != types.get(dst):
+                types[dst] = new
+                changed = True
+    # 只出现在不可达代码中的
+    for operand in operands:
+        types.setdefault(operand, entry_type(operand))
+    for operand, kind in types.items():
+        if kind == MIXED:
+            name = f't{~operand}' if operand < NONE else symbol_values[operand]
+            raise Unsupported(f"{name} holds both integers and reals")
+    return types
+
+
+def c_literal(value):
+    if isinstance(value, float):
+        if math.isnan(value):
+            return 'NAN'
+        if math.isinf(value):
+            return 'HUGE_VAL' if value > 0 else '(-HUGE_VAL)'
+        return value.hex()
+    if value == INT64_MIN:
+        return f'({INT64_MIN + 1}LL - 1)'
+    return f'{value}LL'
+
+
+def generate_c(code, real_inputs=frozenset()):
+    # 返回 (C 源程序, 变量名列表)。入口函数
+    #   int tac_program(long long *ints, double *reals, unsigned char *kinds, long long max_steps, long long *steps)
+    # 第 i 个变量的初值在 ints[i] 或 reals[i]，kinds[i] 为 INT/REAL；返回时写回最终值和类型
+    symbol_values = code.symbol_values
+    graph = cfg.ControlFlowGraph(code)
+    blocks = graph.blocks
+    types = infer_types(code, graph, real_inputs)
+    variables = sorted({symbol_values[operand] for operand in types
+                        if operand >= 0 and isinstance(symbol_values[operand], str)})
+    variable_ids = {name: code.symbol_ids[(str, name)] for name in variables}
+    temps = sorted(operand for operand in types if operand < NONE)
+
+    def local(operand):
+        if operand < NONE:
+            return f't{~operand}'
+        value = symbol_values[operand]
+        if isinstance(value, str):
+            return f'v{operand}'
+        return c_literal(value)
+
+    def as_type(operand, kind):
+        text = local(operand)
+        return f'(double){text}' if kind == REAL and types[operand] == INT else text
+
+    # 入口类型与程序中的类型不同的变量只在赋值之后才有新类型的值，用 assigned_ 标记是否赋值过
+    entry_types = {name: REAL if name in real_inputs else INT for name in variables}
+    flagged = {variable_ids[name] for name in variables if types[variable_ids[name]] != entry_types[name]}
+
+    lines = ['#include <math.h>', '',
+             f'int {ENTRY_POINT}(long long *ints, double *reals, unsigned char *kinds, long long max_steps, '
+             'long long *steps_out)', '{']
+    for index, name in enumerate(variables):
+        operand = variable_ids[name]
+        kind = types[operand]
+        if operand in flagged:
+            lines.append(f'    {C_TYPES[kind]} {local(operand)} = 0;')
+            lines.append(f'    int assigned_{operand} = 0;')
+        else:
+            source = 'ints' if kind == INT else 'reals'
+            lines.append(f'    {C_TYPES[kind]} {local(operand)} = {source}[{index}];')
+    for operand in temps:
+        lines.append(f'    {C_TYPES[types[operand]]} {local(operand)} = 0;')
+    lines.append('    long long steps = 0;')
+    lines.append(f'    int status = {FINISHED};')
+
+    # 每个块进入时检查剩下的步数够不够执行整个块，够时累加它的指令数；
+    # 不够时返回 OUT_OF_STEPS，由 NativeProgram.run 改用 python_backend 执行到与解释器相同的指令
+    targeted = bytearray(len(blocks))
+    if blocks:
+        targeted[0] = 1
+    for block in blocks:
+        jump = block.terminator()
+        if jump is not None:
+            targeted[graph.target(jump[4])] = 1
+    for index, block in enumerate(blocks):
+        if targeted[index]:
+            lines.extend(f'L{label}:' for label in block.labels)
+        if block.instructions:
+            lines.append(f'    if (steps > max_steps - {len(block.instructions)}) goto out_of_steps;')
+            lines.append(f'    steps += {len(block.instructions)};')
+        for op, dst, src1, src2, label in block.instructions:
+            if op == GOTO:
+                lines.append(f'    goto L{label};')
+            elif op in JUMPS:
+                kind = REAL if REAL in (types[src1], types[src2]) else INT
+                lines.append(f'    if ({as_type(src1, kind)} {COMPARISONS[op]} {as_type(src2, kind)}) goto L{label};')
+            else:
+                kind = types[dst]
+                target = local(dst)
+                if op == COPY:
+                    lines.append(f'    {target} = {local(src1)};')
+                elif op == DIV:
+                    left, right = as_type(src1, kind), as_type(src2, kind)
+                    lines.append(f'    if ({local(src2)} == 0) goto divide_by_zero;')
+                    if kind == INT:
+                        lines.append(f'    if ({right} == -1 && {left} == {c_literal(INT64_MIN)}) goto overflow;')
+                    lines.append(f'    {target} = {left} / {right};')
+                elif kind == INT:
+                    lines.append(f'    if ({OVERFLOW_BUILTINS[op]}({local(src1)}, {local(src2)}, &{target})) '
+                                 'goto overflow;')
+                else:
+                    lines.append(f'    {target} = {as_type(src1, kind)} {OP_SYMBOLS[op]} {as_type(src2, kind)};')
+                if dst in flagged:
+                    lines.append(f'    assigned_{dst} = 1;')
+        if index + 1 == len(blocks) and block.falls_through():
+            lines.append('    goto finish;')
+    if not blocks:
+        lines.append('    goto finish;')
+
+    lines += ['out_of_steps:', f'    status = {OUT_OF_STEPS};', '    goto finish;',
+              'divide_by_zero:', f'    status = {DIVIDE_BY_ZERO};', '    goto finish;',
+              'overflow:', f'    status = {OVERFLOW};',
+              'finish:', '    *steps_out = steps;']
+    for index, name in enumerate(variables):
+        operand = variable_ids[name]
+        kind = types[operand]
+        store = (f'ints[{index}] = {local(operand)};' if kind == INT else f'reals[{index}] = {local(operand)};')
+        store += f' kinds[{index}] = {kind};'
+        if operand in flagged:
+            lines.append(f'    if (assigned_{operand}) {{ {store} }}')
+        else:
+            lines.append(f'    {store}')
+    lines += ['    return status;', '}']
+    return '\n'.join(lines) + '\n', variables
+
+
+def build_library(source, key):
+    # 同一个 key 只编译一次；先写到临时文件再改名，并发编译同一个程序也安全
+    os.makedirs(NATIVE_DIR, exist_ok=True)
+    library_path = os.path.join(NATIVE_DIR, f'{key}.so')
+    if os.path.exists(library_path):
+        return library_path
+    source_path = os.path.join(NATIVE_DIR, f'{key}.{os.getpid()}.c')
+    temp_path = f'{library_path}.{os.getpid()}.tmp'
+    with open(source_path, 'w') as file:
+        file.write(source)
+    try:
+        with instrument.phase('gcc'):
+            subprocess.run(['gcc', *GCC_FLAGS, source_path, '-o', temp_path, '-lm'], check=True, timeout=600)
+        os.replace(temp_path, library_path)
+    finally:
+        os.remove(source_path)
+    return library_path
+
+
+def load_program(code, real_inputs, digest=None):
+    # 按程序内容、浮点数初值的变量和代码生成器本身的哈希缓存共享库；不支持的程序返回 None
+    if digest is None:
+        digest = compile_cache.digest(*code.digest_parts())
+    key = compile_cache.digest(digest, *sorted(real_inputs), compile_cache.files_digest(['native_backend.py']),
+                               *GCC_FLAGS)
+    program = _programs.pop(key, None)
+    if program is None:
+        try:
+            with instrument.phase('codegen'):
+                source, variables = generate_c(code, real_inputs)
+        except Unsupported:
+            program = None
+        else:
+            function = ctypes.CDLL(build_library(source, key))[ENTRY_POINT]
+            function.argtypes = [ctypes.POINTER(ctypes.c_longlong), ctypes.POINTER(ctypes.c_double),
+                                 ctypes.POINTER(ctypes.c_ubyte), ctypes.c_longlong, ctypes.POINTER(ctypes.c_longlong)]
+            function.restype = ctypes.c_int
+            program = (function, variables)
+        if len(_programs) >= MAX_CACHED:
+            del _programs[next(iter(_programs))]
+    _programs[key] = program
+    return program
+
+
+# 与 interpreter.Executable 接口相同
+class NativeProgram:
+    def __init__(self, code):
+        self.code = code
+        self.digest = compile_cache.digest(*code.digest_parts())
+        self.variables = {value for value in code.symbol_values if isinstance(value, str)}
+
+    def run(self, bindings=None, max_steps=DEFAULT_MAX_STEPS):
+        bindings = {name: value for name, value in (bindings or {}).items() if name in self.variables}
+        real_inputs = frozenset(name for name, value in bindings.items() if isinstance(value, float))
+        if any(isinstance(value, int) and not INT64_MIN <= value <= INT64_MAX for value in bindings.values()):
+            program = None
+        else:
+            program = load_program(self.code, real_inputs, self.digest)
+        if program is None:
+            return self.fallback(bindings, max_steps)
+
+        function, variables = program
+        count = len(variables)
+        ints = (ctypes.c_longlong * count)()
+        reals = (ctypes.c_double * count)()
+        kinds = (ctypes.c_ubyte * count)()
+        for index, name in enumerate(variables):
+            value = bindings.get(name, 0)
+            if isinstance(value, float):
+                reals[index] = value
+                kinds[index] = REAL
+            else:
+                ints[index] = value
+                kinds[index] = INT
+        steps = ctypes.c_longlong()
+        start = time.perf_counter()
+        with instrument.phase('execute'):
+            status = function(ints, reals, kinds, max_steps, ctypes.byref(steps))
+        seconds = time.perf_counter() - start
+        if status == DIVIDE_BY_ZERO:
+            raise ZeroDivisionError("division by zero")
+        if status == OVERFLOW:
+            # 结果超出 64 位整数，按 Python 的整数重新执行
+            return self.fallback(bindings, max_steps)
+        if status == OUT_OF_STEPS and steps.value < max_steps:
+            # 步数在一个块中间用完；块开头正好用完时与解释器停在同一条指令，不用重新执行
+            return self.fallback(bindings, max_steps)
+        instrument.count('executed_instructions', steps.value)
+        values = {name: reals[index] if kinds[index] == REAL else ints[index] for index, name in enumerate(variables)}
+        return ExecutionResult(values, steps.value, seconds, status == FINISHED)
+
+    def fallback(self, bindings, max_steps):
+        instrument.count('native_fallbacks', 1)
+        return python_backend.CompiledProgram(self.code).run(bindings, max_steps)
+
+
+if __name__ == "__main__":
+    raise SystemExit(interpreter.main_run(NativeProgram))
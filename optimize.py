@@ -0,0 +1,521 @@
+import heapq
+import math
+
+import cfg
+from tac import (COPY, DIV, GOTO, LABEL, JUMPS, BINARY, COMMUTATIVE, NONE, NO_LABEL, compare, evaluate)
+
+# 各优化级别依次运行的优化遍
+LEVELS = {
+    0: [],
+    1: ['constants', 'copies', 'cse', 'copies', 'dce'],
+    2: ['global_constants', 'copies', 'cse', 'licm', 'copies', 'dce'],
+}
+# -O2 重复整条流水线直到代码不再变化，最多这么多轮
+MAX_ROUNDS = 4
+
+
+def join_blocks(code, blocks):
+    result = code.derive()
+    for block in blocks:
+        for label in block.labels:
+            result.append(LABEL, NONE, NONE, NONE, label)
+        result.extend(block.instructions)
+    return result
+
+
+def fold_block(instructions, code, env):
+    # 常数折叠和块内常数传播；env 是 操作数 -> 常数操作数，结束时为块出口处的常数
+    is_constant = code.is_constant
+    value = code.value
+    output = []
+    for op, dst, src1, src2, label in instructions:
+        src1 = env.get(src1, src1)
+        src2 = env.get(src2, src2)
+        if op in BINARY:
+            result = None
+            if is_constant(src1) and is_constant(src2) and not (op == DIV and value(src2) == 0):
+                result = evaluate(op, value(src1), value(src2))
+                if isinstance(result, float) and not math.isfinite(result):
+                    result = None
+            if result is not None:
+                op, src1, src2 = COPY, code.intern(result), NONE
+        elif op in JUMPS and op != GOTO and is_constant(src1) and is_constant(src2):
+            # 条件恒真变成 goto，恒假则删除，执行落到后面的 goto
+            if compare(op, value(src1), value(src2)):
+                output.append((GOTO, NONE, NONE, NONE, label))
+            continue
+        if dst != NONE:
+            if op == COPY and is_constant(src1):
+                env[dst] = src1
+            else:
+                env.pop(dst, None)
+        output.append((op, dst, src1, src2, label))
+    return output
+
+
+def fold_constants(code):
+    blocks = cfg.build_blocks(code)
+    for block in blocks:
+        block.instructions = fold_block(block.instructions, code, {})
+    return join_blocks(code, blocks)
+
+
+def propagate_global_constants(code):
+    # 在控制流图上求每个块入口处值为常数的变量，再用它做块内折叠
+    graph = cfg.ControlFlowGraph(code)
+    blocks = graph.blocks
+    reachable = graph.reachable()
+    successors = [graph.successors(index) if reachable[index] else [] for index in range(len(blocks))]
+    predecessors = [[] for _ in blocks]
+    for index in range(len(blocks)):
+        for successor in successors[index]:
+            predecessors[successor].append(index)
+
+    # None 表示还没有算过，不参与交汇
+    outs = [None] * len(blocks)
+
+    def entry_env(index):
+        if index == 0:
+            return {}
+        env = None
+        for predecessor in predecessors[index]:
+            out = outs[predecessor]
+            if out is None:
+                continue
+            if env is None:
+                env = dict(out)
+            else:
+                for operand in [operand for operand in env if out.get(operand) != env[operand]]:
+                    del env[operand]
+        return env if env is not None else {}
+
+    # 工作表算法，按程序顺序取块；临时变量只在块内使用，不传出块
+    worklist = [index for index in reversed(range(len(blocks))) if reachable[index]]
+    pending = bytearray(len(blocks))
+    for index in worklist:
+        pending[index] = 1
+    while worklist:
+        index = worklist.pop()
+        pending[index] = 0
+        env = entry_env(index)
+        fold_block(blocks[index].instructions, code, env)
+        env = {operand: constant for operand, constant in env.items() if operand >= 0}
+        if env != outs[index]:
+            outs[index] = env
+            for successor in successors[index]:
+                if not pending[successor]:
+                    pending[successor] = 1
+                    worklist.append(successor)
+
+    for index, block in enumerate(blocks):
+        if reachable[index]:
+            block.instructions = fold_block(block.instructions, code, entry_env(index))
+    return join_blocks(code, blocks)
+
+
+def propagate_copies(code):
+    # 先把 “t := a op b; x := t” 合并成 “x := a op b”（t 只在这里用到），再做块内复写传播
+    uses = {}
+    for _, _, src1, src2, _ in code:
+        if src1 < NONE:
+            uses[src1] = uses.get(src1, 0) + 1
+        if src2 < NONE:
+            uses[src2] = uses.get(src2, 0) + 1
+
+    blocks = cfg.build_blocks(code)
+    for block in blocks:
+        merged = []
+        for instruction in block.instructions:
+            op, dst, src1, src2, label = instruction
+            if op == COPY and src1 < NONE and uses[src1] == 1 and merged and merged[-1][1] == src1:
+                previous = merged[-1]
+                merged[-1] = (previous[0], dst, previous[2], previous[3], previous[4])
+                continue
+            merged.append(instruction)
+
+        copies = {}
+        copied_to = {}
+        output = []
+        for op, dst, src1, src2, label in merged:
+            src1 = copies.get(src1, src1)
+            src2 = copies.get(src2, src2)
+            if dst != NONE:
+                # dst 被重新赋值，以它为源或目的的复写都失效
+                source = copies.pop(dst, None)
+                if source is not None:
+                    copied_to[source].discard(dst)
+                for target in copied_to.pop(dst, ()):
+                    copies.pop(target, None)
+                if op == COPY and src1 != dst:
+                    copies[dst] = src1
+                    copied_to.setdefault(src1, set()).add(dst)
+            output.append((op, dst, src1, src2, label))
+        block.instructions = output
+    return join_blocks(code, blocks)
+
+
+def eliminate_common_subexpressions(code):
+    # 块内公共子表达式：已经算过且操作数、结果都没有被改写的表达式换成复写
+    blocks = cfg.build_blocks(code)
+    for block in blocks:
+        available = {}
+        depends = {}
+        output = []
+        for instruction in block.instructions:
+            op, dst, src1, src2, label = instruction
+            key = None
+            if op in BINARY:
+                key = (op, src2, src1) if op in COMMUTATIVE and src2 < src1 else (op, src1, src2)
+                holder = available.get(key)
+                if holder is not None:
+                    instruction = (COPY, dst, holder, NONE, NO_LABEL)
+                    key = None
+            if dst != NONE:
+                for stale in depends.pop(dst, ()):
+                    available.pop(stale, None)
+                if key is not None and dst != src1 and dst != src2:
+                    available[key] = dst
+                    for operand in (src1, src2, dst):
+                        depends.setdefault(operand, []).append(key)
+            output.append(instruction)
+        block.instructions = output
+    return join_blocks(code, blocks)
+
+
+def eliminate_dead_code(code):
+    # 活跃变量分析：程序结束时所有变量都活跃，临时变量都不活跃；删除结果不再被用到的赋值
+    constants = [not isinstance(value, str) for value in code.symbol_values]
+
+    def is_value(operand):
+        return operand != NONE and (operand < NONE or not constants[operand])
+
+    graph = cfg.ControlFlowGraph(code)
+    blocks = graph.blocks
+    count = len(blocks)
+    successors = [graph.successors(index) for index in range(count)]
+    predecessors = [[] for _ in blocks]
+    for index in range(count):
+        for successor in successors[index]:
+            predecessors[successor].append(index)
+
+    # 每个块的 使用（先用后定义）和 定义
+    used = []
+    defined = []
+    for block in blocks:
+        block_used = set()
+        block_defined = set()
+        for _, dst, src1, src2, _ in reversed(block.instructions):
+            if dst != NONE:
+                block_defined.add(dst)
+                block_used.discard(dst)
+            if is_value(src1):
+                block_used.add(src1)
+            if is_value(src2):
+                block_used.add(src2)
+        used.append(block_used)
+        defined.append(block_defined)
+
+    exit_live = {operand for instruction in code for operand in (instruction[1], instruction[2], instruction[3])
+                 if operand >= 0 and not constants[operand]}
+    live_in = [set() for _ in blocks]
+    live_out = [set() for _ in blocks]
+    worklist = list(range(count))
+    pending = bytearray([1]) * count
+    while worklist:
+        index = worklist.pop()
+        pending[index] = 0
+        # 最后一个块执行完就是程序结束
+        out = set(exit_live) if index == count - 1 and blocks[index].falls_through() else set()
+        for successor in successors[index]:
+            out |= live_in[successor]
+        live_out[index] = out
+        new_in = used[index] | (out - defined[index])
+        if new_in != live_in[index]:
+            live_in[index] = new_in
+            for predecessor in predecessors[index]:
+                if not pending[predecessor]:
+                    pending[predecessor] = 1
+                    worklist.append(predecessor)
+
+    for index, block in enumerate(blocks):
+        live = set(live_out[index])
+        output = []
+        for instruction in reversed(block.instructions):
+            _, dst, src1, src2, _ = instruction
+            if dst != NONE:
+                if dst not in live:
+                    continue
+                live.discard(dst)
+            if is_value(src1):
+                live.add(src1)
+            if is_value(src2):
+                live.add(src2)
+            output.append(instruction)
+        output.reverse()
+        block.instructions = output
+    return join_blocks(code, blocks)
+
+
+def block_edges(graph):
+    count = len(graph.blocks)
+    successors = [graph.successors(index) for index in range(count)]
+    predecessors = [[] for _ in range(count)]
+    for index in range(count):
+        for successor in successors[index]:
+            predecessors[successor].append(index)
+    return successors, predecessors
+
+
+def live_temps(blocks, successors, predecessors):
+    # 每个块入口、出口活跃的临时变量；程序结束时临时变量都不活跃
+    count = len(blocks)
+    used = []
+    defined = []
+    for block in blocks:
+        block_used = set()
+        block_defined = set()
+        for _, dst, src1, src2, _ in reversed(block.instructions):
+            if dst < NONE:
+                block_defined.add(dst)
+                block_used.discard(dst)
+            if src1 < NONE:
+                block_used.add(src1)
+            if src2 < NONE:
+                block_used.add(src2)
+        used.append(block_used)
+        defined.append(block_defined)
+
+    live_in = [set() for _ in blocks]
+    live_out = [set() for _ in blocks]
+    worklist = list(range(count))
+    pending = bytearray([1]) * count
+    while worklist:
+        index = worklist.pop()
+        pending[index] = 0
+        out = set()
+        for successor in successors[index]:
+            out |= live_in[successor]
+        live_out[index] = out
+        new_in = used[index] | (out - defined[index])
+        if new_in != live_in[index]:
+            live_in[index] = new_in
+            for predecessor in predecessors[index]:
+                if not pending[predecessor]:
+                    pending[predecessor] = 1
+                    worklist.append(predecessor)
+    return live_in, live_out
+
+
+def recycle_temps(code):
+    # 按活跃区间重用临时变量编号，返回新代码、原来和现在的临时变量个数。
+    # 先在控制流图上求每个块入口、出口活跃的临时变量（while 的回边使循环中的变量一直活跃），
+    # 每个临时变量的区间是它的定义、使用位置以及活跃的块边界的范围，再按区间起点线性扫描分配编号。
+    # 第 i 条指令读操作数的位置是 2i，写结果的位置是 2i + 1，所以 “t3 := t1 + t2” 中的 t3 可以沿用 t1
+    graph = cfg.ControlFlowGraph(code)
+    blocks = graph.blocks
+    live_in, live_out = live_temps(blocks, *block_edges(graph))
+
+    starts = {}
+    ends = {}
+
+    def touch(operand, position):
+        start = starts.get(operand)
+        if start is None:
+            starts[operand] = ends[operand] = position
+        elif position < start:
+            starts[operand] = position
+        elif position > ends[operand]:
+            ends[operand] = position
+
+    position = 0
+    for index, block in enumerate(blocks):
+        first = 2 * position
+        for _, dst, src1, src2, _ in block.instructions:
+            if src1 < NONE:
+                touch(src1, 2 * position)
+            if src2 < NONE:
+                touch(src2, 2 * position)
+            if dst < NONE:
+                touch(dst, 2 * position + 1)
+            position += 1
+        for operand in live_in[index]:
+            touch(operand, first)
+        for operand in live_out[index]:
+            touch(operand, max(2 * position - 1, first))
+
+    # 起点相同时按原编号，结果是确定的
+    mapping = {}
+    active = []
+    free = []
+    names = 0
+    for operand in sorted(starts, key=lambda operand: (starts[operand], ~operand)):
+        start = starts[operand]
+        while active and active[0][0] < start:
+            heapq.heappush(free, heapq.heappop(active)[1])
+        if free:
+            name = heapq.heappop(free)
+        else:
+            names += 1
+            name = names
+        mapping[operand] = ~name
+        heapq.heappush(active, (ends[operand], name))
+
+    for block in blocks:
+        block.instructions = [(op, mapping.get(dst, dst), mapping.get(src1, src1), mapping.get(src2, src2), label)
+                              for op, dst, src1, src2, label in block.instructions]
+    return join_blocks(code, blocks), len(starts), names
+
+
+def natural_loops(graph, predecessors):
+    # while 的回边是跳回程序中靠前位置的跳转。返回 循环头 -> (循环中的块, 回边跳转的标签)，
+    # 循环中的块是能不经过循环头到达回边起点的块；同一循环头的几条回边合成一个循环。
+    # 只保留除循环头外没有别的入口、且不是从前一个块顺序执行回到循环头的循环，前置块才能插在循环头前面
+    loops = {}
+    for index, block in enumerate(graph.blocks):
+        jump = block.terminator()
+        if jump is None:
+            continue
+        header = graph.target(jump[4])
+        if header > index:
+            continue
+        body = loops.setdefault(header, ({header}, jump[4]))[0]
+        stack = [index]
+        while stack:
+            node = stack.pop()
+            if node not in body:
+                body.add(node)
+                stack.extend(predecessors[node])
+    return {header: loop for header, loop in loops.items()
+            if header - 1 not in loop[0]
+            and all(predecessor in loop[0] for node in loop[0] if node != header for predecessor in predecessors[node])}
+
+
+def hoist_loop_invariants(code, report=None):
+    # 循环不变量外提：循环中的运算，如果操作数都是常数、循环中没有赋值的变量或已经外提的临时变量，
+    # 就移到循环头前面新加的前置块，只计算一次。while 的循环体可能一次也不执行，
+    # 所以只外提结果是临时变量、不会出错的运算（除数是非零常数的除法才外提），
+    # 并且这个临时变量在循环中只赋值一次，在循环入口和出口都不活跃。
+    # 内层循环先处理，外层循环再把内层前置块中仍不变的指令继续外提。
+    # report 是字典时记录 回边跳转的标签 -> 从这个循环外提的指令数
+    graph = cfg.ControlFlowGraph(code)
+    blocks = graph.blocks
+    successors, predecessors = block_edges(graph)
+    loops = natural_loops(graph, predecessors)
+    if not loops:
+        return code
+    live_in, _ = live_temps(blocks, successors, predecessors)
+    is_constant = code.is_constant
+    value = code.value
+
+    # 各块剩下的指令，外提走的位置置为 None；循环头 -> 前置块的指令
+    remaining = [list(block.instructions) for block in blocks]
+    preheaders = {}
+    for header in sorted(loops, key=lambda header: len(loops[header][0])):
+        body, label = loops[header]
+        order = sorted(body)
+        # 外提不改变外层循环中的赋值，按原来的指令统计即可
+        defined = {}
+        for index in order:
+            for instruction in blocks[index].instructions:
+                if instruction[1] != NONE:
+                    defined[instruction[1]] = defined.get(instruction[1], 0) + 1
+        blocked = set(live_in[header])
+        for index in order:
+            for successor in successors[index]:
+                if successor not in body:
+                    blocked |= live_in[successor]
+        # 按程序顺序排列的候选指令列表，内层循环的前置块在内层循环头之前
+        candidates = []
+        for index in order:
+            if index != header and index in preheaders:
+                candidates.append(preheaders[index])
+            candidates.append(remaining[index])
+
+        invariant = set()
+        hoisted = []
+        changed = True
+        while changed:
+            changed = False
+            for instructions in candidates:
+                for position, instruction in enumerate(instructions):
+                    if instruction is None:
+                        continue
+                    op, dst, src1, src2, _ = instruction
+                    if dst >= NONE or defined[dst] != 1 or dst in blocked:
+                        continue
+                    if op != COPY and op not in BINARY:
+                        continue
+                    if op == DIV and not (is_constant(src2) and value(src2) != 0):
+                        continue
+                    if any(src in defined and src not in invariant for src in (src1, src2) if src != NONE):
+                        continue
+                    hoisted.append(instruction)
+                    instructions[position] = None
+                    invariant.add(dst)
+                    changed = True
+        if hoisted:
+            preheaders[header] = hoisted
+            if report is not None:
+                report[label] = report.get(label, 0) + len(hoisted)
+    if not preheaders:
+        return code
+
+    # 前置块用新标签；循环外跳到循环头的跳转改为跳到前置块，回边仍跳到循环头，顺序执行进入的直接进入前置块
+    next_label = max(code.labels, default=NO_LABEL)
+    preheader_labels = {}
+    for header in sorted(preheaders):
+        instructions = [instruction for instruction in preheaders[header] if instruction is not None]
+        if instructions:
+            next_label += 1
+            preheader_labels[header] = next_label
+            preheaders[header] = instructions
+    result = code.derive()
+    for index, block in enumerate(blocks):
+        if index in preheader_labels:
+            result.append(LABEL, NONE, NONE, NONE, preheader_labels[index])
+            result.extend(preheaders[index])
+        for label in block.labels:
+            result.append(LABEL, NONE, NONE, NONE, label)
+        instructions = [instruction for instruction in remaining[index] if instruction is not None]
+        if instructions and instructions[-1][0] in JUMPS:
+            jump = instructions[-1]
+            target = graph.target(jump[4])
+            if target in preheader_labels and index not in loops[target][0]:
+                instructions[-1] = jump[:4] + (preheader_labels[target],)
+        result.extend(instructions)
+    return result
+
+
+PASSES = {
+    'constants': fold_constants,
+    'global_constants': propagate_global_constants,
+    'copies': propagate_copies,
+    'cse': eliminate_common_subexpressions,
+    'dce': eliminate_dead_code,
+    'licm': hoist_loop_invariants,
+}
+
+
+def optimize(code, level=1):
+    # 返回优化后的代码和每个优化遍删除的指令数
+    removed = {}
+    rounds = MAX_ROUNDS if level >= 2 else 1
+    for _ in range(rounds):
+        # 只比较指令，折叠可能往符号表里加了常数
+        before = code.digest_parts()[:-1]
+        for name in LEVELS[level]:
+            if name == 'licm':
+                # 外提不删除指令，记录从循环中移出的指令数，每个循环的数目记为 licm_L<回边标签>
+                hoisted = {}
+                code = hoist_loop_invariants(code, hoisted)
+                removed[name] = removed.get(name, 0) + sum(hoisted.values())
+                for label, count in hoisted.items():
+                    key = f'{name}_L{label}'
+                    removed[key] = removed.get(key, 0) + count
+                continue
+            length = len(code)
+            code = PASSES[name](code)
+            removed[name] = removed.get(name, 0) + length - len(code)
+        if code.digest_parts()[:-1] == before:
+            break
+    return code, removed
@@ -0,0 +1,35 @@
+# output.txt 的格式；编译服务的客户端只导入这个模块，不加载编译器
+from itertools import islice
+
+# 每次写入的行数，不为每一行调用一次 write
+WRITE_BATCH = 4096
+
+
+def write_lines(file, lines):
+    lines = iter(lines)
+    while True:
+        batch = list(islice(lines, WRITE_BATCH))
+        if not batch:
+            return
+        batch.append('')
+        file.write('\n'.join(batch))
+
+
+def write_output_lines(tokens, code_lines, processed_lines, path):
+    # 三地址代码各部分已经转换成文本行；tokens 只需要支持 len 和迭代
+    if not tokens:
+        with open(path, 'w') as file:
+            file.write("No tokens found. Please check the input file.\n")
+        return
+
+    with open(path, 'w') as file:
+        # 输出词法分析结果
+        file.write("Tokens:\n")
+        write_lines(file, (f"{token}" for token in tokens))
+
+        # 输出三地址代码
+        file.write("Three Address Code:\n")
+        write_lines(file, code_lines)
+
+        file.write("\n\n\nProcessed Code:\n")
+        write_lines(file, processed_lines)
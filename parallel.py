@@ -0,0 +1,132 @@
+import os
+import re
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import instrument
+from tac import Code
+from token_store import TokenStore, OP, END, WHILE, IF, THEN, ELSE, DO
+
+# 单词数少于这个值时不值得启动工作进程
+MIN_PARALLEL_TOKENS = 200000
+# 每个工作进程分到的组数，组多一些可以均衡各组语句复杂度的差异
+GROUPS_PER_JOB = 4
+MIN_GROUP_TOKENS = 50000
+
+# 子语句只出现在 then/else/do 之后，所以不跟在它们后面的 END（分号）一定是一条顶层语句，
+# 它之后就是顶层语句的边界。在单词类型的字节串上查找，不需要语法分析
+BOUNDARY = re.compile(b'[^' + re.escape(bytes([THEN, ELSE, DO])) + b']' + re.escape(bytes([END])))
+
+# 工作进程中的符号表，所有组共用，符号编号与主进程相同
+_symbol_values = None
+_symbol_ids = None
+
+
+def init_worker(symbol_values):
+    global _symbol_values, _symbol_ids
+    _symbol_values = symbol_values
+    _symbol_ids = {(type(value), value): symbol for symbol, value in enumerate(symbol_values)}
+
+
+def split_groups(kinds, count):
+    # 返回组边界 [0, b1, ..., len(kinds)]，每组是若干条完整的顶层语句，大小尽量相等
+    size = len(kinds)
+    boundaries = [0]
+    for i in range(1, count):
+        match = BOUNDARY.search(kinds, max(size * i // count - 1, boundaries[-1]))
+        if match is None:
+            break
+        if boundaries[-1] < match.end() < size:
+            boundaries.append(match.end())
+    boundaries.append(size)
+    return boundaries
+
+
+def parse_group(parser_class, kinds, symbols, temp_base, label_base):
+    # 在工作进程中分析一组顶层语句。临时变量和标签从这一组的起始编号开始，得到的就是最终编号
+    tokens = TokenStore(_symbol_values, _symbol_ids)
+    tokens.kinds = array('B', kinds)
+    tokens.symbols = symbols
+    parser = parser_class(tokens, Code(_symbol_values, _symbol_ids))
+    parser.temp_count = temp_base
+    parser.label_count = label_base
+    code = parser.parse()
+    return (code.ops, code.dst, code.src1, code.src2, code.labels, code.statement_tokens, code.statement_starts,
+            parser.temp_count, parser.label_count, parser.statement_count)
+
+
+# 多进程语法分析，接口与 main.Parser 相同，结果与 parser_class 单进程分析完全一致。
+# 每个二元运算符产生一个临时变量，每个 if/while 分配三个标签，所以各组的起始编号可以直接数单词得到，
+# 工作进程生成的代码不需要再重新编号，合并时只是按顺序拼接
+class ParallelParser:
+    def __init__(self, tokens, parser_class, jobs=None):
+        self.tokens = tokens
+        self.parser_class = parser_class
+        self.jobs = jobs or os.cpu_count()
+        self.temp_count = 0
+        self.label_count = 0
+        self.statement_count = 0
+        # 实际使用的进程数，单词太少或退回单进程分析时为 1
+        self.jobs_used = 1
+
+    def parse_serial(self):
+        self.jobs_used = 1
+        parser = self.parser_class(self.tokens)
+        code = parser.parse()
+        self.temp_count = parser.temp_count
+        self.label_count = parser.label_count
+        self.statement_count = parser.statement_count
+        return code
+
+    def parse(self):
+        tokens = self.tokens
+        if self.jobs <= 1 or len(tokens) < MIN_PARALLEL_TOKENS or self.parser_class.compact:
+            # 紧凑代码的标签编号数不出来
+            return self.parse_serial()
+        kinds = tokens.kinds.tobytes()
+        count = min(self.jobs * GROUPS_PER_JOB, max(len(kinds) // MIN_GROUP_TOKENS, 1))
+        boundaries = split_groups(kinds, count)
+        if len(boundaries) <= 2:
+            return self.parse_serial()
+
+        # (起始单词, 结束单词, 起始临时变量编号, 起始标签编号)
+        groups = []
+        temp_base = label_base = 0
+        for start, end in zip(boundaries, boundaries[1:]):
+            groups.append((start, end, temp_base, label_base))
+            temp_base += kinds.count(OP, start, end)
+            label_base += 3 * (kinds.count(IF, start, end) + kinds.count(WHILE, start, end))
+        ends = [(temp, label) for _, _, temp, label in groups[1:]] + [(temp_base, label_base)]
+
+        self.jobs_used = min(self.jobs, len(groups))
+        with ProcessPoolExecutor(max_workers=self.jobs_used, initializer=init_worker,
+                                 initargs=(tokens.symbol_values,)) as executor:
+            futures = [executor.submit(parse_group, self.parser_class, kinds[start:end], tokens.symbols[start:end],
+                                       temp_base, label_base)
+                       for start, end, temp_base, label_base in groups]
+            try:
+                results = [future.result() for future in futures]
+            except SyntaxError:
+                # 重新整体分析一遍，报告与单进程完全相同的错误
+                executor.shutdown(cancel_futures=True)
+                return self.parse_serial()
+
+        if [(result[7], result[8]) for result in results] != ends:
+            # 只有程序有错而各组又恰好都能分析时才会发生
+            return self.parse_serial()
+
+        code = Code.from_tokens(tokens)
+        for (start, _, _, _), result in zip(groups, results):
+            ops, dst, src1, src2, labels, statement_tokens, statement_starts, _, _, statements = result
+            base = len(code)
+            code.statement_tokens.extend([index + start for index in statement_tokens])
+            code.statement_starts.extend([index + base for index in statement_starts])
+            code.ops.extend(ops)
+            code.dst.extend(dst)
+            code.src1.extend(src1)
+            code.src2.extend(src2)
+            code.labels.extend(labels)
+            self.statement_count += statements
+        self.temp_count, self.label_count = ends[-1]
+        instrument.count('parallel_groups', len(groups))
+        return code
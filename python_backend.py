@@ -0,0 +1,168 @@
+import time
+
+import cfg
+import compile_cache
+import instrument
+import interpreter
+from tac import COPY, DIV, GOTO, JUMPS, NONE, OP_SYMBOLS, divide
+from interpreter import DEFAULT_MAX_STEPS, ExecutionResult
+
+# 内存中缓存的代码对象个数上限，超出时淘汰最久没有用到的
+MAX_CACHED = 128
+
+FUNCTION_NAME = 'program'
+# 条件跳转的 Python 比较运算符
+COMPARISONS = {op: {'=': '==', '<>': '!='}.get(symbol, symbol) for op, symbol in OP_SYMBOLS.items()}
+
+_code_objects = {}
+
+
+def generate_source(code):
+    # 每个被跳转到的基本块开始一个状态，状态内按原顺序执行到下一个状态为止；
+    # 状态在 while 循环中用二分的 if 树分派。变量、临时变量都是局部变量，常数直接写成字面量。
+    # steps 与解释器一样按执行的指令数累加，每段指令开始时检查一次、结束时加一次
+    symbol_values = code.symbol_values
+    blocks = cfg.build_blocks(code)
+    label_blocks = {label: index for index, block in enumerate(blocks) for label in block.labels}
+
+    targeted = bytearray(len(blocks))
+    if blocks:
+        targeted[0] = 1
+    for block in blocks:
+        jump = block.terminator()
+        if jump is not None:
+            targeted[label_blocks[jump[4]]] = 1
+    states = {}
+    for index in range(len(blocks)):
+        if targeted[index]:
+            states[index] = len(states)
+
+    variables = {}
+    temps = set()
+
+    def name(operand):
+        if operand < NONE:
+            temps.add(operand)
+            return f't_{~operand}'
+        value = symbol_values[operand]
+        if isinstance(value, str):
+            variables[value] = f'v_{value}'
+            return variables[value]
+        # repr 保留整数和浮点数的区别
+        return repr(value)
+
+    # 先生成各状态的代码，顺便收集用到的变量
+    bodies = []
+    # 当前这一段还没有输出的赋值语句；一段是中间没有跳转的一串指令，最后可能是一条跳转
+    segment = []
+    # 各段的指令数；函数开头先算好 max_steps 减去它，检查时只比较一次
+    segment_lengths = set()
+
+    def flush(body, jumps=0):
+        # 整段执行前检查步数：剩下的步数不够执行整段时，只执行步数以内的指令就停下，
+        # 与解释器停在同一条指令上
+        count = len(segment) + jumps
+        if not count:
+            return
+        segment_lengths.add(count)
+        body.append(f'if steps > limit_{count}:')
+        for offset, line in enumerate(segment[:count - 1]):
+            body.append(f'    if max_steps - steps > {offset}:')
+            body.append(f'        {line}')
+        body.append('    steps = max(steps, max_steps)')
+        body.append('    break')
+        body.extend(segment)
+        body.append(f'steps += {count}')
+        segment.clear()
+
+    for index, block in enumerate(blocks):
+        if targeted[index]:
+            bodies.append([])
+        body = bodies[-1]
+        for op, dst, src1, src2, label in block.instructions:
+            if op == COPY:
+                segment.append(f'{name(dst)} = {name(src1)}')
+            elif op == DIV:
+                segment.append(f'{name(dst)} = divide({name(src1)}, {name(src2)})')
+            elif op == GOTO:
+                flush(body, 1)
+                body.append(f'state = {states[label_blocks[label]]}')
+                body.append('continue')
+            elif op in JUMPS:
+                flush(body, 1)
+                body.append(f'if {name(src1)} {COMPARISONS[op]} {name(src2)}:')
+                body.append(f'    state = {states[label_blocks[label]]}')
+                body.append('    continue')
+            else:
+                segment.append(f'{name(dst)} = {name(src1)} {OP_SYMBOLS[op]} {name(src2)}')
+        if block.falls_through() and (index + 1 == len(blocks) or targeted[index + 1]):
+            flush(body)
+            if index + 1 == len(blocks):
+                body.append('finished = True')
+                body.append('break')
+            else:
+                body.append(f'state = {states[index + 1]}')
+                body.append('continue')
+
+    lines = [f'def {FUNCTION_NAME}(bindings, max_steps):']
+    for variable, local in sorted(variables.items()):
+        lines.append(f'    {local} = bindings.get({variable!r}, 0)')
+    for temp in sorted(temps, reverse=True):
+        lines.append(f'    t_{~temp} = 0')
+    for count in sorted(segment_lengths):
+        lines.append(f'    limit_{count} = max_steps - {count}')
+    lines.append('    steps = 0')
+    lines.append('    state = 0')
+    lines.append(f'    finished = {not bodies}')
+    if bodies:
+        # 没有指令的状态不会构成循环，步数在每段指令开始时检查
+        lines.append('    while True:')
+
+        def dispatch(low, high, indent):
+            if high - low == 1:
+                lines.extend(indent + line for line in bodies[low])
+                return
+            middle = (low + high) // 2
+            lines.append(f'{indent}if state < {middle}:')
+            dispatch(low, middle, indent + '    ')
+            lines.append(f'{indent}else:')
+            dispatch(middle, high, indent + '    ')
+
+        dispatch(0, len(bodies), ' ' * 8)
+    result = ', '.join(f'{variable!r}: {local}' for variable, local in sorted(variables.items()))
+    lines.append(f'    return {{{result}}}, steps, finished')
+    return '\n'.join(lines) + '\n'
+
+
+def compile_program(code, digest=None):
+    # 按程序内容的哈希缓存代码对象，同一个程序只生成和编译一次
+    if digest is None:
+        digest = compile_cache.digest(*code.digest_parts())
+    code_object = _code_objects.pop(digest, None)
+    if code_object is None:
+        with instrument.phase('codegen'):
+            code_object = compile(generate_source(code), f'<tac {digest[:12]}>', 'exec')
+        if len(_code_objects) >= MAX_CACHED:
+            del _code_objects[next(iter(_code_objects))]
+    _code_objects[digest] = code_object
+    namespace = {'divide': divide}
+    exec(code_object, namespace)
+    return namespace[FUNCTION_NAME]
+
+
+# 与 interpreter.Executable 接口相同
+class CompiledProgram:
+    def __init__(self, code):
+        self.function = compile_program(code)
+
+    def run(self, bindings=None, max_steps=DEFAULT_MAX_STEPS):
+        start = time.perf_counter()
+        with instrument.phase('execute'):
+            variables, steps, finished = self.function(bindings or {}, max_steps)
+        seconds = time.perf_counter() - start
+        instrument.count('executed_instructions', steps)
+        return ExecutionResult(variables, steps, seconds, finished)
+
+
+if __name__ == "__main__":
+    raise SystemExit(interpreter.main_run(CompiledProgram))
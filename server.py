@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor
+
+import compile_cache
+import main
+import optimize
+import scanner
+from client import DEFAULT_SOCKET, parse_address
+
+# 一个请求（一行 JSON）的最大字节数
+MAX_REQUEST_BYTES = 16 * 1024 * 1024
+# 排队和执行中的编译任务上限，超出时直接回复 busy，不再排队
+MAX_PENDING = 256
+# 每个连接同时处理的请求数，达到上限后暂停读取这个连接，由 TCP 流控挡住客户端
+MAX_INFLIGHT = 16
+
+# 每个工作进程各自持有一个缓存对象
+_cache = None
+
+
+def init_worker(cache_dir, cache_size):
+    global _cache
+    if cache_dir is not None:
+        _cache = compile_cache.CompileCache(cache_dir, cache_size)
+
+
+def syntax_tree_lines(trees):
+    out = io.StringIO()
+    for tree in trees:
+        tree.write(out)
+    return out.getvalue().splitlines()
+
+
+def compile_request(source, opt_level, parser_name, want_ast):
+    # 在工作进程中执行，返回编码好的 JSON 对象；编译出错时 ok 为 False
+    try:
+        # 需要语法树时语法树和代码来自同一次语法分析
+        trees = [] if want_ast else None
+        tokens, code, processed_code = main.compile_source(source, _cache, main.PARSERS[parser_name], opt_level, trees)
+        response = {'ok': True, 'tokens': list(tokens), 'code': list(code.lines()),
+                    'processed': list(processed_code.lines('\t'))}
+        if want_ast:
+            response['ast'] = syntax_tree_lines(trees)
+    except Exception as error:
+        response = {'ok': False, 'error': f"{type(error).__name__}: {error}"}
+    return json.dumps(response).encode('utf-8')
+
+
+def error_response(message):
+    return json.dumps({'ok': False, 'error': message}).encode('utf-8')
+
+
+# 常驻的编译服务：每行一个 JSON 请求，每行一个 JSON 回复，回复带上请求的 id，可能不按请求顺序返回。
+# 编译在进程池中进行；内容相同、正在编译的请求共用一个任务
+class CompileServer:
+    def __init__(self, workers=None, cache_dir=None, cache_size=compile_cache.MAX_BYTES,
+                 max_pending=MAX_PENDING, max_inflight=MAX_INFLIGHT):
+        self.workers = workers or os.cpu_count()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                            initargs=(cache_dir, cache_size))
+        self.max_pending = max_pending
+        self.max_inflight = max_inflight
+        # 请求内容的哈希 -> 正在进行的编译任务
+        self.inflight = {}
+        self.pending = 0
+        self.stats = {'connections': 0, 'requests': 0, 'compiled': 0, 'coalesced': 0, 'rejected': 0}
+
+    async def warm_up(self):
+        # 让每个工作进程先加载扫描器共享库
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, compile_request, b'', 0, 'recursive', False)
+                               for _ in range(self.workers)))
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+    async def compile(self, source, opt_level, parser_name, want_ast):
+        key = compile_cache.digest(source, str(opt_level), parser_name, str(want_ast))
+        future = self.inflight.get(key)
+        if future is not None:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(future)
+        if self.pending >= self.max_pending:
+            self.stats['rejected'] += 1
+            return error_response("server busy")
+
+        self.pending += 1
+        self.stats['compiled'] += 1
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, compile_request, source, opt_level, parser_name, want_ast)
+        self.inflight[key] = future
+
+        def finished(_):
+            del self.inflight[key]
+            self.pending -= 1
+
+        future.add_done_callback(finished)
+        # 发起请求的连接断开时不取消任务，其他等待同一结果的请求照常返回
+        return await asyncio.shield(future)
+
+    async def dispatch(self, request):
+        op = request.get('op', 'compile')
+        if op == 'ping':
+            return b'{"ok": true}'
+        if op == 'stats':
+            return json.dumps({'ok': True, 'pending': self.pending, **self.stats}).encode('utf-8')
+        if op != 'compile':
+            return error_response(f"unknown op {op!r}")
+        source = request.get('source')
+        opt_level = request.get('opt_level', 0)
+        parser_name = request.get('parser', 'recursive')
+        if not isinstance(source, str):
+            return error_response("source must be a string")
+        if opt_level not in optimize.LEVELS:
+            return error_response(f"invalid opt_level {opt_level!r}")
+        if parser_name not in main.PARSERS:
+            return error_response(f"invalid parser {parser_name!r}")
+        return await self.compile(source.encode('utf-8'), opt_level, parser_name, bool(request.get('ast', True)))
+
+    async def respond(self, line, writer, slots):
+        try:
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("request must be a JSON object")
+            except ValueError as error:
+                request = {}
+                body = error_response(f"bad request: {error}")
+            else:
+                try:
+                    body = await self.dispatch(request)
+                except Exception as error:
+                    # 例如工作进程异常退出
+                    body = error_response(f"{type(error).__name__}: {error}")
+            # 在编码好的回复前面插入 id
+            writer.write(b'{"id": ' + json.dumps(request.get('id')).encode('utf-8') + b', ' + body[1:] + b'\n')
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            slots.release()
+
+    async def handle(self, reader, writer):
+        self.stats['connections'] += 1
+        slots = asyncio.Semaphore(self.max_inflight)
+        tasks = set()
+        try:
+            while True:
+                await slots.acquire()
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # 超过 MAX_REQUEST_BYTES，无法再找到下一行的开头，回复后关闭连接
+                    writer.write(b'{"id": null, ' + error_response("request too large")[1:] + b'\n')
+                    slots.release()
+                    break
+                except ConnectionError:
+                    slots.release()
+                    break
+                if not line:
+                    slots.release()
+                    break
+                self.stats['requests'] += 1
+                task = asyncio.create_task(self.respond(line, writer, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+
+async def serve(server, address):
+    if isinstance(address, tuple):
+        listener = await asyncio.start_server(server.handle, *address, limit=MAX_REQUEST_BYTES)
+    else:
+        if os.path.exists(address):
+            os.unlink(address)
+        listener = await asyncio.start_unix_server(server.handle, address, limit=MAX_REQUEST_BYTES)
+    await server.warm_up()
+    print(f"compile server listening on {address} with {server.workers} workers", flush=True)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stop.set)
+    async with listener:
+        await stop.wait()
+
+
+def main_server():
+    arg_parser = argparse.ArgumentParser(description="Run a resident compile server.")
+    address_group = arg_parser.add_mutually_exclusive_group()
+    address_group.add_argument('--socket', default=DEFAULT_SOCKET, help="Unix socket path")
+    address_group.add_argument('--tcp', type=parse_address, metavar='HOST:PORT', help="listen on a TCP port instead")
+    arg_parser.add_argument('-j', '--jobs', type=int, default=None, help="worker processes (default: CPU count)")
+    arg_parser.add_argument('--max-pending', type=int, default=MAX_PENDING,
+                            help="compile jobs queued or running before requests are rejected as busy")
+    arg_parser.add_argument('--max-inflight', type=int, default=MAX_INFLIGHT,
+                            help="requests processed at once per connection")
+    arg_parser.add_argument('--no-cache', action='store_true', help="disable the on-disk compile cache")
+    arg_parser.add_argument('--cache-dir', default=compile_cache.CACHE_DIR)
+    arg_parser.add_argument('--cache-size', type=int, default=compile_cache.MAX_BYTES, help="cache size limit in bytes")
+    args = arg_parser.parse_args()
+
+    # 共享库只在主进程里编译一次，避免工作进程同时调用 gcc
+    scanner.build_library()
+    address = args.tcp or args.socket
+    server = CompileServer(args.jobs, None if args.no_cache else args.cache_dir, args.cache_size,
+                           args.max_pending, args.max_inflight)
+    try:
+        asyncio.run(serve(server, address))
+    finally:
+        server.close()
+        if not isinstance(address, tuple) and os.path.exists(address):
+            os.unlink(address)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main_server())
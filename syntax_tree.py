@@ -1,214 +1,315 @@
+import io
 import re
+import sys
+from array import array
+
+import instrument
+from token_store import (TokenStore, TYPE_NAMES, ID, NUMBER, OP, COMPARE, ASSIGN, END, WHILE, IF,
+                         THEN, ELSE, DO, LPAREN, RPAREN, SEMIC, HEX)
 
 # 词法分析器
 def lexer(input_code):
-    tokens = []
-    for line in input_code.strip().split('\n'):  # 逐行读取输入代码
-        parts = line.strip().split()  # 分割每行的内容
-        if len(parts) == 3:
-            token_type = parts[1]
-            token_value = parts[2]
-            # 根据不同类型的标记进行处理
-            if token_type.startswith('INT'):
-                token_value = int(token_value)
-                token_type = 'NUMBER'
-            elif token_type == 'IDN':
-                token_type = 'ID'
-            elif token_type == 'PLUS':
-                token_value = '+'
-                token_type = 'OP'
-            elif token_type == 'MINUS':
-                token_value = '-'
-                token_type = 'OP'
-            elif token_type == 'MULTI':
-                token_value = '*'
-                token_type = 'OP'
-            elif token_type == 'RDIV':
-                token_value = '/'
-                token_type = 'OP'
-            elif token_type == 'GT':
-                token_value = '>'
-                token_type = 'COMPARE'
-            elif token_type == 'LT':
-                token_value = '<'
-                token_type = 'COMPARE'
-            elif token_type == 'EQ':
-                token_value = '='
-                token_type = 'ASSIGN'
-            elif token_type == 'SEMIC':
-                token_value = ';'
-                token_type = 'END'
-            elif token_type == 'WHILE':
-                token_value = 'while'
-                token_type = 'WHILE'
-            elif token_type == 'IF':
-                token_value = 'if'
-                token_type = 'IF'
-            elif token_type == 'THEN':
-                token_value = 'then'
-                token_type = 'THEN'
-            elif token_type == 'ELSE':
-                token_value = 'else'
-                token_type = 'ELSE'
-            elif token_type == 'DO':
-                token_value = 'do'
-                token_type = 'DO'
-            elif token_type == 'LR_BRAC':
-                token_value = '('
-                token_type = 'LPAREN'
-            elif token_type == 'RR_BRAC':
-                token_value = ')'
-                token_type = 'RPAREN'
-            tokens.append((token_type, token_value))  # 添加处理后的标记到列表中
-    return tokens
+    # 查表转换单词种别，结果按列存放
+    return TokenStore.from_lines(input_code.strip().split('\n'))
 
 # 语法树节点类
 class ASTNode:
-    def __init__(self, token_type, token_value):
+    __slots__ = ('token_type', 'token_value', 'children')
+
+    def __init__(self, token_type, token_value, children=None):
         self.token_type = token_type
         self.token_value = token_value
-        self.children = []
+        self.children = children if children is not None else []
 
     def add_child(self, node):
         self.children.append(node)
 
+    def write(self, file, level=0):
+        # 用显式栈先序遍历，按行流式写出，耗时与节点数成线性关系
+        buffer = []
+        stack = [(self, level)]
+        while stack:
+            node, depth = stack.pop()
+            buffer.append("\t" * depth + repr((node.token_type, node.token_value)) + "\n")
+            if len(buffer) >= WRITE_BATCH:
+                file.write(''.join(buffer))
+                buffer.clear()
+            for child in reversed(node.children):
+                stack.append((child, depth + 1))
+        file.write(''.join(buffer))
+
     def __repr__(self, level=0):
-        ret = "\t" * level + repr((self.token_type, self.token_value)) + "\n"
-        for child in self.children:
-            ret += child.__repr__(level + 1)
-        return ret
+        out = io.StringIO()
+        self.write(out, level)
+        return out.getvalue()
+
+
+# 每攒够这么多行写一次文件
+WRITE_BATCH = 4096
+
+
+# 构造 ASTNode 树；不带子节点的关键字、运算符节点全局共享一份，不能再对它们 add_child
+class TreeBuilder:
+    def __init__(self):
+        self.leaves = {}
+
+    def node(self, token_type, token_value, children=None):
+        return ASTNode(token_type, token_value, children)
+
+    def leaf(self, token_type, token_value):
+        key = (token_type, token_value)
+        node = self.leaves.get(key)
+        if node is None:
+            node = self.leaves[key] = ASTNode(token_type, token_value)
+        return node
+
+    def finish(self, root):
+        return root
+
+    def parts(self, node):
+        # (类型, 值, 子节点)，遍历语法树时与 ASTArena 通用
+        return node.token_type, node.token_value, node.children
+
+
+# 扁平数组存放的语法树：节点编号即数组下标，子节点编号连续存放在 edges 中。
+# 节点在其子节点全部建好之后才分配，所以 [child_start, child_start + child_count) 是连续区间
+class ASTArena:
+    def __init__(self):
+        self.kinds = array('H')
+        self.values = array('i')
+        self.child_start = array('i')
+        self.child_count = array('i')
+        self.edges = array('i')
+        self.kind_names = []
+        self.kind_ids = {}
+        self.symbol_values = []
+        self.symbol_ids = {}
+        self.leaves = {}
+        self.root = -1
+
+    def intern_kind(self, token_type):
+        kind = self.kind_ids.get(token_type)
+        if kind is None:
+            kind = self.kind_ids[token_type] = len(self.kind_names)
+            self.kind_names.append(token_type)
+        return kind
+
+    def intern_value(self, token_value):
+        # 区分 7 和 7.0
+        key = (type(token_value), token_value)
+        symbol = self.symbol_ids.get(key)
+        if symbol is None:
+            symbol = self.symbol_ids[key] = len(self.symbol_values)
+            self.symbol_values.append(token_value)
+        return symbol
+
+    def node(self, token_type, token_value, children=None):
+        index = len(self.kinds)
+        self.kinds.append(self.intern_kind(token_type))
+        self.values.append(self.intern_value(token_value))
+        self.child_start.append(len(self.edges))
+        if children:
+            self.child_count.append(len(children))
+            self.edges.extend(children)
+        else:
+            self.child_count.append(0)
+        return index
+
+    def leaf(self, token_type, token_value):
+        key = (token_type, token_value)
+        index = self.leaves.get(key)
+        if index is None:
+            index = self.leaves[key] = self.node(token_type, token_value)
+        return index
+
+    def finish(self, root):
+        self.root = root
+        return self
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def parts(self, index):
+        return self.kind_names[self.kinds[index]], self.symbol_values[self.values[index]], self.children(index)
+
+    def children(self, index):
+        start = self.child_start[index]
+        return self.edges[start:start + self.child_count[index]]
+
+    def write(self, file, root=None, level=0):
+        kinds = self.kinds
+        values = self.values
+        child_start = self.child_start
+        child_count = self.child_count
+        edges = self.edges
+        labels = [None] * len(self.kinds)
+        buffer = []
+        stack = [(self.root if root is None else root, level)]
+        while stack:
+            index, depth = stack.pop()
+            label = labels[index]
+            if label is None:
+                label = labels[index] = repr((self.kind_names[kinds[index]], self.symbol_values[values[index]]))
+            buffer.append("\t" * depth + label + "\n")
+            if len(buffer) >= WRITE_BATCH:
+                file.write(''.join(buffer))
+                buffer.clear()
+            start = child_start[index]
+            for i in range(start + child_count[index] - 1, start - 1, -1):
+                stack.append((edges[i], depth + 1))
+        file.write(''.join(buffer))
+
+    def __repr__(self):
+        out = io.StringIO()
+        self.write(out)
+        return out.getvalue()
+
 
 # 语法分析器
 class Parser:
-    def __init__(self, tokens):
+    def __init__(self, tokens, builder=None):
+        if not isinstance(tokens, TokenStore):
+            tokens = TokenStore.from_tokens(tokens)
         self.tokens = tokens
+        self.kinds = tokens.kinds
+        self.symbols = tokens.symbols
+        self.symbol_values = tokens.symbol_values
+        self.token_count = len(tokens)
         self.current_token_index = 0
+        self.tracing = instrument.tracing()
+        # 默认构造 ASTNode 树，传入 ASTArena 则构造扁平数组
+        self.builder = builder if builder is not None else TreeBuilder()
 
     def current_token(self):
-        if self.current_token_index < len(self.tokens):
+        if self.current_token_index < self.token_count:
             return self.tokens[self.current_token_index]
         else:
             return None, None
 
+    # 直接读取列，不为每个单词构造元组
+    def current_kind(self):
+        if self.current_token_index < self.token_count:
+            return self.kinds[self.current_token_index]
+        return None
+
+    def current_value(self):
+        if self.current_token_index < self.token_count:
+            return self.symbol_values[self.symbols[self.current_token_index]]
+        return None
+
     def next_token(self):
         self.current_token_index += 1
 
     def parse(self):
-        self.ast = self.S()
+        self.ast = self.builder.finish(self.S())
         return self.ast
 
     def S(self):
-        token_type, token_value = self.current_token()
-        node = ASTNode(token_type, token_value)
-        print(f"Processing statement: {token_type}, {token_value}")  # 调试信息
-        if token_type == 'ID':
+        return self.statement()
+
+    # 子语句直接调用 statement，子类可以只重写顶层语句的 S
+    def statement(self):
+        kind = self.current_kind()
+        token_type = TYPE_NAMES[kind] if kind is not None else None
+        token_value = self.current_value()
+        children = []
+        if self.tracing:
+            instrument.trace(f"Processing statement: {token_type}, {token_value}")  # 调试信息
+        if kind == ID:
             id_place = token_value
             self.next_token()
-            if self.current_token()[0] == 'ASSIGN':
-                node.add_child(ASTNode('ASSIGN', '='))
+            if self.current_kind() == ASSIGN:
+                children.append(self.builder.leaf('ASSIGN', '='))
                 self.next_token()
                 E_place = self.E()
-                node.add_child(E_place)
-        elif token_type == 'IF':
+                children.append(E_place)
+            elif self.current_kind() == SEMIC:
+                # 与 main.Parser 相同，单独的标识符后面的 SEMIC 属于这条语句
+                self.next_token()
+        elif kind == IF:
             self.next_token()
-            node.add_child(ASTNode('IF', 'if'))
+            children.append(self.builder.leaf('IF', 'if'))
             condition_node = self.C()
-            node.add_child(condition_node)
-            if self.current_token()[0] == 'THEN':
+            children.append(condition_node)
+            if self.current_kind() == THEN:
                 self.next_token()
-                then_node = ASTNode('THEN', 'then')
-                node.add_child(then_node)
-                then_node.add_child(self.S())
-                if self.current_token()[0] == 'ELSE':
+                children.append(self.builder.node('THEN', 'then', [self.statement()]))
+                if self.current_kind() == ELSE:
                     self.next_token()
-                    else_node = ASTNode('ELSE', 'else')
-                    node.add_child(else_node)
-                    else_node.add_child(self.S())
+                    children.append(self.builder.node('ELSE', 'else', [self.statement()]))
             else:
                 raise SyntaxError("Missing then")
-        elif token_type == 'WHILE':
+        elif kind == WHILE:
             self.next_token()
-            node.add_child(ASTNode('WHILE', 'while'))
+            children.append(self.builder.leaf('WHILE', 'while'))
             condition_node = self.C()
-            node.add_child(condition_node)
-            if self.current_token()[0] == 'DO':
+            children.append(condition_node)
+            if self.current_kind() == DO:
                 self.next_token()
-                do_node = ASTNode('DO', 'do')
-                node.add_child(do_node)
-                do_node.add_child(self.S())
+                children.append(self.builder.node('DO', 'do', [self.statement()]))
             else:
                 raise SyntaxError("Missing do")
-        elif token_type == 'LPAREN':
+        elif kind == LPAREN:
             self.next_token()
             expr_node = self.E()
-            node.add_child(expr_node)
-            if self.current_token()[0] == 'RPAREN':
+            children.append(expr_node)
+            if self.current_kind() == RPAREN:
                 self.next_token()
             else:
                 raise SyntaxError("Missing closing parenthesis")
-        elif token_type == 'END':
+        elif kind == END:
             self.next_token()
         else:
             raise SyntaxError(f"Invalid statement: {token_type} at index {self.current_token_index}")
-        return node
+        return self.builder.node(token_type, token_value, children)
 
     def C(self):
         E1_place = self.E()
-        condition_node = ASTNode('CONDITION', 'condition')
-        condition_node.add_child(E1_place)
-        if self.current_token()[0] == 'COMPARE' or (self.current_token()[0] == 'ASSIGN' and self.current_token()[1] == '='):
-            op = self.current_token()[1]
+        if self.current_kind() == COMPARE or (self.current_kind() == ASSIGN and self.current_value() == '='):
+            op = self.current_value()
             self.next_token()
             E2_place = self.E()
-            condition_node.add_child(ASTNode('OP', op))
-            condition_node.add_child(E2_place)
+            return self.builder.node('CONDITION', 'condition', [E1_place, self.builder.leaf('OP', op), E2_place])
         else:
             raise SyntaxError(f"Invalid comparison operator: {self.current_token()} at index {self.current_token_index}")
-        return condition_node
 
     def E(self):
         T_place = self.T()
         expr_node = T_place
-        while self.current_token()[0] == 'OP' and self.current_token()[1] in ['+', '-']:
-            op = self.current_token()[1]
+        while self.current_kind() == OP and self.current_value() in ('+', '-'):
+            op = self.current_value()
             self.next_token()
             T1_place = self.T()
-            expr_node = ASTNode('EXPR', 'expr')
-            expr_node.add_child(T_place)
-            expr_node.add_child(ASTNode('OP', op))
-            expr_node.add_child(T1_place)
+            expr_node = self.builder.node('EXPR', 'expr', [T_place, self.builder.leaf('OP', op), T1_place])
             T_place = expr_node
         return expr_node
 
     def T(self):
         F_place = self.F()
         term_node = F_place
-        while self.current_token()[0] == 'OP' and self.current_token()[1] in ['*', '/']:
-            op = self.current_token()[1]
+        while self.current_kind() == OP and self.current_value() in ('*', '/'):
+            op = self.current_value()
             self.next_token()
             F1_place = self.F()
-            term_node = ASTNode('TERM', 'term')
-            term_node.add_child(F_place)
-            term_node.add_child(ASTNode('OP', op))
-            term_node.add_child(F1_place)
+            term_node = self.builder.node('TERM', 'term', [F_place, self.builder.leaf('OP', op), F1_place])
             F_place = term_node
         return term_node
 
     def F(self):
-        token_type, token_value = self.current_token()
-        node = ASTNode(token_type, token_value)
-        if token_type == 'LPAREN':
+        kind = self.current_kind()
+        token_type = TYPE_NAMES[kind] if kind is not None else None
+        token_value = self.current_value()
+        if kind == LPAREN:
             self.next_token()
             expr_node = self.E()
-            node.add_child(expr_node)
-            if self.current_token()[0] == 'RPAREN':
+            if self.current_kind() == RPAREN:
                 self.next_token()
-                return node
+                return self.builder.node(token_type, token_value, [expr_node])
             else:
                 raise SyntaxError("Missing closing parenthesis")
-        elif token_type in ['ID', 'NUMBER', 'HEX']:
+        elif kind in (ID, NUMBER, HEX):
             self.next_token()
-            return node
+            return self.builder.node(token_type, token_value)
         else:
             raise SyntaxError(f"Invalid factor: {self.current_token()} at index {self.current_token_index}")
 
@@ -226,13 +327,14 @@ def main():
     for token in tokens:
         print(token)
 
-    # 语法分析
-    parser = Parser(tokens)
+    # 语法分析；--arena 时语法树存放在扁平数组中
+    parser = Parser(tokens, ASTArena() if '--arena' in sys.argv[1:] else None)
     ast = parser.parse()
 
     # 输出语法树
     print("Syntax Tree:")
-    print(ast)
+    ast.write(sys.stdout)
+    print()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,196 @@
+from array import array
+
+# 四元式操作码，下标即编码；IF_LE/IF_GE/IF_NE 只由回填生成代码的语法分析器产生（条件取反）
+OPCODES = ['COPY', 'ADD', 'SUB', 'MUL', 'DIV', 'IF_LT', 'IF_GT', 'IF_EQ', 'GOTO', 'LABEL', 'IF_LE', 'IF_GE', 'IF_NE']
+(COPY, ADD, SUB, MUL, DIV, IF_LT, IF_GT, IF_EQ, GOTO, LABEL, IF_LE, IF_GE, IF_NE) = range(len(OPCODES))
+
+BINARY_OPS = {'+': ADD, '-': SUB, '*': MUL, '/': DIV}
+COMPARE_OPS = {'<': IF_LT, '>': IF_GT, '=': IF_EQ}
+# 输出时使用的运算符
+OP_SYMBOLS = {ADD: '+', SUB: '-', MUL: '*', DIV: '/', IF_LT: '<', IF_GT: '>', IF_EQ: '=',
+              IF_LE: '<=', IF_GE: '>=', IF_NE: '<>'}
+# 带标签的跳转指令
+JUMPS = (IF_LT, IF_GT, IF_EQ, GOTO, IF_LE, IF_GE, IF_NE)
+# 条件跳转 -> 条件相反的条件跳转
+INVERTED = {IF_LT: IF_GE, IF_GE: IF_LT, IF_GT: IF_LE, IF_LE: IF_GT, IF_EQ: IF_NE, IF_NE: IF_EQ}
+BINARY = (ADD, SUB, MUL, DIV)
+COMMUTATIVE = (ADD, MUL)
+
+# 操作数编码：非负数是符号表下标（变量名或常数），临时变量 tk 编码为 ~k，NONE 表示没有这个操作数
+NONE = -1
+# 标签从 1 开始编号，0 表示没有标签
+NO_LABEL = 0
+
+
+def temp(number):
+    return ~number
+
+
+def is_temp(operand):
+    return operand < NONE
+
+
+def temp_number(operand):
+    return ~operand
+
+
+def label_name(label):
+    return f'L{label}'
+
+
+def divide(x, y):
+    # 两个整数相除按 C 的规则向零截断，否则是浮点除法
+    if isinstance(x, int) and isinstance(y, int):
+        quotient = abs(x) // abs(y)
+        return quotient if (x < 0) == (y < 0) else -quotient
+    return x / y
+
+
+def evaluate(op, x, y):
+    if op == ADD:
+        return x + y
+    if op == SUB:
+        return x - y
+    if op == MUL:
+        return x * y
+    return divide(x, y)
+
+
+def compare(op, x, y):
+    if op == IF_LT:
+        return x < y
+    if op == IF_GT:
+        return x > y
+    if op == IF_LE:
+        return x <= y
+    if op == IF_GE:
+        return x >= y
+    if op == IF_NE:
+        return x != y
+    return x == y
+
+
+def operand_text(operand, symbol_values):
+    if operand < NONE:
+        return f't{~operand}'
+    return f'{symbol_values[operand]}'
+
+
+def render(instruction, symbol_values, indent=''):
+    # 四元式 -> 原来的三地址代码文本；标签行不缩进
+    op, dst, src1, src2, label = instruction
+    if op == LABEL:
+        return f'L{label}:'
+    if op == GOTO:
+        return f'{indent}goto L{label}'
+    if op == COPY:
+        return f'{indent}{operand_text(dst, symbol_values)} := {operand_text(src1, symbol_values)}'
+    if op in JUMPS:
+        return (f'{indent}if {operand_text(src1, symbol_values)} {OP_SYMBOLS[op]} '
+                f'{operand_text(src2, symbol_values)} goto L{label}')
+    return (f'{indent}{operand_text(dst, symbol_values)} := {operand_text(src1, symbol_values)} '
+            f'{OP_SYMBOLS[op]} {operand_text(src2, symbol_values)}')
+
+
+# 按列存放的四元式序列 (操作码, 目的, 源1, 源2, 标签)；变量名和常数只在符号表里存一份
+class Code:
+    def __init__(self, symbol_values=None, symbol_ids=None):
+        self.ops = array('B')
+        self.dst = array('i')
+        self.src1 = array('i')
+        self.src2 = array('i')
+        self.labels = array('i')
+        self.symbol_values = symbol_values if symbol_values is not None else []
+        self.symbol_ids = symbol_ids if symbol_ids is not None else {}
+        # 每条顶层语句第一个单词的下标和第一条指令的下标，由语法分析器记录；处理过的代码没有
+        self.statement_tokens = array('i')
+        self.statement_starts = array('i')
+
+    @classmethod
+    def from_tokens(cls, tokens):
+        # 沿用单词序列的符号表，单词的符号编号可以直接作为操作数
+        return cls(list(tokens.symbol_values), dict(tokens.symbol_ids))
+
+    def derive(self):
+        # 空的代码序列，与当前序列共用符号表
+        return Code(self.symbol_values, self.symbol_ids)
+
+    def intern(self, value):
+        # 区分 7 和 7.0，它们输出时不同
+        key = (type(value), value)
+        symbol = self.symbol_ids.get(key)
+        if symbol is None:
+            symbol = len(self.symbol_values)
+            self.symbol_ids[key] = symbol
+            self.symbol_values.append(value)
+        return symbol
+
+    def append(self, op, dst=NONE, src1=NONE, src2=NONE, label=NO_LABEL):
+        self.ops.append(op)
+        self.dst.append(dst)
+        self.src1.append(src1)
+        self.src2.append(src2)
+        self.labels.append(label)
+
+    def mark_statement(self, token_index):
+        self.statement_tokens.append(token_index)
+        self.statement_starts.append(len(self.ops))
+
+    def pop(self):
+        # 删除最后一条指令
+        self.ops.pop()
+        self.dst.pop()
+        self.src1.pop()
+        self.src2.pop()
+        self.labels.pop()
+
+    def extend(self, instructions):
+        for instruction in instructions:
+            self.append(*instruction)
+
+    def value(self, operand):
+        return self.symbol_values[operand]
+
+    def is_constant(self, operand):
+        return operand >= 0 and not isinstance(self.symbol_values[operand], str)
+
+    def is_variable(self, operand):
+        return operand >= 0 and isinstance(self.symbol_values[operand], str)
+
+    def render(self, instruction, indent=''):
+        return render(instruction, self.symbol_values, indent)
+
+    def lines(self, indent=''):
+        symbol_values = self.symbol_values
+        for instruction in self:
+            yield render(instruction, symbol_values, indent)
+
+    def digest_parts(self):
+        return (self.ops.tobytes(), self.dst.tobytes(), self.src1.tobytes(), self.src2.tobytes(),
+                self.labels.tobytes(), repr(self.symbol_values))
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __getitem__(self, index):
+        return self.ops[index], self.dst[index], self.src1[index], self.src2[index], self.labels[index]
+
+    def __iter__(self):
+        return zip(self.ops, self.dst, self.src1, self.src2, self.labels)
+
+    def __eq__(self, other):
+        if isinstance(other, Code):
+            return list(self.lines()) == list(other.lines())
+        return list(self.lines()) == list(other)
+
+    def __repr__(self):
+        return repr(list(self.lines()))
+
+    def __getstate__(self):
+        return (self.ops, self.dst, self.src1, self.src2, self.labels, self.symbol_values,
+                self.statement_tokens, self.statement_starts)
+
+    def __setstate__(self, state):
+        (self.ops, self.dst, self.src1, self.src2, self.labels, self.symbol_values,
+         self.statement_tokens, self.statement_starts) = state
+        self.symbol_ids = {(type(value), value): symbol for symbol, value in enumerate(self.symbol_values)}
@@ -0,0 +1,78 @@
+import os
+import random
+import sys
+
+import pytest
+
+# 测试直接导入仓库根目录下的模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark  # noqa: E402
+
+SEEDS = range(12)
+PROGRAM_BYTES = 1500
+MAX_STEPS = 20000
+
+# 手写的程序，含嵌套的 if/else、while、实数、十六进制和八进制常数；每个都含 then 或 do
+PROGRAMS = [
+    b"a = 6.2 + a * 0x88; if a > b then a = b else a = b - 1 + c; while a + acc > xx do x = x - 1;",
+    b"if a < b then if b < c then m = c else m = b else if a < c then m = c else m = a; n = m * (a + b) / (c - 1);",
+    b"while i < 10 do if i > 5 then s = s + i * 2 else s = s - (i + 3) / 2; t = (s + 1) * (s - 1);",
+    b"x = 1; y = 0x10 + 017; while x < y do x = x * 2 + 1; if x = y then z = 0 else z = x - y;",
+    b"p = 2.5 * a + 0x1f; q = p / (b + 017); if p > q then r = p - q else if p = q then r = 0 else r = q - p;",
+    b"while a > b do while b < c do if a = c then b = b + 1 else c = c - 1; d = a * (b - (c + 4) * 2) / 3;",
+]
+
+# 没有 while 的程序，在非零初值下大多能执行完
+STRAIGHT_PROGRAMS = [
+    b"a = 15 + 13 * b; if a > 3 then b = a / 2 else c = a - 1; d = (a + b) * (c - 2);",
+    b"x = 0x1f * y - 017; if x < y then if y < z then m = z else m = y else m = x; n = m / 3 + m * 2.5;",
+    PROGRAMS[1],
+    PROGRAMS[4],
+]
+
+# 会结束的循环，循环体里有不变的表达式
+LOOP_PROGRAMS = [
+    b"i = 0; s = 0; while i < 10 do i = i + 1 + 0 * (a * b); s = i * (a * b);",
+    b"n = 0; t = 0; while n < 20 do if n > 5 then n = n + 2 else n = n + 1; t = n * n - a / 3;",
+    b"k = 1000; while k > 1 do k = k / 2 - 0 * (a + b + c); x = k + a;",
+    b"i = 0; while i < 4 do while i < 9 do i = i + 1 + 0 * (b - c); j = i + (a - a);",
+    b"x = 0.5; y = 0; while y < 6 do y = y + 1 + 0 * (x * 2.5); z = y * x;",
+]
+
+
+@pytest.fixture(scope='session')
+def programs():
+    # 另外加上随机生成的程序，含 if/while 嵌套和较长的表达式
+    return PROGRAMS + [benchmark.ProgramGenerator(seed=seed, depth=2).generate(PROGRAM_BYTES) for seed in SEEDS]
+
+
+@pytest.fixture(scope='session')
+def straight_programs():
+    generated = [benchmark.ProgramGenerator(seed=seed, depth=2, while_ratio=0).generate(PROGRAM_BYTES)
+                 for seed in SEEDS]
+    return STRAIGHT_PROGRAMS + generated + LOOP_PROGRAMS
+
+
+@pytest.fixture(scope='session')
+def bindings():
+    # 几组非零的整数初值，避免大多数程序一开始就除以 0
+    sets = []
+    for seed in range(3):
+        r = random.Random(seed)
+        sets.append({name: r.choice((-1, 1)) * r.randint(1, 20) for name in benchmark.NAMES})
+    return sets
+
+
+def outcome(run, code, bindings):
+    # 执行完时返回变量的值；除以 0 或步数用完时返回 None，这样的运行不参与比较
+    try:
+        result = run(code, bindings, MAX_STEPS)
+    except ZeroDivisionError:
+        return None
+    return result.variables if result.finished else None
+
+
+def common(a, b):
+    # -O2 会删掉只写不读的变量，只比较两边都有的变量
+    return {name: a[name] for name in a.keys() & b.keys()}, {name: b[name] for name in a.keys() & b.keys()}
@@ -0,0 +1,45 @@
+import pytest
+
+import artifact
+import main
+
+
+def test_artifact_round_trip(programs, tmp_path):
+    for opt_level in (0, 2):
+        source = b''.join(programs)
+        tokens, code, processed = main.compile_source(source, opt_level=opt_level)
+        path = tmp_path / 'program.tac'
+        artifact.write_artifact(path, tokens, code, processed)
+        with artifact.Artifact(path) as compiled:
+            # -O2 折叠出的常数追加在共用的符号表后面，单词的编号不变
+            store = compiled.token_store()
+            assert list(store) == list(tokens)
+            assert (store.kinds, store.symbols, store.positions) == (tokens.kinds, tokens.symbols, tokens.positions)
+            assert list(compiled.to_code(compiled.code).lines()) == list(code.lines())
+            assert list(compiled.to_code(compiled.processed).lines()) == list(processed.lines())
+            assert compiled.to_code(compiled.code).statement_starts == code.statement_starts
+            compiled.render(tmp_path / 'artifact.txt')
+        main.write_output(tokens, code, processed, tmp_path / 'output.txt')
+        assert (tmp_path / 'artifact.txt').read_bytes() == (tmp_path / 'output.txt').read_bytes()
+
+
+def test_artifact_statements(programs, tmp_path):
+    source = programs[0]
+    tokens, code, processed = main.compile_source(source)
+    path = tmp_path / 'program.tac'
+    artifact.write_artifact(path, tokens, code, processed)
+    with artifact.Artifact(path) as compiled:
+        assert len(compiled.statements) == len(code.statement_starts)
+        token_range, instruction_range = compiled.statement(len(compiled.statements) - 1)
+        assert token_range.stop == len(tokens)
+        assert instruction_range.stop == len(code)
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'output.txt'
+    path.write_bytes(b'not an artifact' * 10)
+    with pytest.raises(artifact.ArtifactError):
+        artifact.Artifact(path)
+    path.write_bytes(b'')
+    with pytest.raises(artifact.ArtifactError):
+        artifact.Artifact(path)
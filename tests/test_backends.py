@@ -0,0 +1,111 @@
+import re
+import shutil
+
+import pytest
+
+import main
+import native_backend
+import python_backend
+from conftest import LOOP_PROGRAMS, MAX_STEPS, outcome
+from interpreter import execute
+
+
+def compiled_programs(sources, opt_level=0):
+    return [main.compile_source(source, opt_level=opt_level)[2] for source in sources]
+
+
+def integer_only(source):
+    # 去掉实数常数的小数部分，变量只有整数，生成的 C 代码都能执行
+    return re.sub(rb'(\d+)\.\d+', rb'\1', source)
+
+
+def with_reals(bindings):
+    # 再加一组浮点数初值，生成的 C 代码按 double 处理这些变量
+    return bindings + [{name: value + 0.5 for name, value in bindings[0].items()}]
+
+
+def run_python(code, bindings, max_steps):
+    return python_backend.CompiledProgram(code).run(bindings, max_steps)
+
+
+def run_native(code, bindings, max_steps):
+    return native_backend.NativeProgram(code).run(bindings, max_steps)
+
+
+def assert_backend_matches(run, codes, bindings):
+    compared = 0
+    for code in codes:
+        for values in bindings:
+            expected = outcome(execute, code, values)
+            assert outcome(run, code, values) == expected
+            compared += expected is not None
+    assert compared >= len(codes)
+
+
+def stopped_at(run, code, bindings, max_steps):
+    try:
+        result = run(code, bindings, max_steps)
+    except ZeroDivisionError:
+        return None
+    return result.variables, result.steps, result.finished
+
+
+def assert_budgets_match(run, codes, bindings, budgets=range(40)):
+    # 步数在一段指令中间用完时，停在与解释器相同的指令上
+    for code in codes:
+        for max_steps in budgets:
+            assert stopped_at(run, code, bindings, max_steps) == stopped_at(execute, code, bindings, max_steps)
+
+
+def test_python_backend_matches_interpreter(straight_programs, programs, bindings):
+    assert_backend_matches(run_python, compiled_programs(straight_programs + programs), with_reals(bindings))
+    assert_backend_matches(run_python, compiled_programs(straight_programs, 2), bindings)
+
+
+def test_python_backend_stops_within_step_budget(straight_programs, bindings):
+    code = compiled_programs([b'a = 1; b = 2; c = 3; d = 4; e = 5;'])[0]
+    result = run_python(code, {}, 2)
+    assert (result.steps, result.finished) == (2, False)
+    assert result.variables == {'a': 1, 'b': 2, 'c': 0, 'd': 0, 'e': 0}
+    assert_budgets_match(run_python, compiled_programs(LOOP_PROGRAMS + straight_programs[:4]), bindings[1])
+
+
+@pytest.mark.skipif(shutil.which('gcc') is None, reason="the native backend needs gcc")
+def test_native_backend_matches_interpreter(straight_programs, bindings, tmp_path, monkeypatch):
+    # 共享库编译到临时目录，不留在仓库的 .compile_cache 里
+    monkeypatch.setattr(native_backend, 'NATIVE_DIR', str(tmp_path))
+    integer_codes = compiled_programs([integer_only(source) for source in straight_programs[-9:]])
+    for code in integer_codes:
+        native_backend.generate_c(code)
+    assert_backend_matches(run_native, integer_codes, bindings)
+    # 变量既有整数又有浮点数的程序退回 python_backend 执行
+    assert_backend_matches(run_native, compiled_programs(straight_programs), with_reals(bindings))
+
+
+@pytest.mark.skipif(shutil.which('gcc') is None, reason="the native backend needs gcc")
+def test_native_backend_stops_within_step_budget(straight_programs, bindings, tmp_path, monkeypatch):
+    monkeypatch.setattr(native_backend, 'NATIVE_DIR', str(tmp_path))
+    code = compiled_programs([b'a = 1; b = 2; c = 3; d = 4; e = 5;'])[0]
+    result = run_native(code, {}, 2)
+    assert (result.steps, result.finished) == (2, False)
+    assert result.variables == {'a': 1, 'b': 2, 'c': 0, 'd': 0, 'e': 0}
+    sources = [integer_only(source) for source in LOOP_PROGRAMS + straight_programs[:4]]
+    assert_budgets_match(run_native, compiled_programs(sources), bindings[1])
+
+
+def test_vector_backend_matches_interpreter(straight_programs, programs, bindings):
+    pytest.importorskip('numpy')
+    import vector_backend
+    lanes = with_reals(bindings)
+    columns = {name: [values[name] for values in lanes] for name in lanes[0]}
+    for code in compiled_programs(straight_programs + programs[:2]):
+        result = vector_backend.BatchExecutable(code).run(columns, MAX_STEPS, len(lanes))
+        for lane, values in enumerate(lanes):
+            try:
+                expected = execute(code, values, MAX_STEPS)
+            except ZeroDivisionError:
+                assert result.failed[lane]
+                continue
+            assert result.finished[lane] == expected.finished
+            if expected.finished:
+                assert {name: result.columns[name][lane] for name in expected.variables} == expected.variables
@@ -0,0 +1,27 @@
+import batch
+import main
+
+
+def test_batch_matches_single_file_compiles(programs, tmp_path):
+    sources = tmp_path / 'src'
+    (sources / 'sub').mkdir(parents=True)
+    paths = []
+    for index, source in enumerate(programs):
+        path = sources / ('sub' if index % 2 else '') / f'p{index}.txt'
+        path.write_bytes(source)
+        paths.append(path)
+    # 出错的文件只记在结果里，不影响其他文件
+    (sources / 'broken.txt').write_bytes(b'if a then b = 1;')
+
+    for cache_dir in (None, str(tmp_path / 'cache'), str(tmp_path / 'cache')):
+        output_dir = tmp_path / 'out'
+        results, _ = batch.run_batch([str(sources)], str(output_dir), 2, cache_dir)
+        assert len(results) == len(programs) + 1
+        failed = [result for result in results if not result['ok']]
+        assert [result['source'] for result in failed] == [str(sources / 'broken.txt')]
+        assert failed[0]['error'].startswith('SyntaxError')
+        for path, source in zip(paths, programs):
+            expected = tmp_path / 'expected.txt'
+            main.write_output(*main.compile_source(source), expected)
+            output = output_dir / path.relative_to(sources).with_suffix(batch.OUTPUT_SUFFIX)
+            assert output.read_text() == expected.read_text()
@@ -0,0 +1,89 @@
+import json
+import os
+import subprocess
+import sys
+
+import benchmark
+import main
+
+BENCHMARK_PATH = os.path.join(os.path.dirname(os.path.abspath(benchmark.__file__)), 'benchmark.py')
+
+
+def results(seconds=1.0, peak=None, rss=100 * 1024 ** 2, size='1M', tokens=100000, jobs=1):
+    phase = {'seconds': seconds, 'tokens_per_second': tokens / seconds}
+    if peak is not None:
+        phase['peak_bytes'] = peak
+    return {'results': [{'size': size, 'tokens': tokens, 'jobs': jobs, 'peak_rss_bytes': rss,
+                         'phases': {'parse': phase}}]}
+
+
+def test_generator_is_deterministic_and_parses():
+    source = benchmark.ProgramGenerator(seed=3).generate(4096)
+    assert source == benchmark.ProgramGenerator(seed=3).generate(4096)
+    assert source != benchmark.ProgramGenerator(seed=4).generate(4096)
+    assert len(source) >= 4096
+    assert len(main.compile_source(source)[1]) > 0
+
+
+def test_parse_size():
+    assert [benchmark.parse_size(text) for text in ('1024', '64K', '10M', '1g')] == [1024, 65536, 10 << 20, 1 << 30]
+    assert benchmark.format_size(10 << 20) == '10M'
+
+
+def test_compare_finds_regressions():
+    baseline = results(peak=1000)
+    assert benchmark.compare(results(peak=1000), baseline) == []
+    # 在阈值以内的变化不算退化
+    assert benchmark.compare(results(seconds=1.2, peak=1200, rss=120 * 1024 ** 2), baseline) == []
+
+    slower = benchmark.compare(results(seconds=2.0, peak=1000), baseline)
+    assert len(slower) == 1 and slower[0].startswith('1M parse: 50,000 tokens/s, baseline 100,000 (-50%)')
+    bigger = benchmark.compare(results(peak=2000), baseline)
+    assert len(bigger) == 1 and 'peak 2,000 bytes' in bigger[0]
+    more_rss = benchmark.compare(results(peak=1000, rss=200 * 1024 ** 2), baseline)
+    assert len(more_rss) == 1 and 'peak RSS' in more_rss[0]
+    assert len(benchmark.compare(results(seconds=2.0, peak=2000), baseline, threshold=1.5)) == 0
+
+
+def test_compare_skips_short_phases_and_new_sizes():
+    baseline = results(seconds=benchmark.MIN_COMPARE_SECONDS / 2)
+    assert benchmark.compare(results(seconds=benchmark.MIN_COMPARE_SECONDS * 10), baseline) == []
+    assert benchmark.compare(results(seconds=10.0, size='10M'), results()) == []
+
+
+def test_compare_skips_sizes_parsed_with_other_jobs():
+    assert benchmark.compare(results(seconds=10.0, jobs=2), results()) == []
+    assert len(benchmark.compare(results(seconds=10.0, jobs=2), results(jobs=2))) == 1
+
+
+def test_run_size_reports_phases():
+    entry = benchmark.run_size(4096, {'seed': 1}, repeat=2)
+    assert entry['size'] == '4K' and entry['bytes'] >= 4096
+    assert entry['tokens'] > 0 and entry['instructions'] > 0
+    assert entry['jobs'] == 1
+    assert {'scanner', 'lexer', 'parse', 'process'} <= set(entry['phases'])
+    # 只有处理三地址代码的阶段报告每秒指令数
+    assert [name for name, phase in entry['phases'].items() if 'instructions_per_second' in phase] == ['process']
+
+
+def test_stream_run_counts_instructions():
+    entry = benchmark.run_size(4096, {'seed': 1}, repeat=1, stream=True)
+    source = benchmark.ProgramGenerator(seed=1).generate(4096)
+    assert entry['instructions'] == len(main.compile_source(source)[1])
+    assert entry['phases']['stream']['instructions_per_second'] > 0
+
+
+def test_benchmark_cli_against_baseline(tmp_path):
+    command = [sys.executable, BENCHMARK_PATH, '--sizes', '2K', '--repeat', '1', '-o', 'results.json',
+               '--baseline', 'baseline.json']
+    subprocess.run(command + ['--update-baseline'], cwd=tmp_path, check=True, capture_output=True, timeout=120)
+    baseline = json.loads((tmp_path / 'baseline.json').read_text())
+    assert [entry['size'] for entry in baseline['results']] == ['2K']
+    # 基线的吞吐量调到很高，再运行一次就报告退化
+    for phase in baseline['results'][0]['phases'].values():
+        phase['seconds'] = 1.0
+        phase['tokens_per_second'] *= 1000
+    (tmp_path / 'baseline.json').write_text(json.dumps(baseline))
+    run = subprocess.run(command, cwd=tmp_path, capture_output=True, text=True, timeout=120)
+    assert run.returncode == 1
+    assert 'REGRESSION 2K' in run.stdout
@@ -0,0 +1,116 @@
+import json
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+
+import compile_cache
+import main
+from compile_cache import CompileCache
+
+SOURCE = b"a = 15 + 13 * b; if a > 3 then b = a / 2 else c = a - 1; while b < 100 do b = b * 2;"
+MAIN_PATH = os.path.join(compile_cache.BASE_DIR, 'main.py')
+
+
+def output_text(result, path):
+    main.write_output(*result, path)
+    return path.read_text()
+
+
+def test_second_compile_hits_every_stage(tmp_path):
+    cache = CompileCache(str(tmp_path / 'cache'))
+    expected = output_text(main.compile_source(SOURCE), tmp_path / 'plain.txt')
+    assert output_text(main.compile_source(SOURCE, cache), tmp_path / 'miss.txt') == expected
+    assert cache.stats()['misses'] == {'tokens': 1, 'tac': 1, 'processed': 1}
+    assert output_text(main.compile_source(SOURCE, cache), tmp_path / 'hit.txt') == expected
+    stats = cache.stats()
+    assert stats['hits'] == {'tokens': 1, 'tac': 1, 'processed': 1}
+    assert stats['entries'] == 3
+
+
+def test_same_tokens_reuse_later_stages(tmp_path):
+    # 只改空白：单词阶段重新扫描，语法分析和处理直接命中
+    cache = CompileCache(str(tmp_path / 'cache'))
+    main.compile_source(SOURCE, cache)
+    main.compile_source(SOURCE.replace(b'; ', b';\n  '), cache)
+    stats = cache.stats()
+    assert stats['misses'] == {'tokens': 2, 'tac': 1, 'processed': 1}
+    assert stats['hits'] == {'tokens': 0, 'tac': 1, 'processed': 1}
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = CompileCache(str(tmp_path / 'cache'))
+    now = time.time()
+    for key, age in (('a', 300), ('b', 200), ('c', 100)):
+        cache.put(key, b'x' * 1000)
+        os.utime(os.path.join(cache.directory, key + '.pkl'), (now - age, now - age))
+    # 读过的条目修改时间更新，不会先被淘汰
+    assert cache.get('tokens', 'a') == b'x' * 1000
+    cache.max_bytes = 2500
+    cache.put('d', b'x' * 1000)
+    remaining = sorted(name[:-4] for name in os.listdir(cache.directory))
+    assert remaining == ['a', 'd']
+    assert cache.stats()['evictions'] == 2
+    assert cache.total_bytes <= 2500
+
+
+def test_overwrite_replaces_entry_size(tmp_path):
+    cache = CompileCache(str(tmp_path / 'cache'))
+    cache.put('a', b'x' * 1000)
+    cache.put('a', b'x' * 10)
+    assert cache.total_bytes == os.path.getsize(os.path.join(cache.directory, 'a.pkl'))
+    assert CompileCache(cache.directory).total_bytes == cache.total_bytes
+
+
+def test_unreadable_entry_is_a_miss_and_removed(tmp_path):
+    cache = CompileCache(str(tmp_path / 'cache'))
+    cache.put('ok', b'x' * 100)
+    # 写了一半的条目，以及引用了不存在的模块的条目
+    data = pickle.dumps(main.compile_source(SOURCE)[1])
+    entries = {'truncated': data[:len(data) // 2], 'missing_class': b'\x80\x04cno_such_module\nThing\n)\x81.'}
+    for key, data in entries.items():
+        with open(os.path.join(cache.directory, key + '.pkl'), 'wb') as file:
+            file.write(data)
+    cache = CompileCache(cache.directory)
+    for key in entries:
+        assert cache.get('tac', key) is None
+        assert not os.path.exists(os.path.join(cache.directory, key + '.pkl'))
+    assert cache.stats()['misses']['tac'] == len(entries)
+    assert cache.total_bytes == os.path.getsize(os.path.join(cache.directory, 'ok.pkl'))
+
+
+@pytest.mark.parametrize('name', compile_cache.SCANNER_FILES + compile_cache.FRONTEND_FILES)
+def test_source_file_change_invalidates(tmp_path, monkeypatch, name):
+    base = tmp_path / 'src'
+    base.mkdir()
+    for name in compile_cache.SCANNER_FILES + compile_cache.FRONTEND_FILES:
+        shutil.copy(os.path.join(compile_cache.BASE_DIR, name), base / name)
+    monkeypatch.setattr(compile_cache, 'BASE_DIR', str(base))
+    directory = str(tmp_path / 'cache')
+    main.compile_source(SOURCE, CompileCache(directory))
+    cache = CompileCache(directory)
+    main.compile_source(SOURCE, cache)
+    assert cache.stats()['hits'] == {'tokens': 1, 'tac': 1, 'processed': 1}
+
+    with open(base / name, 'ab') as file:
+        file.write(b'\n// changed\n' if name.endswith('.c') else b'\n# changed\n')
+    cache = CompileCache(directory)
+    main.compile_source(SOURCE, cache)
+    assert cache.stats()['hits'] == {'tokens': 0, 'tac': 0, 'processed': 0}
+
+
+def test_cache_size_option(tmp_path):
+    # 上限小于任何一个条目：每次写入后都淘汰，结果照常输出
+    (tmp_path / main.SOURCE_FILE).write_bytes(SOURCE)
+    command = [sys.executable, MAIN_PATH, '--cache-dir', str(tmp_path / 'cache'), '--cache-size', '1', '--cache-stats']
+    out = subprocess.run(command, cwd=tmp_path, check=True, capture_output=True, text=True, timeout=60).stdout
+    stats = json.loads(out[out.rfind('\n{\n') + 1:])
+    assert stats['max_bytes'] == 1
+    assert stats['entries'] == 0
+    assert stats['evictions'] == 3
+    expected = output_text(main.compile_source(SOURCE), tmp_path / 'plain.txt')
+    assert (tmp_path / 'output.txt').read_text() == expected
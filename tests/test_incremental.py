@@ -0,0 +1,48 @@
+import random
+
+import pytest
+
+import frontend
+import main
+from incremental import IncrementalCompiler
+
+
+def edits(source, seed):
+    # 一串修改后的版本：改一个数、删掉一段、插入一条语句、在开头和末尾加语句、恢复原样
+    r = random.Random(seed)
+    statements = source.split(b';')[:-1]
+    middle = r.randrange(len(statements))
+    yield source.replace(b'1', b'42', 1)
+    yield b';'.join(statements[:middle] + statements[middle + 2:]) + b';'
+    yield b';'.join(statements[:middle] + [b' y = (a + 3) * b'] + statements[middle:]) + b';'
+    yield b'z = 7;' + source + b' w = z - 1;'
+    yield source
+
+
+@pytest.mark.parametrize('parser_class', [main.Parser, frontend.TreeParser])
+def test_incremental_matches_full_compile(programs, parser_class):
+    for seed, source in enumerate(programs[:4]):
+        compiler = IncrementalCompiler(parser_class)
+        compiler.update(source)
+        for version in edits(source, seed):
+            compiler.update(version)
+            tokens, code, processed = main.compile_source(version, parser_class=parser_class)
+            assert list(compiler.tokens()) == list(tokens)
+            assert list(compiler.code().lines()) == list(code.lines())
+            assert compiler.code().statement_starts == code.statement_starts
+            assert list(compiler.processed_code().lines()) == list(processed.lines())
+
+
+def test_incremental_reparses_only_the_edit(programs):
+    # 在末尾加一条语句，只重新分析末尾附近的语句
+    source = programs[0]
+    compiler = IncrementalCompiler()
+    compiler.update(source)
+    count = len(compiler.statements)
+    end = source.rindex(b';') + 1
+    version = source[:end] + b' q = 5;' + source[end:]
+    first, removed, added = compiler.update(version)
+    assert first >= count - 2
+    assert removed <= 2
+    assert len(compiler.statements) == count - removed + added
+    assert len(compiler.statements) == len(main.compile_source(version)[1].statement_starts)
@@ -0,0 +1,79 @@
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+
+import pytest
+
+import instrument
+import main
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.abspath(main.__file__)), 'main.py')
+
+
+@pytest.fixture
+def instrumentation():
+    current = instrument.Instrumentation()
+    previous = instrument.install(current)
+    yield current
+    instrument.install(previous)
+
+
+def test_compile_reports_phases_and_counters(programs, instrumentation, tmp_path):
+    source = b''.join(programs)
+    tokens, code, processed_code = main.compile_source(source)
+    main.write_output(tokens, code, processed_code, tmp_path / 'output.txt')
+    report = instrumentation.report()
+    assert {'scanner', 'lexer', 'parse', 'process', 'output'} <= set(report['phases'])
+    assert all(phase['calls'] == 1 for phase in report['phases'].values())
+    assert report['total_seconds'] == pytest.approx(sum(phase['seconds'] for phase in report['phases'].values()))
+
+    parser = main.Parser(tokens)
+    parser.parse()
+    counters = report['counters']
+    assert counters['tokens'] == len(tokens)
+    assert (counters['statements'], counters['temps'], counters['labels']) == \
+        (parser.statement_count, parser.temp_count, parser.label_count)
+    assert counters['removed_labels'] >= 0
+
+
+def test_nested_phase_keeps_outer_peak():
+    instrumentation = instrument.Instrumentation(memory=True)
+    size = 4 * 1024 * 1024
+    try:
+        with instrumentation.phase('outer'):
+            data = bytearray(size)
+            del data
+            with instrumentation.phase('inner'):
+                pass
+    finally:
+        tracemalloc.stop()
+    # 外层阶段在内层开始之前的峰值不会因为内层重置峰值而丢失
+    assert instrumentation.peak_memory['outer'] >= size
+    assert instrumentation.peak_memory['inner'] < size
+
+
+def test_null_instrumentation_is_the_default():
+    assert not instrument.enabled()
+    assert not instrument.tracing()
+    with instrument.phase('parse'):
+        instrument.count('tokens')
+
+
+def run_main(tmp_path, source, *options):
+    (tmp_path / main.SOURCE_FILE).write_bytes(source)
+    command = [sys.executable, MAIN_PATH, '--no-cache', *options]
+    return subprocess.run(command, cwd=tmp_path, check=True, capture_output=True, text=True, timeout=60).stdout
+
+
+def test_profile_options(programs, tmp_path):
+    out = run_main(tmp_path, programs[0], '--profile', 'profile.json', '--profile-memory', '--trace')
+    report = json.loads((tmp_path / 'profile.json').read_text())
+    assert {'scanner', 'lexer', 'parse', 'process', 'output'} <= set(report['phases'])
+    assert all(phase['peak_bytes'] > 0 for phase in report['phases'].values())
+    assert report['counters']['tokens'] == len(main.scan_tokens(programs[0]))
+    assert report['counters']['statements'] > 0
+    assert 'Current Token' in out
+    # 不加 --trace 时语法分析没有调试输出
+    assert run_main(tmp_path, programs[0]) == ''
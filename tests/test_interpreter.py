@@ -0,0 +1,37 @@
+import pytest
+
+import main
+from interpreter import execute
+
+
+def compile_program(source):
+    return main.compile_source(source)[2]
+
+
+def test_arithmetic_follows_constant_folding():
+    # 整数除法向零截断，有实数时是浮点数除法
+    code = compile_program(b'a = 7 / 2; b = 0 - 7 / 2; c = 7.0 / 2; d = x * 3 + 0x10; if d > 20 then e = 1 else e = 2;')
+    result = execute(code, {'x': 5})
+    assert result.finished
+    assert result.variables == {'a': 3, 'b': -3, 'c': 3.5, 'd': 31, 'e': 1, 'x': 5}
+
+
+def test_step_budget():
+    code = compile_program(b'a = 1; b = 2; c = 3; d = 4; e = 5;')
+    result = execute(code, max_steps=2)
+    assert not result.finished
+    assert result.steps == 2
+    assert result.variables == {'a': 1, 'b': 2, 'c': 0, 'd': 0, 'e': 0}
+    assert execute(code, max_steps=5).finished
+
+
+def test_loop_runs_to_completion():
+    result = execute(compile_program(b'i = 0; while i < 10 do i = i + 1; s = i * 2;'))
+    assert result.finished
+    assert result.variables == {'i': 10, 's': 20}
+    assert not execute(compile_program(b'while 1 > 0 do i = i + 1;'), max_steps=1000).finished
+
+
+def test_division_by_zero():
+    with pytest.raises(ZeroDivisionError):
+        execute(compile_program(b'a = b / c;'))
@@ -0,0 +1,90 @@
+import main
+import optimize
+from conftest import LOOP_PROGRAMS, common, outcome
+from interpreter import execute
+from tac import is_temp
+
+
+def compare_levels(sources, bindings, **options):
+    # 每个程序在各组初值下，优化后的代码与未优化的代码结果相同；返回比较过的次数
+    compared = 0
+    for source in sources:
+        code = main.Parser(main.scan_tokens(source)).parse()
+        raw = main.process_three_address_code(code)
+        optimized = main.run_processing(code, **options)[0]
+        for values in bindings:
+            expected = outcome(execute, raw, values)
+            if expected is not None:
+                result = outcome(execute, optimized, values)
+                assert result is not None
+                assert common(result, expected)[0] == common(result, expected)[1]
+                compared += 1
+    return compared
+
+
+def test_o1_folds_constants_and_reuses_expressions():
+    code = main.Parser(main.scan_tokens(b'a = 2 * 3 + 1; b = a * c; d = a * c + b; e = 5;')).parse()
+    optimized, removed = main.run_optimizer(code, 1)
+    assert list(optimized.lines()) == ['a := 7', 'b := 7 * c', 'd := b + b', 'e := 5']
+    assert sum(removed.values()) == len(code) - len(optimized)
+
+
+def test_optimizing_does_not_grow_code(programs):
+    for source in programs:
+        code = main.Parser(main.scan_tokens(source)).parse()
+        for opt_level in (1, 2):
+            assert len(main.run_optimizer(code, opt_level)[0]) <= len(code)
+
+
+def test_o1_preserves_results(straight_programs, bindings):
+    assert compare_levels(straight_programs, bindings, opt_level=1) >= len(straight_programs)
+
+
+def test_o2_preserves_results(straight_programs, bindings):
+    assert compare_levels(straight_programs, bindings, opt_level=2) >= len(straight_programs)
+
+
+def temp_count(code):
+    return len({operand for instruction in code for operand in instruction[1:4] if is_temp(operand)})
+
+
+def test_recycled_temps_preserve_results(straight_programs, bindings):
+    assert compare_levels(straight_programs, bindings, recycle_temps=True) >= len(straight_programs)
+    assert compare_levels(straight_programs, bindings, opt_level=2, recycle_temps=True) >= len(straight_programs)
+
+
+def test_recycling_reports_temp_counts(programs):
+    for source in programs:
+        processed = main.compile_source(source)[2]
+        recycled, before, after = optimize.recycle_temps(processed)
+        assert before == temp_count(processed)
+        assert after == temp_count(recycled) <= before
+        assert len(recycled) == len(processed)
+
+
+def test_licm_hoists_and_preserves_results(bindings):
+    hoisted = 0
+    for source in LOOP_PROGRAMS:
+        processed = main.compile_source(source)[2]
+        report = {}
+        hoisted_code = optimize.hoist_loop_invariants(processed, report)
+        hoisted += sum(report.values())
+        for values in bindings:
+            expected = outcome(execute, processed, values)
+            assert expected is not None
+            assert outcome(execute, hoisted_code, values) == expected
+    assert hoisted > 0
+
+
+def test_o2_with_and_without_licm(straight_programs, bindings, monkeypatch):
+    with_licm = [main.compile_source(source, opt_level=2)[2] for source in straight_programs]
+    monkeypatch.setitem(optimize.LEVELS, 2, [name for name in optimize.LEVELS[2] if name != 'licm'])
+    without_licm = [main.compile_source(source, opt_level=2)[2] for source in straight_programs]
+    compared = 0
+    for hoisted, plain in zip(with_licm, without_licm):
+        for values in bindings:
+            expected = outcome(execute, plain, values)
+            if expected is not None:
+                assert outcome(execute, hoisted, values) == expected
+                compared += 1
+    assert compared >= len(straight_programs)
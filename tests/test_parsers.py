@@ -0,0 +1,130 @@
+import io
+
+import pytest
+
+import frontend
+import main
+import parallel
+from conftest import outcome
+from interpreter import execute
+from tac import GOTO, LABEL, NO_LABEL
+
+
+def code_lines(code):
+    return list(code.lines())
+
+
+def tree_text(trees):
+    out = io.StringIO()
+    for tree in trees:
+        tree.write(out)
+    return out.getvalue()
+
+
+def broken(source):
+    # 删掉 then/do 之后程序不能通过语法分析
+    return source.replace(b' then ', b' ', 1).replace(b' do ', b' ', 1)
+
+
+@pytest.mark.parametrize('parser_class', [main.StackParser, frontend.TreeParser])
+def test_parser_matches_recursive(programs, parser_class):
+    for source in programs:
+        tokens = main.scan_tokens(source)
+        expected = main.Parser(tokens)
+        parser = parser_class(tokens)
+        code = parser.parse()
+        assert code_lines(code) == code_lines(expected.parse())
+        assert code.statement_starts == expected.code.statement_starts
+        assert (parser.temp_count, parser.label_count) == (expected.temp_count, expected.label_count)
+
+
+@pytest.mark.parametrize('parser_class', [main.StackParser, frontend.TreeParser])
+def test_parser_rejects_what_recursive_rejects(programs, parser_class):
+    for source in programs:
+        tokens = main.scan_tokens(broken(source))
+        with pytest.raises(SyntaxError):
+            main.Parser(tokens).parse()
+        with pytest.raises(SyntaxError):
+            parser_class(tokens).parse()
+
+
+def test_stack_parser_deep_nesting():
+    # 递归下降会超过递归深度的嵌套
+    depth = 5000
+    source = b'x = ' + b'(' * depth + b'a + 1' + b')' * depth + b';'
+    code = main.StackParser(main.scan_tokens(source)).parse()
+    assert len(code) == 2
+
+
+def test_tree_parser_keeps_the_same_trees(programs):
+    for source in programs:
+        tokens = main.scan_tokens(source)
+        parser = frontend.TreeParser(tokens, keep_trees=True)
+        code = parser.parse()
+        assert code_lines(code) == code_lines(main.Parser(tokens).parse())
+        assert tree_text(parser.trees) == tree_text(frontend.parse_trees(tokens))
+
+
+def test_compile_source_trees_match_separate_parse(programs):
+    trees = []
+    tokens, code, processed = main.compile_source(programs[0], trees=trees)
+    assert tree_text(trees) == tree_text(frontend.parse_trees(tokens))
+    assert code_lines(code) == code_lines(main.compile_source(programs[0])[1])
+
+
+@pytest.mark.parametrize('parser_class', [main.Parser, main.StackParser])
+def test_parallel_parser_matches_serial(programs, monkeypatch, parser_class):
+    # 调小阈值，测试用的小程序也分组在多个进程中分析
+    monkeypatch.setattr(parallel, 'MIN_PARALLEL_TOKENS', 0)
+    monkeypatch.setattr(parallel, 'MIN_GROUP_TOKENS', 100)
+    source = b''.join(programs)
+    tokens = main.scan_tokens(source)
+    parser = parallel.ParallelParser(tokens, parser_class, 2)
+    code = parser.parse()
+    expected = main.Parser(tokens)
+    assert code_lines(code) == code_lines(expected.parse())
+    assert code.statement_starts == expected.code.statement_starts
+    assert parser.jobs_used == 2
+    assert (parser.temp_count, parser.label_count) == (expected.temp_count, expected.label_count)
+
+
+def test_parallel_parser_small_input_is_serial(programs):
+    parser = parallel.ParallelParser(main.scan_tokens(programs[0]), main.Parser, 4)
+    parser.parse()
+    assert parser.jobs_used == 1
+
+
+def test_backpatch_parser_runs_like_recursive(programs, straight_programs, bindings):
+    compared = 0
+    for source in programs + straight_programs:
+        tokens = main.scan_tokens(source)
+        expected_code = main.process_three_address_code(main.Parser(tokens).parse())
+        code = main.BackpatchParser(tokens).parse()
+        assert len(code) <= len(expected_code)
+        for values in bindings:
+            expected = outcome(execute, expected_code, values)
+            if expected is not None:
+                assert outcome(execute, code, values) == expected
+                compared += 1
+    assert compared >= len(straight_programs)
+
+
+def test_backpatch_parser_emits_compact_code(programs):
+    for source in programs:
+        code = main.BackpatchParser(main.scan_tokens(source)).parse()
+        targets = {label for op, label in zip(code.ops, code.labels) if op != LABEL and label != NO_LABEL}
+        for index, op in enumerate(code.ops):
+            if op == LABEL:
+                # 只在有跳转指向的位置生成标签，同一位置只有一个
+                assert code.labels[index] in targets
+                assert index == 0 or code.ops[index - 1] != LABEL
+            elif op == GOTO and index + 1 < len(code):
+                # 不生成跳到下一条指令的 goto
+                assert not (code.ops[index + 1] == LABEL and code.labels[index + 1] == code.labels[index])
+
+
+def test_backpatch_parser_rejects_what_recursive_rejects(programs):
+    for source in programs:
+        tokens = main.scan_tokens(broken(source))
+        with pytest.raises(SyntaxError):
+            main.BackpatchParser(tokens).parse()
@@ -0,0 +1,34 @@
+import main
+from conftest import outcome
+from interpreter import execute
+from tac import GOTO, LABEL
+
+
+def test_jumps_are_threaded_and_labels_renumbered():
+    code = main.Parser(main.scan_tokens(b'if a > b then if c > d then x = 1 else x = 2; y = 3;')).parse()
+    # 相邻的 L2、L3 合并；跳到只有 goto 的块 L6 的跳转直接跳到最终目标，顺序执行进入 L6 的保留这条 goto；
+    # 剩下的标签按出现顺序重新编号
+    assert list(main.process_three_address_code(code).lines()) == [
+        'if a > b goto L1', 'goto L4', 'L1:', 'if c > d goto L2', 'goto L3', 'L2:', 'x := 1', 'goto L4',
+        'L3:', 'x := 2', 'goto L4', 'L4:', 'y := 3']
+
+
+def test_processing_never_adds_jumps_or_labels(programs):
+    for source in programs:
+        code = main.Parser(main.scan_tokens(source)).parse()
+        processed = main.process_three_address_code(code)
+        assert processed.ops.count(LABEL) <= code.ops.count(LABEL)
+        assert processed.ops.count(GOTO) <= code.ops.count(GOTO)
+
+
+def test_processed_code_runs_like_raw_code(straight_programs, bindings):
+    compared = 0
+    for source in straight_programs:
+        code = main.Parser(main.scan_tokens(source)).parse()
+        processed = main.process_three_address_code(code)
+        for values in bindings:
+            expected = outcome(execute, code, values)
+            if expected is not None:
+                assert outcome(execute, processed, values) == expected
+                compared += 1
+    assert compared >= len(straight_programs)
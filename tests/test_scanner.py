@@ -0,0 +1,52 @@
+import pickle
+import shutil
+import subprocess
+
+import pytest
+
+import main
+import scanner
+from token_store import TokenStore
+
+SOURCE = b"""a = 15.13 + 13.24;
+b = 0.1 * 3.5 - 0x1f + 017;
+c = 0x1.8 + 0.33333333;
+while a > b do a = a - 1.25;
+if a < 3 then b = 2 else b = 0x20;
+"""
+
+
+@pytest.fixture(scope='module')
+def lab1_tokens(tmp_path_factory):
+    # 原来的文本路径：编译 ./lab1，读取 lab1_testset_wrong.txt，输出 lab1_output.txt
+    if shutil.which('gcc') is None:
+        pytest.skip('gcc not available')
+    directory = tmp_path_factory.mktemp('lab1')
+    subprocess.run(['gcc', scanner.SOURCE_PATH, '-o', str(directory / 'lab1'), '-lm'], check=True, timeout=60)
+    (directory / 'lab1_testset_wrong.txt').write_bytes(SOURCE)
+    subprocess.run([str(directory / 'lab1')], cwd=directory, check=True, timeout=30)
+    return main.lexer((directory / 'lab1_output.txt').read_text())
+
+
+def test_scan_matches_lab1_text(lab1_tokens):
+    tokens = main.scan_tokens(SOURCE)
+    assert list(tokens) == list(lab1_tokens)
+    assert ('NUMBER', 15.13) in list(tokens)
+
+
+def test_iter_scan_matches_lab1_text(lab1_tokens):
+    assert list(main.iter_scan_tokens(SOURCE)) == list(lab1_tokens)
+
+
+def test_token_store_round_trips_through_pickle():
+    tokens = main.scan_tokens(SOURCE)
+    copy = pickle.loads(pickle.dumps(tokens))
+    assert copy == tokens
+    assert list(copy) == list(tokens)
+    assert [copy[index] for index in range(len(copy))] == list(tokens)
+
+
+def test_real_values_use_lab1_format():
+    tokens = list(TokenStore.from_scan(scanner.scan(b'x = 15.13 + 13.24 + 0.5;')))
+    assert tokens[2] == ('NUMBER', 15.13)
+    assert tokens[4] == ('NUMBER', 13.24)
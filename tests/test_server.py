@@ -0,0 +1,96 @@
+import asyncio
+import json
+
+import main
+import server
+
+
+def run_server(tmp_path, scenario, server_class=server.CompileServer, **options):
+    # 在临时 Unix 套接字上启动服务，scenario(连接函数) 结束后关闭服务，返回 (scenario 的结果, 服务的统计)
+    path = str(tmp_path / 'compile.sock')
+    compile_server = server_class(workers=1, **options)
+
+    async def main_task():
+        listener = await asyncio.start_unix_server(compile_server.handle, path, limit=server.MAX_REQUEST_BYTES)
+        await compile_server.warm_up()
+        async with listener:
+            result = await scenario(lambda: asyncio.open_unix_connection(path, limit=server.MAX_REQUEST_BYTES))
+        return result, dict(compile_server.stats)
+
+    try:
+        return asyncio.run(main_task())
+    finally:
+        compile_server.close()
+
+
+async def exchange(connect, requests):
+    # 一次写出全部请求，按 id 收集回复
+    reader, writer = await connect()
+    writer.write(b''.join(json.dumps(request).encode('utf-8') + b'\n' for request in requests))
+    await writer.drain()
+    replies = {}
+    for _ in requests:
+        reply = json.loads(await reader.readline())
+        replies[reply.pop('id')] = reply
+    writer.close()
+    await writer.wait_closed()
+    return replies
+
+
+def test_identical_requests_share_one_compile(programs, tmp_path):
+    source = b''.join(programs)
+    requests = [{'id': index, 'source': source.decode()} for index in range(5)] + [{'id': 'stats', 'op': 'stats'}]
+    replies, stats = run_server(tmp_path, lambda connect: exchange(connect, requests))
+    tokens, code, processed = main.compile_source(source)
+    for index in range(5):
+        assert replies[index]['ok']
+        assert replies[index]['tokens'] == [list(token) for token in tokens]
+        assert replies[index]['code'] == list(code.lines())
+        assert replies[index]['processed'] == list(processed.lines('\t'))
+    assert (stats['requests'], stats['compiled'], stats['coalesced']) == (6, 1, 4)
+    assert replies['stats']['ok']
+
+
+def test_rejects_requests_over_max_pending(programs, tmp_path):
+    # 第一个请求占住唯一的排队位置，其余不同的请求直接回复 busy
+    requests = [{'id': index, 'source': source.decode()} for index, source in enumerate(programs[:3])]
+    replies, stats = run_server(tmp_path, lambda connect: exchange(connect, requests), max_pending=1)
+    assert replies[0]['ok']
+    assert replies[1] == replies[2] == {'ok': False, 'error': 'server busy'}
+    assert (stats['compiled'], stats['rejected']) == (1, 2)
+
+
+class SlowServer(server.CompileServer):
+    # 不真正编译，记录同时处理的请求数
+    active = 0
+    most_active = 0
+
+    async def compile(self, source, opt_level, parser_name, want_ast):
+        SlowServer.active += 1
+        SlowServer.most_active = max(SlowServer.most_active, SlowServer.active)
+        await asyncio.sleep(0.02)
+        SlowServer.active -= 1
+        return b'{"ok": true}'
+
+
+def test_connection_has_at_most_max_inflight_requests(tmp_path):
+    requests = [{'id': index, 'source': f'x = {index};'} for index in range(8)]
+
+    async def scenario(connect):
+        return await asyncio.gather(exchange(connect, requests), exchange(connect, requests))
+
+    (first, second), stats = run_server(tmp_path, scenario, SlowServer, max_inflight=2)
+    assert sorted(first) == sorted(second) == list(range(8))
+    # 每个连接最多 2 个，两个连接合起来最多 4 个
+    assert 2 < SlowServer.most_active <= 4
+    assert stats['connections'] == 2
+
+
+def test_bad_requests(tmp_path):
+    requests = [{'id': 1, 'source': 'x = 1;', 'opt_level': 7}, {'id': 2, 'op': 'ping'},
+                {'id': 3, 'source': 'if a then b = 1;'}, {'id': 4, 'op': 'nope'}]
+    replies, _ = run_server(tmp_path, lambda connect: exchange(connect, requests))
+    assert replies[1] == {'ok': False, 'error': 'invalid opt_level 7'}
+    assert replies[2] == {'ok': True}
+    assert not replies[3]['ok'] and replies[3]['error'].startswith('SyntaxError')
+    assert replies[4] == {'ok': False, 'error': "unknown op 'nope'"}
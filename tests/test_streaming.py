@@ -0,0 +1,8 @@
+import main
+
+
+def test_streaming_output_matches(programs, tmp_path):
+    source = b''.join(programs)
+    main.write_output(*main.compile_source(source), tmp_path / 'whole.txt')
+    main.write_output_streaming(main.iter_scan_tokens(source), tmp_path / 'stream.txt')
+    assert (tmp_path / 'stream.txt').read_text() == (tmp_path / 'whole.txt').read_text()
@@ -0,0 +1,34 @@
+import io
+import os
+
+import main
+import syntax_tree
+
+TESTSET_PATH = os.path.join(os.path.dirname(os.path.abspath(main.__file__)), 'lab1_testset.txt')
+
+
+def tree_text(tokens, builder=None):
+    # 逐条分析顶层语句，按 syntax_tree.py 的格式写出每条语句的语法树
+    parser = syntax_tree.Parser(tokens, builder)
+    out = io.StringIO()
+    while parser.current_token_index < parser.token_count:
+        parser.parse().write(out)
+    return out.getvalue()
+
+
+def test_arena_writes_the_same_tree(programs):
+    with open(TESTSET_PATH, 'rb') as file:
+        sources = [file.read()] + programs
+    for source in sources:
+        tokens = main.scan_tokens(source)
+        expected = tree_text(tokens)
+        assert expected.count('\n') > len(tokens)
+        assert tree_text(tokens, syntax_tree.ASTArena()) == expected
+
+
+def test_repr_matches_write(programs):
+    parser = syntax_tree.Parser(main.scan_tokens(programs[0]))
+    tree = parser.parse()
+    out = io.StringIO()
+    tree.write(out)
+    assert repr(tree) == out.getvalue()
@@ -0,0 +1,17 @@
+import pickle
+
+import main
+
+
+def test_code_renders_like_the_text_generator():
+    code = main.Parser(main.scan_tokens(b'x = a + 1 * 2.5; if x > 3 then y = 1 else y = 0x10;')).parse()
+    assert list(code.lines()) == ['t1 := 1 * 2.5', 't2 := a + t1', 'x := t2', 'if x > 3 goto L1', 'goto L2',
+                                  'L1:', 'y := 1', 'goto L3', 'L2:', 'y := 16', 'L3:']
+
+
+def test_code_round_trips_through_pickle(programs):
+    for source in programs:
+        code = main.Parser(main.scan_tokens(source)).parse()
+        copy = pickle.loads(pickle.dumps(code))
+        assert copy == code
+        assert list(copy.lines()) == list(code.lines())
@@ -0,0 +1,58 @@
+import pytest
+
+import main
+from interpreter import DEFAULT_MAX_STEPS, execute
+
+np = pytest.importorskip('numpy')
+import vector_backend  # noqa: E402
+from token_store import TokenStore  # noqa: E402
+
+
+def compile_program(source):
+    return main.compile_source(source)[2]
+
+
+def assert_lanes_match(code, bindings, lanes, max_steps=DEFAULT_MAX_STEPS):
+    result = vector_backend.BatchExecutable(code).run(bindings, max_steps, lanes)
+    for lane in range(lanes):
+        lane_bindings = {name: values[lane] for name, values in bindings.items()}
+        expected = execute(code, lane_bindings, max_steps)
+        assert {name: result.columns[name][lane] for name in expected.variables} == expected.variables
+        assert result.finished[lane] == expected.finished
+        assert result.steps[lane] == expected.steps
+    return result
+
+
+def test_int64_overflow_reruns_lane():
+    code = compile_program(b'x = y * y * y * y; z = x / 7 - y;')
+    result = assert_lanes_match(code, {'y': [100000, 3, -100000, -7]}, 4)
+    assert result.columns['x'][0] == 10 ** 20
+
+
+def test_int64_edges():
+    code = compile_program(b'q = a / b; p = a * b; s = a + b; d = a - b;')
+    values = [-2 ** 63, 2 ** 63 - 1, -1, 1, 7, -7, 3 ** 39]
+    pairs = [(a, b) for a in values for b in values]
+    assert_lanes_match(code, {'a': [a for a, _ in pairs], 'b': [b for _, b in pairs]}, len(pairs))
+
+
+def test_bindings_beyond_int64():
+    code = compile_program(b'x = y + 1;')
+    result = assert_lanes_match(code, {'y': [2 ** 70, 5, -2 ** 64]}, 3)
+    assert result.columns['x'][0] == 2 ** 70 + 1
+    result = vector_backend.BatchExecutable(code).run({'y': 2 ** 64}, lanes=2)
+    assert result.columns['x'].tolist() == [2 ** 64 + 1] * 2
+
+
+def test_constants_beyond_int64():
+    tokens = TokenStore.from_tokens([('ID', 'x'), ('ASSIGN', '='), ('ID', 'y'), ('OP', '*'),
+                                     ('NUMBER', 10 ** 20), ('END', ';')])
+    code = main.run_processing(main.run_parser(tokens))[0]
+    assert_lanes_match(code, {'y': [1, -3]}, 2)
+
+
+def test_lanes_stop_within_step_budget():
+    # 循环次数不同的通道在不同的块、块中的不同指令用完步数
+    code = compile_program(b'i = 0; s = 0; while i < n do if i > 2 then i = i + 2 else i = i + 1; s = i * 3 + s;')
+    for max_steps in range(40):
+        assert_lanes_match(code, {'n': [0, 1, 3, 5, 8, 13]}, 6, max_steps)
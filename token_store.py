@@ -0,0 +1,171 @@
+from array import array
+
+import scanner
+
+# 语法分析器使用的单词类型，下标即类型编码
+TYPE_NAMES = ['ID', 'NUMBER', 'OP', 'COMPARE', 'ASSIGN', 'END', 'WHILE', 'IF', 'THEN', 'ELSE', 'DO',
+              'LPAREN', 'RPAREN', 'REAL8', 'SEMIC', 'HEX']
+(ID, NUMBER, OP, COMPARE, ASSIGN, END, WHILE, IF, THEN, ELSE, DO,
+ LPAREN, RPAREN, REAL8, SEMIC, HEX) = range(len(TYPE_NAMES))
+TYPE_CODES = {name: code for code, name in enumerate(TYPE_NAMES)}
+
+# lab1 单词种别 -> (单词类型编码, 值)；值是函数时用它转换单词本身的值，否则为固定值
+LAB1_TOKENS = {
+    'IDN': (ID, str),
+    'INT10': (NUMBER, int),
+    'INT8': (NUMBER, int),
+    'INT16': (NUMBER, int),
+    'REAL10': (NUMBER, float),
+    'REAL16': (NUMBER, float),
+    'REAL8': (REAL8, str),
+    'PLUS': (OP, '+'),
+    'MINUS': (OP, '-'),
+    'MULTI': (OP, '*'),
+    'RDIV': (OP, '/'),
+    'GT': (COMPARE, '>'),
+    'LT': (COMPARE, '<'),
+    'EQ': (ASSIGN, '='),
+    'SEMIC': (END, ';'),
+    'WHILE': (WHILE, 'while'),
+    'IF': (IF, 'if'),
+    'THEN': (THEN, 'then'),
+    'ELSE': (ELSE, 'else'),
+    'DO': (DO, 'do'),
+    'LR_BRAC': (LPAREN, '('),
+    'RR_BRAC': (RPAREN, ')'),
+}
+# 按 lab1.c 的种别码直接查表
+SCAN_TOKENS = {code: LAB1_TOKENS[name] for code, name in scanner.TOKEN_NAMES.items()}
+# 文本模式下 lab1 用 %d / %lf 输出数值，内存扫描得到的 double 先按同样的格式取整，两条路径的单词才一致
+SCAN_FORMATS = {code: '%d' if name.startswith('INT') else '%f'
+                for code, name in scanner.TOKEN_NAMES.items() if name.startswith(('INT', 'REAL'))}
+
+
+def type_code(name):
+    # 表外的类型按原名追加编码
+    code = TYPE_CODES.get(name)
+    if code is None:
+        code = len(TYPE_NAMES)
+        TYPE_NAMES.append(name)
+        TYPE_CODES[name] = code
+    return code
+
+
+def convert_token(token_type, token_value):
+    entry = LAB1_TOKENS.get(token_type)
+    if entry is None:
+        return token_type, token_value
+    kind, value = entry
+    return TYPE_NAMES[kind], value(token_value) if callable(value) else value
+
+
+def scan_text(code, value):
+    # 内存扫描得到的数值按 lab1_output.txt 中的写法转成文本
+    return SCAN_FORMATS[code] % value
+
+
+# 按列存放的单词序列：类型编码、符号编号、源程序位置；标识符和常量只在符号表里存一份
+class TokenStore:
+    def __init__(self, symbol_values=None, symbol_ids=None):
+        self.kinds = array('B')
+        self.symbols = array('i')
+        self.positions = array('i')
+        # 可以与其他单词序列或代码共用一个符号表
+        self.symbol_values = symbol_values if symbol_values is not None else []
+        self.symbol_ids = symbol_ids if symbol_ids is not None else {}
+
+    def intern(self, value):
+        # 区分 7 和 7.0，它们输出时不同
+        key = (type(value), value)
+        symbol = self.symbol_ids.get(key)
+        if symbol is None:
+            symbol = len(self.symbol_values)
+            self.symbol_ids[key] = symbol
+            self.symbol_values.append(value)
+        return symbol
+
+    def append(self, kind, value, position=-1):
+        self.kinds.append(kind)
+        self.symbols.append(self.intern(value))
+        self.positions.append(position)
+
+    def add(self, token_type, token_value, position=-1):
+        # 按 lab1 的单词种别添加
+        entry = LAB1_TOKENS.get(token_type)
+        if entry is None:
+            self.append(type_code(token_type), token_value, position)
+            return
+        kind, value = entry
+        self.append(kind, value(token_value) if callable(value) else value, position)
+
+    @classmethod
+    def from_scan(cls, result):
+        store = cls()
+        store.extend_scan(result)
+        return store
+
+    def extend_scan(self, result, base=0, count=None):
+        # 追加扫描结果的前 count 个单词，位置加上 base（扫描的是源程序的一段时）
+        kinds = result.kinds
+        for i in range(len(kinds) if count is None else count):
+            code = kinds[i]
+            kind, value = SCAN_TOKENS[code]
+            if code == scanner.IDN:
+                value = result.text(i)
+            elif callable(value):
+                value = value(scan_text(code, result.values[i]))
+            self.append(kind, value, base + result.offsets[i])
+
+    @classmethod
+    def from_lines(cls, lines):
+        # lab1_output.txt 格式，没有源程序位置
+        store = cls()
+        for line in lines:
+            parts = line.strip().split()
+            if len(parts) == 3:
+                store.add(parts[1], parts[2])
+        return store
+
+    @classmethod
+    def from_tokens(cls, tokens):
+        # 已转换好的 (类型, 值) 序列
+        store = cls()
+        for token_type, token_value in tokens:
+            store.append(type_code(token_type), token_value)
+        return store
+
+    def kind(self, index):
+        return self.kinds[index]
+
+    def value(self, index):
+        return self.symbol_values[self.symbols[index]]
+
+    def digest_parts(self):
+        # 决定语法分析结果的内容，不含位置
+        return self.kinds.tobytes(), self.symbols.tobytes(), repr(self.symbol_values)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        return TYPE_NAMES[self.kinds[index]], self.symbol_values[self.symbols[index]]
+
+    def __iter__(self):
+        values = self.symbol_values
+        for kind, symbol in zip(self.kinds, self.symbols):
+            yield TYPE_NAMES[kind], values[symbol]
+
+    def __eq__(self, other):
+        if isinstance(other, TokenStore):
+            return self.digest_parts() == other.digest_parts()
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __getstate__(self):
+        return self.kinds, self.symbols, self.positions, self.symbol_values
+
+    def __setstate__(self, state):
+        self.kinds, self.symbols, self.positions, self.symbol_values = state
+        self.symbol_ids = {(type(value), value): symbol for symbol, value in enumerate(self.symbol_values)}
@@ -0,0 +1,386 @@
+import argparse
+import csv
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    # NumPy 只有批量执行需要，其他模块不依赖它
+    np = None
+
+import cfg
+import compile_cache
+import instrument
+import interpreter
+import main
+import optimize
+from interpreter import DEFAULT_MAX_STEPS, parse_number
+from tac import COPY, ADD, SUB, MUL, DIV, IF_LT, IF_GT, IF_LE, IF_GE, IF_NE, GOTO, NONE
+
+# 通道停止的原因：正常结束、步数用完、除数为 0；OVERFLOW 只在执行中间出现，
+# 整数超出 64 位的通道最后用解释器按 Python 的整数重新执行
+FINISHED, EXHAUSTED, FAILED, OVERFLOW = range(4)
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def fits_int64(value):
+    return not isinstance(value, int) or INT64_MIN <= value <= INT64_MAX
+
+
+def oversized_lanes(values, lanes):
+    # 初值是超出 64 位的整数的通道
+    if isinstance(values, (int, float)):
+        return np.full(lanes, not fits_int64(values))
+    if isinstance(values, np.ndarray) and values.dtype != object:
+        return np.zeros(lanes, bool)
+    return np.fromiter((not fits_int64(value) for value in values), bool, lanes)
+
+
+# 一列值：每条通道一个数。整数和浮点数按通道区分，与解释器中 int/float 的行为一致；
+# 整数通道的 floats 始终等于 ints 转成的浮点数，浮点通道的 ints 没有意义
+class Column:
+    __slots__ = ('ints', 'floats', 'is_float')
+
+    def __init__(self, ints, floats, is_float):
+        self.ints = ints
+        self.floats = floats
+        self.is_float = is_float
+
+    @classmethod
+    def zeros(cls, lanes):
+        return cls(np.zeros(lanes, np.int64), np.zeros(lanes, np.float64), np.zeros(lanes, bool))
+
+    @classmethod
+    def constant(cls, value, lanes):
+        # 只读的广播视图，不分配内存
+        if isinstance(value, float):
+            ints, floats, is_float = 0, value, True
+        else:
+            ints, floats, is_float = value, float(value), False
+        return cls(np.broadcast_to(np.int64(ints), lanes), np.broadcast_to(np.float64(floats), lanes),
+                   np.broadcast_to(is_float, lanes))
+
+    @classmethod
+    def from_values(cls, values, lanes):
+        # 标量广播到所有通道；NumPy 数组按 dtype 决定整数还是浮点数，Python 列表逐个判断。
+        # 超出 64 位的整数记为 0，这些通道由 oversized_lanes 找出来交给解释器
+        if isinstance(values, (int, float)):
+            constant = cls.constant(values if fits_int64(values) else 0, lanes)
+            return cls(constant.ints.copy(), constant.floats.copy(), constant.is_float.copy())
+        if isinstance(values, np.ndarray) and values.dtype == object:
+            values = values.tolist()
+        if isinstance(values, np.ndarray):
+            if values.dtype.kind == 'f':
+                return cls(np.zeros(lanes, np.int64), values.astype(np.float64), np.ones(lanes, bool))
+            ints = values.astype(np.int64)
+            return cls(ints, ints.astype(np.float64), np.zeros(lanes, bool))
+        is_float = np.fromiter((isinstance(value, float) for value in values), bool, lanes)
+        floats = np.array([float(value) if fits_int64(value) else 0.0 for value in values], np.float64)
+        ints = np.array([0 if isinstance(value, float) or not fits_int64(value) else value for value in values],
+                        np.int64)
+        return cls(ints, floats, is_float)
+
+    def take(self, lanes):
+        return Column(self.ints[lanes], self.floats[lanes], self.is_float[lanes])
+
+    def put(self, lanes, column):
+        self.ints[lanes] = column.ints
+        self.floats[lanes] = column.floats
+        self.is_float[lanes] = column.is_float
+
+    def values(self):
+        # 有浮点通道时整列转成浮点数
+        if self.is_float.any():
+            return self.floats.copy()
+        return self.ints.copy()
+
+
+def binary(op, left, right):
+    # 返回 (结果, 除数为 0 的通道, 整数结果超出 64 位的通道)；NumPy 的整数运算溢出时静默回绕，逐通道检查
+    is_float = left.is_float | right.is_float
+    count = len(is_float)
+    result = Column(np.zeros(count, np.int64), np.zeros(count, np.float64), is_float)
+    failed = np.zeros(count, bool)
+    overflow = np.zeros(count, bool)
+
+    if is_float.any():
+        x = left.floats[is_float]
+        y = right.floats[is_float]
+        if op == ADD:
+            value = x + y
+        elif op == SUB:
+            value = x - y
+        elif op == MUL:
+            value = x * y
+        else:
+            zero = y == 0
+            failed[is_float] = zero
+            value = x / np.where(zero, 1.0, y)
+        result.floats[is_float] = value
+
+    is_int = ~is_float
+    if is_int.any():
+        x = left.ints[is_int]
+        y = right.ints[is_int]
+        if op == ADD:
+            value = x + y
+            # 同号相加得到异号的结果
+            wrapped = ((x ^ value) & (y ^ value)) < 0
+        elif op == SUB:
+            value = x - y
+            wrapped = ((x ^ y) & (x ^ value)) < 0
+        elif op == MUL:
+            value = x * y
+            # 没有回绕时积除以 x 得到 y；x 为 0、-1 时单独判断
+            checked = (x != 0) & (x != -1)
+            wrapped = checked & (value // np.where(checked, x, 1) != y)
+            wrapped |= (x == -1) & (y == INT64_MIN)
+        else:
+            # 与 tac.divide 一样向零截断；floor 除法在不能整除且异号时加 1
+            zero = y == 0
+            failed[is_int] = zero
+            wrapped = (x == INT64_MIN) & (y == -1)
+            divisor = np.where(zero | wrapped, 1, y)
+            quotient = x // divisor
+            value = np.where((x % divisor != 0) & ((x < 0) != (divisor < 0)), quotient + 1, quotient)
+        overflow[is_int] = wrapped
+        result.ints[is_int] = value
+        result.floats[is_int] = value.astype(np.float64)
+    return result, failed, overflow
+
+
+def compare(op, left, right):
+    is_float = left.is_float | right.is_float
+    x = np.where(is_float, left.floats, 0.0)
+    y = np.where(is_float, right.floats, 0.0)
+    if op == IF_LT:
+        return np.where(is_float, x < y, left.ints < right.ints)
+    if op == IF_GT:
+        return np.where(is_float, x > y, left.ints > right.ints)
+    if op == IF_LE:
+        return np.where(is_float, x <= y, left.ints <= right.ints)
+    if op == IF_GE:
+        return np.where(is_float, x >= y, left.ints >= right.ints)
+    if op == IF_NE:
+        return np.where(is_float, x != y, left.ints != right.ints)
+    return np.where(is_float, x == y, left.ints == right.ints)
+
+
+class BatchResult:
+    def __init__(self, columns, status, steps, passes, seconds):
+        # columns: 变量名 -> 每条通道的最终值
+        self.columns = columns
+        self.finished = status == FINISHED
+        self.exhausted = status == EXHAUSTED
+        self.failed = status == FAILED
+        self.steps = steps
+        # 向量化执行的块数，每次处理停在同一个块的全部通道
+        self.passes = passes
+        self.seconds = seconds
+
+    def instructions_per_second(self):
+        return int(self.steps.sum()) / self.seconds if self.seconds > 0 else 0.0
+
+    def report(self):
+        lanes = len(self.steps)
+        return {
+            'lanes': lanes,
+            'finished': int(self.finished.sum()),
+            'exhausted': int(self.exhausted.sum()),
+            'failed': int(self.failed.sum()),
+            'passes': self.passes,
+            'steps': int(self.steps.sum()),
+            'seconds': self.seconds,
+            'lanes_per_second': lanes / self.seconds if self.seconds > 0 else 0.0,
+            'instructions_per_second': self.instructions_per_second(),
+        }
+
+
+# 同一个程序在许多组初值上执行：每个变量、临时变量是一列，每组初值是一条通道。
+# 每次取所有未结束通道中最小的块下标，对停在这个块的通道一起执行整个块，
+# 条件跳转按通道分别更新下一块，走不同分支或循环次数不同的通道各自推进到结束
+class BatchExecutable:
+    def __init__(self, code):
+        if np is None:
+            raise RuntimeError("batched execution requires NumPy")
+        self.code = code
+        self.symbol_values = code.symbol_values
+        self.blocks = cfg.build_blocks(code)
+        self.label_blocks = {label: index for index, block in enumerate(self.blocks) for label in block.labels}
+        self.variables = sorted({self.symbol_values[operand] for instruction in code
+                                 for operand in (instruction[1], instruction[2], instruction[3])
+                                 if operand >= 0 and isinstance(self.symbol_values[operand], str)})
+        # 程序里有超出 64 位的整数常数时所有通道都交给解释器
+        self.oversized_constants = any(not fits_int64(self.symbol_values[operand]) for instruction in code
+                                       for operand in (instruction[2], instruction[3]) if operand >= 0)
+
+    def run(self, bindings=None, max_steps=DEFAULT_MAX_STEPS, lanes=None):
+        # bindings: 变量名 -> 标量或每条通道一个值的序列；通道数取最长的序列
+        bindings = bindings or {}
+        if lanes is None:
+            lanes = max((len(values) for values in bindings.values() if not isinstance(values, (int, float))),
+                        default=1)
+        columns = {}
+        oversized = np.full(lanes, self.oversized_constants)
+        for name in self.variables:
+            values = bindings.get(name)
+            if values is None:
+                columns[name] = Column.zeros(lanes)
+            else:
+                columns[name] = Column.from_values(values, lanes)
+                oversized |= oversized_lanes(values, lanes)
+
+        symbol_values = self.symbol_values
+        blocks = self.blocks
+        end = len(blocks)
+        pc = np.where(oversized, end, 0)
+        steps = np.zeros(lanes, np.int64)
+        status = np.where(oversized, OVERFLOW, FINISHED)
+        passes = 0
+
+        def operand(value, selected):
+            if value < NONE:
+                column = columns.get(value)
+                if column is None:
+                    column = columns[value] = Column.zeros(lanes)
+                return column.take(selected)
+            value = symbol_values[value]
+            if isinstance(value, str):
+                return columns[value].take(selected)
+            return Column.constant(value, len(selected))
+
+        def destination(value):
+            if value < NONE:
+                column = columns.get(value)
+                if column is None:
+                    column = columns[value] = Column.zeros(lanes)
+                return column
+            return columns[symbol_values[value]]
+
+        start = time.perf_counter()
+        with instrument.phase('execute'):
+            while True:
+                running = pc < end
+                if not running.any():
+                    break
+                index = int(pc[running].min())
+                selected = np.nonzero(pc == index)[0]
+                block = blocks[index]
+                # 剩下的步数不够执行整个块的通道停下：正好用完的停在块开头，与解释器相同；
+                # 在块中间用完的与溢出的通道一样交给解释器重新执行
+                crossing = steps[selected] > max_steps - len(block.instructions)
+                if crossing.any():
+                    stopped = selected[crossing]
+                    status[stopped] = np.where(steps[stopped] >= max_steps, EXHAUSTED, OVERFLOW)
+                    pc[stopped] = end
+                    selected = selected[~crossing]
+                    if not len(selected):
+                        continue
+                passes += 1
+                next_pc = np.full(len(selected), index + 1)
+                failed = np.zeros(len(selected), bool)
+                overflow = np.zeros(len(selected), bool)
+                for op, dst, src1, src2, label in block.instructions:
+                    if op == COPY:
+                        destination(dst).put(selected, operand(src1, selected))
+                    elif op == GOTO:
+                        next_pc[:] = self.label_blocks[label]
+                    elif op in (ADD, SUB, MUL, DIV):
+                        value, zero, wrapped = binary(op, operand(src1, selected), operand(src2, selected))
+                        failed |= zero
+                        overflow |= wrapped
+                        destination(dst).put(selected, value)
+                    else:
+                        taken = compare(op, operand(src1, selected), operand(src2, selected))
+                        next_pc = np.where(taken, self.label_blocks[label], next_pc)
+                steps[selected] += len(block.instructions)
+                # 出错、溢出的通道停在出错的块
+                failed &= ~overflow
+                next_pc = np.where(failed | overflow, end, next_pc)
+                status[selected[overflow]] = OVERFLOW
+                status[selected[failed]] = FAILED
+                pc[selected] = next_pc
+        instrument.count('executed_instructions', int(steps.sum()))
+        results = {name: columns[name].values() for name in self.variables}
+        self.rerun(np.nonzero(status == OVERFLOW)[0], bindings, max_steps, results, status, steps)
+        seconds = time.perf_counter() - start
+        return BatchResult(results, status, steps, passes, seconds)
+
+    def rerun(self, lanes, bindings, max_steps, results, status, steps):
+        # 溢出的通道和步数在块中间用完的通道从初值开始用解释器重新执行，结果写回各列；
+        # 重新执行时除数为 0 的通道记为 FAILED，值保留向量执行停下时的值
+        if not len(lanes):
+            return
+        instrument.count('vector_fallbacks', len(lanes))
+        executable = interpreter.Executable(self.code)
+        for lane in lanes.tolist():
+            lane_bindings = {name: values if isinstance(values, (int, float)) else values[lane]
+                             for name, values in bindings.items()}
+            lane_bindings = {name: value.item() if isinstance(value, np.generic) else value
+                             for name, value in lane_bindings.items()}
+            try:
+                result = executable.run(lane_bindings, max_steps)
+            except ZeroDivisionError:
+                status[lane] = FAILED
+                continue
+            status[lane] = FINISHED if result.finished else EXHAUSTED
+            steps[lane] = result.steps
+            for name, value in result.variables.items():
+                column = results.get(name)
+                if column is None:
+                    continue
+                # 整数列放不下时改成浮点列或 Python 整数列
+                if isinstance(value, float) and column.dtype == np.int64:
+                    column = results[name] = column.astype(np.float64)
+                elif not fits_int64(value) and column.dtype != object:
+                    column = results[name] = column.astype(object)
+                column[lane] = value
+
+
+def read_table(path):
+    # CSV 表：第一行是变量名，之后每行是一组初值
+    with open(path, newline='') as file:
+        reader = csv.reader(file)
+        header = next(reader)
+        rows = [[parse_number(cell) for cell in row] for row in reader if row]
+    return {name: [row[column] for row in rows] for column, name in enumerate(header)}, len(rows)
+
+
+def write_table(result, path):
+    names = sorted(result.columns)
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(names + ['finished', 'steps'])
+        columns = [result.columns[name].tolist() for name in names]
+        for lane, row in enumerate(zip(*columns)):
+            writer.writerow(list(row) + [int(result.finished[lane]), int(result.steps[lane])])
+
+
+def main_vector():
+    arg_parser = argparse.ArgumentParser(description="Run one compiled program over a table of initial values.")
+    arg_parser.add_argument('source', nargs='?', default=main.SOURCE_FILE)
+    arg_parser.add_argument('--table', required=True, help="CSV file: a header of variable names, one row per run")
+    arg_parser.add_argument('-o', '--output', help="write final values per row to this CSV file")
+    arg_parser.add_argument('--max-steps', type=int, default=DEFAULT_MAX_STEPS, help="instruction budget per row")
+    arg_parser.add_argument('-O', dest='opt_level', type=int, choices=sorted(optimize.LEVELS), default=0,
+                            help="optimization level")
+    arg_parser.add_argument('--no-cache', action='store_true', help="disable the on-disk compile cache")
+    arg_parser.add_argument('--cache-dir', default=compile_cache.CACHE_DIR)
+    args = arg_parser.parse_args()
+
+    with open(args.source, 'rb') as file:
+        source = file.read()
+    cache = None if args.no_cache else compile_cache.CompileCache(args.cache_dir)
+    _, _, processed_code = main.compile_source(source, cache, opt_level=args.opt_level)
+    bindings, lanes = read_table(args.table)
+    result = BatchExecutable(processed_code).run(bindings, args.max_steps, lanes)
+    if args.output:
+        write_table(result, args.output)
+    report = result.report()
+    for name, value in report.items():
+        print(f"{name}: {value}")
+    return 0 if report['finished'] == lanes else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main_vector())